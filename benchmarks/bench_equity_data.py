@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+# NOTE(steve): compares the memory used and the time taken to create and
+# compare equity data objects with the old __dict__ and Decimal based
+# class, and the time taken to load a json database with each.
+# Run from the project root: python benchmarks/bench_equity_data.py
+import os
+import sys
+import inspect
+file_path = os.path.dirname(inspect.getfile(inspect.currentframe()))
+sys.path.insert(0, os.path.split(file_path)[0])
+
+import datetime
+import json
+import timeit
+import tracemalloc
+from decimal import Decimal
+
+from market_data.data import EquityData
+from market_data.json_data_adapter import TextDataModel
+
+NUM_OBJECTS = 100000
+NUM_DATES = 1000
+
+class DictEquityData:
+
+    def __init__(self, open=0, high=0, low=0, close=0,
+                adj_close=0, volume=0):
+        self.open = Decimal(open)
+        self.high = Decimal(high)
+        self.low = Decimal(low)
+        self.close = Decimal(close)
+        self.adj_close = Decimal(adj_close)
+        self.volume = int(volume)
+
+    def __eq__(self, other):
+        d1 = [self.open, self.high, self.low,
+              self.close, self.adj_close, self.volume]
+        d2 = [other.open, other.high, other.low,
+              other.close, other.adj_close, other.volume]
+        results = (v1 == v2 for v1, v2 in zip(d1, d2))
+        return all(results)
+
+def make_rows(n):
+    return [(f'{1800 + i % 100}.{i % 100:02d}', '1903.79', '1856.00',
+             '1889.98', '1889.98', 5718000 + i) for i in range(n)]
+
+def make_json_database(rows):
+    database = {'securities': []}
+    start = datetime.date(2015, 1, 1)
+    for i in range(0, len(rows), NUM_DATES):
+        ticker = f'T{i // NUM_DATES:04d}'
+        database['securities'].append(ticker)
+        database[ticker] = {}
+        for j, row in enumerate(rows[i:i + NUM_DATES]):
+            dt = start + datetime.timedelta(days=j)
+            database[ticker][dt.strftime('%d-%b-%Y')] = dict(zip(
+                    ('open', 'high', 'low', 'close', 'adj_close', 'volume'),
+                    row))
+    return json.dumps(database)
+
+# NOTE(steve): the json decoder used to try to make a data model out of
+# every object in the file and create the old equity data for each day
+def old_json_decoder(o):
+    try:
+        securities = o['securities']
+        return {sec: {dt: DictEquityData(**d) for dt, d in o[sec].items()}
+                for sec in securities}
+    except:
+        return o
+
+def measure_json_load(text, object_hook):
+    timer = timeit.Timer(lambda: json.loads(text, object_hook=object_hook))
+    return min(timer.repeat(repeat=5, number=1))
+
+def measure_memory(create, rows):
+    tracemalloc.start()
+    objects = [create(*row) for row in rows]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return size / len(rows)
+
+# NOTE(steve): prices read from a json database are parsed when first used
+def create_stored_and_use(*row):
+    data = EquityData.from_stored(*row)
+    data.to_fixed()
+    return data
+
+def measure_time(func, rows):
+    timer = timeit.Timer(lambda: [func(*row) for row in rows])
+    return min(timer.repeat(repeat=5, number=1)) / len(rows)
+
+def report(name, old, new, unit):
+    print(f'{name:<36}{old:>12.2f}{new:>12.2f}{old / new:>9.1f}x  {unit}')
+
+if __name__ == '__main__':
+    rows = make_rows(NUM_OBJECTS)
+
+    # NOTE(steve): the sqlite3 adapter used to create Decimals for each
+    # column and pass them to EquityData. Series are now read as fixed
+    # point integers.
+    old_objects = [DictEquityData(*row) for row in rows]
+    new_objects = [EquityData(*row) for row in rows]
+    decimal_rows = [(d.open, d.high, d.low, d.close, d.adj_close, d.volume)
+                    for d in old_objects]
+    fixed_rows = [d.to_fixed() for d in new_objects]
+
+    print(f'{"":<36}{"old":>12}{"new":>12}{"speedup":>10}')
+    report('memory per object',
+           measure_memory(DictEquityData, rows),
+           measure_memory(EquityData, rows), 'bytes')
+    report('create from strings (scraper, csv)',
+           measure_time(DictEquityData, rows) * 1e6,
+           measure_time(EquityData, rows) * 1e6, 'us')
+    report('create from stored strings (json)',
+           measure_time(DictEquityData, rows) * 1e6,
+           measure_time(EquityData.from_stored, rows) * 1e6, 'us')
+    report('create from stored strings then use',
+           measure_time(DictEquityData, rows) * 1e6,
+           measure_time(create_stored_and_use, rows) * 1e6, 'us')
+    text = make_json_database(rows)
+    report(f'load json database ({len(rows)} rows)',
+           measure_json_load(text, old_json_decoder) * 1e3,
+           measure_json_load(text, TextDataModel.json_decoder) * 1e3, 'ms')
+    report('create from database row (sqlite3)',
+           measure_time(DictEquityData, decimal_rows) * 1e6,
+           measure_time(EquityData.from_fixed, fixed_rows) * 1e6, 'us')
+    report('compare equal objects',
+           measure_time(DictEquityData.__eq__,
+                        list(zip(old_objects, old_objects))) * 1e6,
+           measure_time(EquityData.__eq__,
+                        list(zip(new_objects, new_objects))) * 1e6, 'us')
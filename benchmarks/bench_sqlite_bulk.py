@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+# NOTE(steve): measures how many rows a second a sqlite bulk update
+# writes. Replacing one row at a time with each price bound as a Decimal
+# (how bulk updates used to work) is compared with staging the rows and
+# merging them in one statement, for equity data made from strings
+# (scraped) and from fixed point prices (read from another database).
+# Run from the project root: python benchmarks/bench_sqlite_bulk.py
+import os
+import sys
+import inspect
+file_path = os.path.dirname(inspect.getfile(inspect.currentframe()))
+sys.path.insert(0, os.path.split(file_path)[0])
+
+import datetime
+import shutil
+import tempfile
+import time
+
+from market_data.data import EquityData
+from market_data.sqlite3_data_adapter import Sqlite3DataAdapter
+
+NUM_ROWS = 100000
+REPEATS = 3
+
+def make_data(n, fixed):
+    start = datetime.datetime(1900, 1, 1)
+    data = []
+    for i in range(n):
+        d = EquityData(f'{1800 + i % 100}.{i % 100:02d}', '1903.79',
+                       '1856.00', '1889.98', '1889.98', 5718000 + i)
+        if fixed:
+            d = EquityData.from_fixed(*d.to_fixed())
+        data.append((start + datetime.timedelta(days=i), d))
+    return data
+
+def decimal_bulk_update(database, security, equity_data):
+    ticker_id = database._get_security_id(security)
+    sql = """REPLACE INTO equity_prices(ticker_id, date, open,
+                high, low, close, adj_close, volume)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+    rows = ((ticker_id, date, data.open, data.high, data.low, data.close,
+             data.adj_close, data.volume) for date, data in equity_data)
+    with database._write_lock, database._conn:
+        database._conn.executemany(sql, rows)
+
+def bench(directory, name, update, fixed):
+    data = make_data(NUM_ROWS, fixed)
+    best = None
+    for i in range(REPEATS):
+        conn_string = os.path.join(directory,
+                                   f'bench_{name}_{fixed}_{i}.db')
+        Sqlite3DataAdapter.create_database(conn_string)
+        database = Sqlite3DataAdapter.connect(conn_string,
+                                              profile='performance')
+        database.insert_securities(['AMZN'])
+
+        start = time.perf_counter()
+        update(database, 'AMZN', data)
+        elapsed = time.perf_counter() - start
+        database.close()
+
+        best = elapsed if best is None else min(best, elapsed)
+
+    return NUM_ROWS / best
+
+if __name__ == '__main__':
+    directory = tempfile.mkdtemp()
+    try:
+        print(f'{NUM_ROWS} rows, best of {REPEATS}, rows/s')
+        print(f'{"equity data from":<20}{"decimal binds":>16}'
+              f'{"staged merge":>16}')
+        for fixed in (False, True):
+            decimal = bench(directory, 'decimal', decimal_bulk_update, fixed)
+            new = bench(directory, 'staged',
+                        Sqlite3DataAdapter.bulk_update_market_data, fixed)
+            source = 'fixed point' if fixed else 'strings'
+            print(f'{source:<20}{decimal:>16.0f}{new:>16.0f}')
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
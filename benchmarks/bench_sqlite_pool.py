@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+# NOTE(steve): measures sqlite read throughput from a number of threads
+# sharing one adapter. The shared adapter has a single connection which
+# has to be used one thread at a time whereas the pooled adapter gives
+# each thread its own connection. Run from the project root:
+# python benchmarks/bench_sqlite_pool.py
+import os
+import sys
+import inspect
+file_path = os.path.dirname(inspect.getfile(inspect.currentframe()))
+sys.path.insert(0, os.path.split(file_path)[0])
+
+import datetime
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from market_data.data import EquityData
+from market_data.sqlite3_data_adapter import Sqlite3DataAdapter
+
+NUM_TICKERS = 100
+NUM_DATES = 1000
+THREADS = (1, 2, 4, 8)
+DURATION = 2.0
+
+def make_database(conn_string, tickers):
+    Sqlite3DataAdapter.create_database(conn_string)
+    database = Sqlite3DataAdapter.connect(conn_string, profile='performance')
+    database.insert_securities(tickers)
+    start = datetime.datetime(2015, 1, 1)
+    data = [(start + datetime.timedelta(days=i),
+             EquityData('100.25', '101.50', '99.75', '100.10', '100.10', i))
+            for i in range(NUM_DATES)]
+    for ticker in tickers:
+        database.bulk_update_market_data(ticker, data)
+    database.close()
+
+# NOTE(steve): a range read makes sqlite do enough work per call for the
+# time spent outside of python (where the gil is released) to matter
+def read(database, tickers, lock):
+    start = datetime.datetime(2016, 1, 1)
+    end = datetime.datetime(2016, 6, 30)
+    ticker = random.choice(tickers)
+    if lock is None:
+        database.get_equity_data_range(ticker, start, end)
+    else:
+        with lock:
+            database.get_equity_data_range(ticker, start, end)
+
+def bench(conn_string, tickers, num_threads, pooled):
+    database = Sqlite3DataAdapter.connect(conn_string, profile='performance',
+                                          pooled=True)
+    lock = None
+    if not pooled:
+        # NOTE(steve): every thread reads through the one connection so
+        # the queries have to be made one at a time
+        database._reader = lambda: database._conn
+        lock = threading.Lock()
+
+    counts = [0] * num_threads
+    stop = threading.Event()
+
+    def worker(n):
+        while not stop.is_set():
+            read(database, tickers, lock)
+            counts[n] += 1
+
+    threads = [threading.Thread(target=worker, args=(n, ))
+               for n in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    database.close()
+
+    return sum(counts) / DURATION
+
+if __name__ == '__main__':
+    tickers = [f'T{i:04d}' for i in range(NUM_TICKERS)]
+    directory = tempfile.mkdtemp()
+    try:
+        conn_string = os.path.join(directory, 'bench_pool.db')
+        make_database(conn_string, tickers)
+
+        print(f'{os.cpu_count()} cpus, {NUM_TICKERS} tickers x {NUM_DATES} '
+              f'dates, 6 month range reads')
+        print(f'{"threads":>8}{"shared reads/s":>16}{"pooled reads/s":>16}')
+        for num_threads in THREADS:
+            shared = bench(conn_string, tickers, num_threads, False)
+            pooled = bench(conn_string, tickers, num_threads, True)
+            print(f'{num_threads:>8}{shared:>16.1f}{pooled:>16.1f}')
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
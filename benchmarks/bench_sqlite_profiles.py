@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+# NOTE(steve): measures sqlite read and write throughput for each
+# connection profile while reader processes query the database and the
+# main process writes one date at a time like a daily update does.
+# Run from the project root: python benchmarks/bench_sqlite_profiles.py
+import os
+import sys
+import inspect
+file_path = os.path.dirname(inspect.getfile(inspect.currentframe()))
+sys.path.insert(0, os.path.split(file_path)[0])
+
+import datetime
+import multiprocessing
+import random
+import shutil
+import tempfile
+import time
+
+from market_data.data import EquityData
+from market_data.sqlite3_data_adapter import Sqlite3DataAdapter, PROFILES
+
+NUM_TICKERS = 100
+NUM_DATES = 500
+NUM_READERS = 4
+DURATION = 3.0
+
+START_DATE = datetime.datetime(2015, 1, 1)
+
+def make_data(start, n):
+    return [(start + datetime.timedelta(days=i),
+             EquityData('100.25', '101.50', '99.75', '100.10', '100.10',
+                        1000 + i)) for i in range(n)]
+
+def make_database(conn_string, tickers):
+    Sqlite3DataAdapter.create_database(conn_string)
+    database = Sqlite3DataAdapter.connect(conn_string)
+    database.insert_securities(tickers)
+    data = make_data(START_DATE, NUM_DATES)
+    for ticker in tickers:
+        database.bulk_update_market_data(ticker, data)
+    database.close()
+
+# NOTE(steve): a busy timeout stops readers of the default profile
+# failing while a write commits
+def connect(conn_string, profile):
+    return Sqlite3DataAdapter.connect(
+            conn_string, profile=dict(PROFILES[profile], busy_timeout=10000))
+
+def reader(conn_string, profile, tickers, stop, counter):
+    database = connect(conn_string, profile)
+    reads = 0
+    while not stop.is_set():
+        database.get_last_n(random.choice(tickers), 20)
+        reads += 1
+    database.close()
+
+    with counter.get_lock():
+        counter.value += reads
+
+def bench_profile(directory, profile, tickers):
+    conn_string = os.path.join(directory, f'bench_{profile}.db')
+    make_database(conn_string, tickers)
+
+    stop = multiprocessing.Event()
+    counter = multiprocessing.Value('q', 0)
+    readers = [multiprocessing.Process(target=reader,
+                                       args=(conn_string, profile, tickers,
+                                             stop, counter))
+               for _ in range(NUM_READERS)]
+    for process in readers:
+        process.start()
+
+    database = connect(conn_string, profile)
+    _, data = make_data(START_DATE, 1)[0]
+    writes = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < DURATION:
+        days = NUM_DATES + writes // len(tickers)
+        dt = START_DATE + datetime.timedelta(days=days)
+        database.update_market_data(tickers[writes % len(tickers)],
+                                    (dt, data))
+        writes += 1
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for process in readers:
+        process.join()
+    database.close()
+
+    return writes / elapsed, counter.value / elapsed
+
+if __name__ == '__main__':
+    tickers = [f'T{i:04d}' for i in range(NUM_TICKERS)]
+    directory = tempfile.mkdtemp()
+    try:
+        print(f'{NUM_READERS} reader processes, {NUM_TICKERS} tickers x '
+              f'{NUM_DATES} dates, {DURATION}s per profile')
+        print(f'{"profile":<14}{"writes/s":>12}{"reads/s":>12}')
+        for profile in PROFILES:
+            writes, reads = bench_profile(directory, profile, tickers)
+            print(f'{profile:<14}{writes:>12.1f}{reads:>12.1f}')
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
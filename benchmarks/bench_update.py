@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+# NOTE(steve): measures the throughput of MarketData.update_all without
+# going to the network by replaying a recorded history page for every
+# ticker. Run from the project root: python benchmarks/bench_update.py
+import os
+import sys
+import inspect
+file_path = os.path.dirname(inspect.getfile(inspect.currentframe()))
+sys.path.insert(0, os.path.split(file_path)[0])
+
+import shutil
+import tempfile
+import time
+
+from freezegun import freeze_time
+
+from market_data.market_data import MarketData
+from market_data.scraper import Scraper
+from market_data.transport import PageStore, ReplayTransport
+import market_data.data_adapter as data_adapter
+
+NUM_TICKERS = 500
+TEST_PAGE = 'market_data/tests/amzn_scrape_test_data.html'
+
+def make_store(directory, tickers):
+    store = PageStore(directory)
+    with open(TEST_PAGE, 'r') as f:
+        page = f.read()
+
+    scraper = Scraper('yahoo')
+    for ticker in tickers:
+        store.put(scraper._get_url(ticker), page)
+
+    return store
+
+def bench_update_all(source, store, tickers, directory):
+    da = data_adapter.get_adapter(source)
+    conn_string = os.path.join(directory, f'bench_{source.name.lower()}')
+    da.create_database(conn_string)
+
+    app = MarketData()
+    app.run(MarketData.Database(conn_string, source),
+            transport=ReplayTransport(store))
+    for ticker in tickers:
+        app.add_security(ticker)
+
+    start = time.perf_counter()
+    with freeze_time('2019-08-30'):
+        results = app.update_all()
+    elapsed = time.perf_counter() - start
+    app.close()
+
+    errors = sum(len(r.errors) for r in results.values())
+    return elapsed, errors
+
+if __name__ == '__main__':
+    tickers = [f'T{i:04d}' for i in range(NUM_TICKERS)]
+    directory = tempfile.mkdtemp()
+    try:
+        store = make_store(os.path.join(directory, 'pages'), tickers)
+        print(f'{"adapter":<12}{"tickers":>10}{"seconds":>10}'
+              f'{"tickers/s":>12}{"errors":>8}')
+        for source in data_adapter.DataAdapterSource:
+            elapsed, errors = bench_update_all(source, store, tickers,
+                                               directory)
+            print(f'{source.name:<12}{len(tickers):>10}{elapsed:>10.2f}'
+                  f'{len(tickers) / elapsed:>12.1f}{errors:>8}')
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
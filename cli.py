@@ -2,11 +2,9 @@
 
 import os
 import sys
-import datetime
 from decimal import Decimal
 from enum import IntEnum, unique
 from market_data.market_data import MarketData
-from market_data.data import InvalidTickerError, InvalidDateError, NoDataError
 import market_data.data_adapter as data_adapter
 
 DATA_ADAPTER_SOURCE = data_adapter.DataAdapterSource.SQLITE3
@@ -136,31 +134,8 @@ class MainMenu:
 
     @staticmethod
     def update_market_data():
-        today = datetime.datetime.today()
-        tickers = app.get_securities_list()
-        for ticker in tickers:
-            try:
-                dt, _ = app.get_latest_equity_data(ticker)
-                dt += datetime.timedelta(days=1)
-            except InvalidTickerError:
-                continue
-            except NoDataError:
-                dt = today
-
-            date_list = []
-            while dt <= today:
-                if dt.weekday() < 5: # saturday = 5
-                    date_list.append(dt)
-                dt += datetime.timedelta(days=1)
-
-            # TODO(steve): expose errors in debug mode!
-            try:
-                if len(date_list) > 0:
-                    errors = app.bulk_update_market_data(ticker, date_list)
-            except InvalidTickerError:
-                pass
-            except InvalidDateError:
-                pass
+        # TODO(steve): expose errors in debug mode!
+        app.update_all()
 
         print(Messages.market_data_updated())
 
@@ -217,8 +192,6 @@ class Messages:
     def no_security_data(ticker):
         return f'\nNo data avaiable for {ticker}'
 
-    # TODO(steve): equity_data_series should be a collection type class
-    # which stores dates and equity data for a single security
     @staticmethod
     def view_security_data(ticker, equity_data_series):
         TWO_PLACES = Decimal('1.00')
@@ -0,0 +1,255 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from market_data.market_data import MarketData, NotInitialisedError
+from market_data.scraper import Scraper
+from market_data.data import InvalidTickerError
+import market_data.data_adapter as data_adapter
+
+class AsyncMarketData:
+    """
+    Asyncio facade over MarketData for use from an event loop.
+
+    Database reads run on a bounded pool of threads and writes on a single
+    writer thread so the event loop is never blocked and the number of
+    threads doesn't grow with the number of requests. Reads of a sqlite3
+    database that isn't pooled also run on the writer thread. Web pages
+    are fetched with an async transport and parsed on the read pool.
+    """
+
+    _init = False
+
+    # NOTE(steve): the executors are created in run as they can't be
+    # reused after close
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+        self._app = None
+        self._scraper = None
+        self._read_executor = None
+        self._write_executor = None
+        self._query_executor = None
+
+    async def run(self, database, transport=None, async_transport=None,
+                  cache_size=None, connect_options=None):
+        """
+        Initialises the facade with scraper and data adapter.
+
+        Args:
+            database: namedtuple('Database', ['conn_string', 'source']).
+            transport: Object with a get(url) method used to fetch web
+                pages from the read pool e.g. a ReplayTransport. Only used
+                when async_transport isn't given.
+            async_transport: Object with an async get(url) method used to
+                fetch web pages. Defaults to fetching over http without
+                blocking the event loop.
+            cache_size: Number of lookups and series to keep in a read
+                through LRU cache in front of the database. Defaults to no
+                cache.
+            connect_options: Dictionary of keyword arguments for the data
+                adapter's connect e.g. {'pooled': True} for a sqlite3
+                database to be read from the read pool.
+        """
+        connect_options = dict(connect_options or {})
+
+        self._read_executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix='market_data_read')
+        self._write_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='market_data_write')
+
+        # NOTE(steve): a sqlite3 connection can only be used by the thread
+        # that opened it unless it is pooled so without pooling database
+        # reads are made on the writer thread. Pages are still parsed on
+        # the read pool.
+        if (database.source == data_adapter.DataAdapterSource.SQLITE3 and
+                not connect_options.get('pooled', False)):
+            self._query_executor = self._write_executor
+        else:
+            self._query_executor = self._read_executor
+
+        self._app = MarketData()
+        await self._write(self._app.run, database, transport=transport,
+                          cache_size=cache_size,
+                          connect_options=connect_options)
+        self._scraper = Scraper('yahoo', transport=transport,
+                                async_transport=async_transport)
+        self._init = True
+
+    # NOTE(steve): new calls are refused first and the reads already
+    # accepted are left to finish before the database is closed on the
+    # writer thread after any queued writes. The read pool is drained on
+    # a worker thread so the event loop isn't blocked while it waits.
+    async def close(self):
+        """Ensures dependent objects are properly cleaned up."""
+        self._check_initialised()
+        self._init = False
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self._read_executor.shutdown)
+            await self._write(self._app.close)
+        finally:
+            self._read_executor.shutdown(wait=False)
+            self._write_executor.shutdown(wait=False)
+            if self._scraper.async_transport is not None:
+                close = getattr(self._scraper.async_transport, 'close', None)
+                if close is not None:
+                    await close()
+
+    def _check_initialised(self):
+        """Checks if class is initialised."""
+        if not self._init:
+            raise NotInitialisedError('Call run method first!')
+
+    async def _read(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+                self._query_executor, functools.partial(func, *args, **kwargs))
+
+    async def _write(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+                self._write_executor, functools.partial(func, *args, **kwargs))
+
+    async def add_security(self, ticker):
+        """See MarketData.add_security."""
+        self._check_initialised()
+        await self._write(self._app.add_security, ticker)
+
+    async def get_securities_list(self):
+        """See MarketData.get_securities_list."""
+        self._check_initialised()
+        return await self._read(self._app.get_securities_list)
+
+    async def get_equity_data(self, ticker, dt):
+        """See MarketData.get_equity_data."""
+        self._check_initialised()
+        return await self._read(self._app.get_equity_data, ticker, dt)
+
+    async def get_equity_data_many(self, pairs):
+        """See MarketData.get_equity_data_many."""
+        self._check_initialised()
+        return await self._read(self._app.get_equity_data_many, list(pairs))
+
+    async def get_cross_section(self, tickers, dt):
+        """See MarketData.get_cross_section."""
+        self._check_initialised()
+        return await self._read(self._app.get_cross_section, list(tickers),
+                                dt)
+
+    async def get_equity_data_series(self, ticker):
+        """See MarketData.get_equity_data_series."""
+        self._check_initialised()
+        return await self._read(self._app.get_equity_data_series, ticker)
+
+    async def get_equity_data_range(self, ticker, start, end):
+        """See MarketData.get_equity_data_range."""
+        self._check_initialised()
+        return await self._read(self._app.get_equity_data_range, ticker,
+                                start, end)
+
+    async def get_last_n(self, ticker, n):
+        """See MarketData.get_last_n."""
+        self._check_initialised()
+        return await self._read(self._app.get_last_n, ticker, n)
+
+    async def get_latest_equity_data(self, ticker):
+        """See MarketData.get_latest_equity_data."""
+        self._check_initialised()
+        return await self._read(self._app.get_latest_equity_data, ticker)
+
+    async def plan_updates(self, tickers=None):
+        """See MarketData.plan_updates."""
+        self._check_initialised()
+        return await self._read(self._app.plan_updates, tickers)
+
+    async def _check_ticker(self, ticker):
+        if ticker not in await self.get_securities_list():
+            raise InvalidTickerError(ticker)
+
+    async def update_market_data(self, ticker, dt):
+        """
+        Updates market data for the selected security and date.
+
+        Args:
+            ticker: Yahoo ticker.
+            dt: date of equity data.
+
+        Raise:
+            InvalidTickerError: Security not in market data.
+        """
+        self._check_initialised()
+        await self._check_ticker(ticker)
+        data = await self._scraper.scrape_equity_data_async(
+                ticker, dt, self._read_executor)
+        await self._write(self._app._database.update_market_data, ticker,
+                          (dt, data))
+
+    async def bulk_update_market_data(self, ticker, date_list):
+        """
+        Updates market data for a selected security over a
+        specified number of dates in list.
+
+        Args:
+            ticker: Yahoo ticker.
+            date_list: List of dates to update market data on.
+
+        Returns:
+            A list of errors or an empty list if no errors.
+
+        Raise:
+            InvalidTickerError: Security not in market data.
+        """
+        self._check_initialised()
+        await self._check_ticker(ticker)
+        data, errors = await self._scraper.scrape_eq_multiple_dates_async(
+                ticker, date_list, self._read_executor)
+        await self._write(self._app._database.bulk_update_market_data,
+                          ticker, data)
+        return errors
+
+    async def update_all(self, tickers=None, max_concurrency=16):
+        """
+        Updates market data for the selected securities from the day after
+        their latest equity data up to today.
+
+        Args:
+            tickers: List of Yahoo tickers. Defaults to all securities.
+            max_concurrency: Number of securities fetched at once. The
+                scraper's throttle still limits the rate of requests.
+
+        Returns:
+            Dictionary of ticker to UpdateResult(ticker, dates, errors)
+            where dates are the dates updated and errors is a list of
+            errors or an empty list if no errors.
+        """
+        self._check_initialised()
+        if tickers is None:
+            tickers = await self.get_securities_list()
+
+        plan, errors = await self.plan_updates(tickers)
+        results = {ticker: MarketData.UpdateResult(ticker, [], [])
+                   for ticker in tickers}
+        for e in errors:
+            ticker = e.args[0]
+            results[ticker] = MarketData.UpdateResult(ticker, [], [e])
+
+        limit = asyncio.Semaphore(max_concurrency)
+        async def update(ticker, date_list):
+            try:
+                async with limit:
+                    data, errors = (
+                        await self._scraper.scrape_eq_multiple_dates_async(
+                            ticker, date_list, self._read_executor))
+                await self._write(self._app._database.bulk_update_market_data,
+                                  ticker, data)
+                dates = [d[0] for d in data]
+                results[ticker] = MarketData.UpdateResult(ticker, dates,
+                                                          errors)
+            except Exception as e:
+                results[ticker] = MarketData.UpdateResult(ticker, [], [e])
+
+        await asyncio.gather(*(update(ticker, date_list)
+                               for ticker, date_list in plan))
+
+        return results
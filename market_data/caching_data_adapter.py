@@ -0,0 +1,218 @@
+import datetime
+import threading
+from collections import OrderedDict
+
+import market_data.data_adapter as data_adapter
+
+# NOTE(steve): adapters accept dates or datetimes so keys use the date to
+# make them match however they were asked for
+def _to_date(dt):
+    return datetime.date(dt.year, dt.month, dt.day)
+
+class CachingDataAdapter(data_adapter.DataAdapterConnection):
+    """
+    Wraps a connected data adapter with a bounded LRU cache of equity
+    data, series and the securities list. Updates and inserts made
+    through the cache invalidate only the entries they change. Writes
+    made through another connection aren't seen until the entries are
+    evicted or the cache is cleared.
+    """
+
+    cache_size = 1024
+
+    def __init__(self, adapter, cache_size=None):
+        self.adapter = adapter
+        if cache_size is not None:
+            self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._cache = OrderedDict()
+        self._keys = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.clear_cache()
+        self.adapter.close()
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+            self._keys.clear()
+            for security in self._generations:
+                self._generations[security] += 1
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'size': len(self._cache)}
+
+    # NOTE(steve): keys are (kind, security, args...) and each security
+    # keeps the set of its keys so updates only drop the entries for that
+    # security. Securities list and latest dates use a security of None.
+    def _lookup(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return True, self._cache[key], None
+
+            self.misses += 1
+            return False, None, self._generations.get(key[1], 0)
+
+    def _store(self, key, value, generation):
+        with self._lock:
+            # NOTE(steve): a write to the security while the value was
+            # being read means it may be stale so it isn't kept
+            if (self.cache_size <= 0 or
+                    self._generations.get(key[1], 0) != generation):
+                return
+
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            self._keys.setdefault(key[1], set()).add(key)
+            while len(self._cache) > self.cache_size:
+                old_key, _ = self._cache.popitem(last=False)
+                self._discard_key(old_key)
+                self.evictions += 1
+
+    def _discard_key(self, key):
+        keys = self._keys.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys[key[1]]
+
+    def _invalidate(self, security, should_drop):
+        """Drops the cached keys of a security where should_drop(key)."""
+        self._generations[security] = self._generations.get(security, 0) + 1
+        for key in list(self._keys.get(security, ())):
+            if should_drop(key):
+                del self._cache[key]
+                self._discard_key(key)
+
+    def _cached(self, key, read):
+        found, value, generation = self._lookup(key)
+        if found:
+            return value
+
+        value = read()
+        self._store(key, value, generation)
+        return value
+
+    @staticmethod
+    def _freeze(series):
+        # NOTE(steve): series share their arrays with the cache so callers
+        # must not be able to change them
+        for column in series._columns():
+            column.flags.writeable = False
+        return series
+
+    def get_securities_list(self):
+        securities = self._cached(('securities', None),
+                                  self.adapter.get_securities_list)
+        return list(securities)
+
+    def insert_securities(self, securities_to_add):
+        try:
+            self.adapter.insert_securities(securities_to_add)
+        finally:
+            with self._lock:
+                self._invalidate(None, lambda key: True)
+
+    def update_market_data(self, security, equity_data):
+        try:
+            self.adapter.update_market_data(security, equity_data)
+        finally:
+            self._invalidate_dates(security, [_to_date(equity_data[0])])
+
+    def bulk_update_market_data(self, security, equity_data):
+        try:
+            self.adapter.bulk_update_market_data(security, equity_data)
+        finally:
+            self._invalidate_dates(security,
+                                   [_to_date(dt) for dt, _ in equity_data])
+
+    def _invalidate_dates(self, security, dates):
+        if not dates:
+            return
+
+        dates = set(dates)
+
+        def should_drop(key):
+            kind = key[0]
+            if kind == 'data':
+                return key[2] in dates
+            if kind == 'range':
+                start, end = key[2], key[3]
+                return any(start <= dt <= end for dt in dates)
+            return True
+
+        with self._lock:
+            self._invalidate(security, should_drop)
+            self._invalidate(None, lambda key: key[0] == 'latest_dates')
+
+    # NOTE(steve): equity data is shared with the cache so it is frozen
+    # before it is stored and returned
+    def get_equity_data(self, security, dt):
+        def read():
+            return self.adapter.get_equity_data(security, dt).freeze()
+
+        return self._cached(('data', security, _to_date(dt)), read)
+
+    # NOTE(steve): cached pairs are served from the cache and the rest are
+    # read from the adapter in a single call
+    def get_equity_data_many(self, pairs):
+        found = {}
+        missing = []
+        with self._lock:
+            for security, dt in pairs:
+                key = ('data', security, _to_date(dt))
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    found[(security, dt)] = self._cache[key]
+                else:
+                    self.misses += 1
+                    missing.append((security, dt))
+            generations = {security: self._generations.get(security, 0)
+                           for security, _ in missing}
+
+        errors = []
+        if missing:
+            data, errors = self.adapter.get_equity_data_many(missing)
+            data = {pair: equity_data.freeze()
+                    for pair, equity_data in data.items()}
+            for (security, dt), equity_data in data.items():
+                self._store(('data', security, _to_date(dt)), equity_data,
+                            generations[security])
+            found.update(data)
+
+        return found, errors
+
+    def get_equity_data_series(self, security):
+        return self._cached(('series', security), lambda: self._freeze(
+                self.adapter.get_equity_data_series(security)))
+
+    # NOTE(steve): chunks are read straight from the adapter as caching
+    # them would defeat the point of iterating
+    def iter_equity_data_series(self, security, chunk_size):
+        return self.adapter.iter_equity_data_series(security, chunk_size)
+
+    def get_equity_data_range(self, security, start, end):
+        def read():
+            return self._freeze(self.adapter.get_equity_data_range(
+                    security, start, end))
+
+        key = ('range', security, _to_date(start), _to_date(end))
+        return self._cached(key, read)
+
+    def get_last_n(self, security, n):
+        return self._cached(('last_n', security, n), lambda: self._freeze(
+                self.adapter.get_last_n(security, n)))
+
+    def get_latest_dates(self):
+        latest_dates = self._cached(('latest_dates', None),
+                                    self.adapter.get_latest_dates)
+        return dict(latest_dates)
@@ -0,0 +1,384 @@
+import os
+import datetime
+import json
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+import market_data.data_adapter as data_adapter
+from market_data.data import FrozenEquityData, EquitySeries
+from market_data.data import InvalidTickerError, InvalidDateError
+
+# NOTE(steve): each security's prices are kept in their own file as seven
+# int64 columns (date, open, high, low, close, adj_close, volume) after a
+# small header. Dates are days since 1970-01-01 and prices are fixed point
+# (price * PRICE_SCALE) like EquitySeries. The columns are sorted oldest
+# to newest and have spare capacity so new dates are appended in place.
+#
+#   header: magic, version, count, capacity, 4 reserved
+#   column: capacity int64 values, count of them used
+_MAGIC = 0x4c4f43444d # 'MDCOL'
+_VERSION = 1
+_HEADER_SIZE = 8
+_COUNT = 2
+_CAPACITY = 3
+_NUM_COLUMNS = 7
+_INITIAL_CAPACITY = 256
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+def _to_day(dt):
+    return dt.toordinal() - _EPOCH_ORDINAL
+
+def _from_day(day):
+    return datetime.datetime.fromordinal(int(day) + _EPOCH_ORDINAL)
+
+class _SecurityFile:
+    """Memory mapped columns of a single security."""
+
+    def __init__(self, path):
+        self.path = path
+        self._signature = None
+        self._map = None
+
+    @staticmethod
+    def create(path, capacity, rows):
+        """Writes a new file with rows (count x 7 array) atomically."""
+        data = np.zeros(_HEADER_SIZE + _NUM_COLUMNS * capacity, np.int64)
+        data[0] = _MAGIC
+        data[1] = _VERSION
+        data[_COUNT] = len(rows)
+        data[_CAPACITY] = capacity
+        for i in range(_NUM_COLUMNS):
+            start = _HEADER_SIZE + i * capacity
+            data[start:start + len(rows)] = rows[:, i]
+
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                data.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    # NOTE(steve): the file is replaced when it grows (by this or another
+    # connection) so the mapping is checked against the file each time.
+    # Changes made in place by another connection are seen through the
+    # shared mapping so the modified time isn't part of the signature.
+    def get_map(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._signature = None
+            self._map = None
+            return None
+
+        signature = (st.st_ino, st.st_size)
+        if signature != self._signature:
+            self._map = np.memmap(self.path, dtype=np.int64, mode='r+')
+            if self._map[0] != _MAGIC or self._map[1] != _VERSION:
+                raise ValueError(f'Not a columnar security file: {self.path}')
+            self._signature = signature
+
+        return self._map
+
+    @staticmethod
+    def columns(data, lo=0, hi=None):
+        """Returns views of the columns between rows lo and hi."""
+        capacity = int(data[_CAPACITY])
+        if hi is None:
+            hi = int(data[_COUNT])
+
+        columns = []
+        for i in range(_NUM_COLUMNS):
+            start = _HEADER_SIZE + i * capacity
+            columns.append(data[start + lo:start + hi])
+
+        return columns
+
+class ColumnarDataAdapter(data_adapter.DataAdapter):
+    """
+    Stores each security as memory mapped fixed width columns. Reading a
+    series returns views of the mapped columns without copying and new
+    dates are appended in place. The database file is a small json index
+    of the securities and the columns are kept in a directory next to it.
+    """
+
+    test_database = 'test_columnar.db'
+
+    @classmethod
+    def create_test_database(cls):
+        if os.path.isfile(cls.test_database):
+            raise data_adapter.DatabaseExistsError(cls.test_database)
+
+        cls.create_database(cls.test_database)
+
+    @classmethod
+    def delete_test_database(cls):
+        if not os.path.isfile(cls.test_database):
+            raise data_adapter.DatabaseNotFoundError(cls.test_database)
+
+        os.remove(cls.test_database)
+        shutil.rmtree(cls._data_dir(cls.test_database), ignore_errors=True)
+
+    @classmethod
+    def create_database(cls, database):
+        if os.path.isfile(database):
+            raise data_adapter.DatabaseExistsError(database)
+
+        shutil.rmtree(cls._data_dir(database), ignore_errors=True)
+        cls._save_index(database, [])
+
+    @classmethod
+    def connect(cls, conn_string):
+        if not os.path.isfile(conn_string):
+            raise data_adapter.DatabaseNotFoundError(conn_string)
+
+        return cls(conn_string)
+
+    @staticmethod
+    def _data_dir(conn_string):
+        return conn_string + '.d'
+
+    @staticmethod
+    def _save_index(conn_string, securities):
+        index = {'version': _VERSION, 'securities': securities}
+        directory = os.path.dirname(os.path.abspath(conn_string))
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(index, f)
+            os.replace(temp_path, conn_string)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def __init__(self, conn_string):
+        self.conn_string = conn_string
+        self._securities = []
+        self._positions = {}
+        self._files = {}
+        self._index_signature = None
+        self._lock = threading.RLock()
+
+    def close(self):
+        with self._lock:
+            for security_file in self._files.values():
+                data = security_file.get_map()
+                if data is not None:
+                    data.flush()
+            self._files = {}
+
+    # NOTE(steve): securities are numbered in the order they are added
+    # and the number is used as the file name so any ticker can be used
+    def _load_index(self):
+        st = os.stat(self.conn_string)
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if signature != self._index_signature:
+            with open(self.conn_string, 'r') as f:
+                index = json.load(f)
+            self._securities = index['securities']
+            self._positions = {s: i for i, s in enumerate(self._securities)}
+            self._index_signature = signature
+
+        return self._positions
+
+    def _get_file(self, security):
+        positions = self._load_index()
+        if security not in positions:
+            raise InvalidTickerError(security)
+
+        security_file = self._files.get(security)
+        if security_file is None:
+            path = os.path.join(self._data_dir(self.conn_string),
+                                f'{positions[security]}.col')
+            security_file = _SecurityFile(path)
+            self._files[security] = security_file
+
+        return security_file
+
+    def get_securities_list(self):
+        with self._lock:
+            self._load_index()
+            return list(self._securities)
+
+    def insert_securities(self, securities_to_add):
+        with self._lock:
+            positions = self._load_index()
+            securities = list(self._securities)
+            for security in securities_to_add:
+                if security not in positions and security not in securities:
+                    securities.append(security)
+
+            if len(securities) > len(self._securities):
+                ColumnarDataAdapter._save_index(self.conn_string, securities)
+
+    def update_market_data(self, security, equity_data):
+        self.bulk_update_market_data(security, [equity_data])
+
+    def bulk_update_market_data(self, security, equity_data):
+        with self._lock:
+            security_file = self._get_file(security)
+            if len(equity_data) == 0:
+                return
+
+            # NOTE(steve): later rows for the same date replace earlier ones
+            rows = {_to_day(dt): data.to_fixed() for dt, data in equity_data}
+            new_rows = np.array([(day, ) + rows[day] for day in sorted(rows)],
+                                dtype=np.int64)
+
+            data = security_file.get_map()
+            if data is None:
+                os.makedirs(os.path.dirname(security_file.path), exist_ok=True)
+                capacity = max(_INITIAL_CAPACITY, len(new_rows))
+                _SecurityFile.create(security_file.path, capacity, new_rows)
+                return
+
+            count = int(data[_COUNT])
+            capacity = int(data[_CAPACITY])
+            dates = _SecurityFile.columns(data)[0]
+
+            # NOTE(steve): the common case is new dates after the last one
+            # which are written in place and then made visible by updating
+            # the count
+            if count == 0 or new_rows[0, 0] > dates[-1]:
+                if count + len(new_rows) <= capacity:
+                    columns = _SecurityFile.columns(data, count,
+                                                    count + len(new_rows))
+                    for i, column in enumerate(columns):
+                        column[:] = new_rows[:, i]
+                    data[_COUNT] = count + len(new_rows)
+                    return
+
+                old_rows = np.column_stack(_SecurityFile.columns(data))
+                all_rows = np.concatenate([old_rows, new_rows])
+            else:
+                old_rows = np.column_stack(_SecurityFile.columns(data))
+                all_rows = np.concatenate([old_rows, new_rows])
+                # NOTE(steve): keep the last row for each date which is the
+                # new row if the date already existed
+                reverse_rows = all_rows[::-1]
+                _, keep = np.unique(reverse_rows[:, 0], return_index=True)
+                all_rows = reverse_rows[keep]
+
+            # NOTE(steve): anything other than an append rewrites existing
+            # rows so a new file is written and swapped in. Series already
+            # returned keep the old mapping and never see a partial update.
+            if len(all_rows) > capacity:
+                capacity = max(2 * capacity, len(all_rows))
+            _SecurityFile.create(security_file.path, capacity, all_rows)
+
+    # NOTE(steve): the mapping is writable for updates so readers are
+    # given read only views to stop changes to a series reaching the file
+    def _get_columns(self, security):
+        """Returns views of the security's columns sorted oldest to newest."""
+        with self._lock:
+            data = self._get_file(security).get_map()
+            if data is None:
+                return None
+
+            columns = _SecurityFile.columns(data)
+            for column in columns:
+                column.flags.writeable = False
+            return columns
+
+    @staticmethod
+    def _series(columns, lo, hi):
+        if columns is None or lo >= hi:
+            return EquitySeries()
+
+        # NOTE(steve): the reversed slices are read only views of the
+        # mapped file
+        dates = columns[0][lo:hi][::-1].view('datetime64[D]')
+        return EquitySeries(dates, *(c[lo:hi][::-1] for c in columns[1:]))
+
+    def get_equity_data(self, security, dt):
+        columns = self._get_columns(security)
+        if columns is not None:
+            day = _to_day(dt)
+            i = int(np.searchsorted(columns[0], day))
+            if i < len(columns[0]) and columns[0][i] == day:
+                return FrozenEquityData.from_fixed(*(int(c[i])
+                                                     for c in columns[1:]))
+
+        raise InvalidDateError(dt)
+
+    # NOTE(steve): the dates of each security are found with a single
+    # vectorised search of its date column
+    def get_equity_data_many(self, pairs):
+        by_security = {}
+        for security, dt in pairs:
+            by_security.setdefault(security, []).append(dt)
+
+        found = {}
+        errors = []
+        for security, dates in by_security.items():
+            try:
+                columns = self._get_columns(security)
+            except InvalidTickerError:
+                errors += [InvalidTickerError(security) for _ in dates]
+                continue
+
+            if columns is None or len(columns[0]) == 0:
+                errors += [InvalidDateError(dt) for dt in dates]
+                continue
+
+            days = np.array([_to_day(dt) for dt in dates], dtype=np.int64)
+            idx = np.minimum(np.searchsorted(columns[0], days),
+                             len(columns[0]) - 1)
+            matched = columns[0][idx] == days
+            for dt, i, match in zip(dates, idx.tolist(), matched.tolist()):
+                if match:
+                    found[(security, dt)] = FrozenEquityData.from_fixed(
+                            *(int(c[i]) for c in columns[1:]))
+                else:
+                    errors.append(InvalidDateError(dt))
+
+        return found, errors
+
+    def get_equity_data_series(self, security):
+        columns = self._get_columns(security)
+        count = 0 if columns is None else len(columns[0])
+        return ColumnarDataAdapter._series(columns, 0, count)
+
+    def iter_equity_data_series(self, security, chunk_size):
+        columns = self._get_columns(security)
+        count = 0 if columns is None else len(columns[0])
+
+        def chunks():
+            for hi in range(count, 0, -chunk_size):
+                lo = max(hi - chunk_size, 0)
+                yield ColumnarDataAdapter._series(columns, lo, hi)
+
+        return chunks()
+
+    def get_equity_data_range(self, security, start, end):
+        columns = self._get_columns(security)
+        if columns is None:
+            return EquitySeries()
+
+        lo = int(np.searchsorted(columns[0], _to_day(start), side='left'))
+        hi = int(np.searchsorted(columns[0], _to_day(end), side='right'))
+        return ColumnarDataAdapter._series(columns, lo, hi)
+
+    def get_last_n(self, security, n):
+        columns = self._get_columns(security)
+        count = 0 if columns is None else len(columns[0])
+        return ColumnarDataAdapter._series(columns, max(count - max(n, 0), 0),
+                                           count)
+
+    def get_latest_dates(self):
+        latest_dates = {}
+        for security in self.get_securities_list():
+            columns = self._get_columns(security)
+            if columns is None or len(columns[0]) == 0:
+                latest_dates[security] = None
+            else:
+                latest_dates[security] = _from_day(columns[0][-1])
+
+        return latest_dates
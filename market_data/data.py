@@ -1,30 +1,202 @@
+import datetime
 from decimal import Decimal
 
-# TODO(steve): make the equity data class more robust
-# by disabling the ability for callers to access the
-# direct fields stored but must use getters/setters
-# so that we can ensure the data type is enforced
-# NOTE(steve): maybe it's better to use static typing
-# library like mypy??? No? because we need to enforce
-# non negative numbers???
+import numpy as np
+
+# NOTE(steve): prices in an equity series are stored as fixed point
+# integers with six decimal places so they stay exact
+PRICE_SCALE = 10 ** 6
+
+_PRICE_PLACES = 6
+_PLACES_DIVISOR = [10 ** (_PRICE_PLACES - p) for p in range(_PRICE_PLACES + 1)]
+_CENT = _PLACES_DIVISOR[2]
+_PLACES_UNIT = [Decimal(1).scaleb(-p) for p in range(_PRICE_PLACES + 1)]
+_PRICE_SLOTS = ('_open', '_high', '_low', '_close', '_adj_close')
+
+# NOTE(steve): the number of decimal places of each price is packed into
+# three bits. Equity data created from fixed point prices works out the
+# decimal places when the price is read.
+_FIXED = 7
+_FIXED_PLACES = sum(_FIXED << (3 * i) for i in range(5))
+
+# NOTE(steve): returns the price as a fixed point integer and the number
+# of decimal places it was given with. Strings are the common case
+# (scraped and stored data) so they are parsed without creating a Decimal.
+def _parse_price(price):
+    if price.__class__ is str:
+        whole, _, fraction = price.partition('.')
+        if fraction == '' or fraction.isdigit():
+            try:
+                places = len(fraction)
+                return int(whole + fraction) * _PLACES_DIVISOR[places], places
+            except (ValueError, IndexError):
+                pass
+    elif price.__class__ is int:
+        return price * PRICE_SCALE, 0
+
+    price = Decimal(price)
+    places = min(max(-price.as_tuple().exponent, 0), _PRICE_PLACES)
+    return int(price.scaleb(_PRICE_PLACES).to_integral_value()), places
+
+# NOTE(steve): most prices have two decimal places so fixed point prices
+# without any other places are shown with two decimal places
+def _fixed_price_places(raw):
+    if raw % _CENT == 0:
+        return 2
+
+    places = _PRICE_PLACES
+    while raw % 10 == 0:
+        raw //= 10
+        places -= 1
+    return places
+
+def _price_property(name, index):
+    attr = '_' + name
+    shift = 3 * index
+    mask = 7 << shift
+
+    def getter(self):
+        places = self._places
+        if places.__class__ is tuple:
+            places = self._parse(places)
+        places = (places >> shift) & 7
+        raw = getattr(self, attr)
+        if places == _FIXED:
+            places = _fixed_price_places(raw)
+        # NOTE(steve): multiplying by the unit gives the same Decimal as
+        # scaleb but is cheaper
+        return Decimal(raw // _PLACES_DIVISOR[places]) * _PLACES_UNIT[places]
+
+    def setter(self, value):
+        if self._places.__class__ is tuple:
+            self._parse(self._places)
+        raw, places = _parse_price(value)
+        setattr(self, attr, raw)
+        self._places = (self._places & ~mask) | (places << shift)
+
+    return property(getter, setter)
+
+# NOTE(steve): prices are stored as fixed point integers (price *
+# PRICE_SCALE) along with the number of decimal places they were given
+# with so that the Decimal returned prints the same as the value given.
+# Prices with more than six decimal places are rounded. Using slots
+# and integers rather than a __dict__ and Decimal objects makes loading
+# long series much cheaper.
+#
+# Equity data read from a json database is created with from_stored
+# which only checks the prices are numbers and keeps them in _places
+# until they are first used as most of it is never used. The prices are
+# written before _places so threads sharing an object never see it half
+# parsed.
 class EquityData:
+    __slots__ = ('_open', '_high', '_low', '_close', '_adj_close',
+                 '_volume', '_places')
 
     def __init__(self, open=0, high=0, low=0, close=0,
                 adj_close=0, volume=0):
-        self.open = Decimal(open)
-        self.high = Decimal(high)
-        self.low = Decimal(low)
-        self.close = Decimal(close)
-        self.adj_close = Decimal(adj_close)
-        self.volume = int(volume)
+        self._parse((open, high, low, close, adj_close))
+        self._volume = int(volume)
+
+    @classmethod
+    def from_stored(cls, open, high, low, close, adj_close, volume):
+        """
+        Creates equity data from stored prices which are only parsed when
+        they are first used.
+        """
+        prices = (open, high, low, close, adj_close)
+        try:
+            check = (float(open) + float(high) + float(low) + float(close) +
+                     float(adj_close))
+        except (ValueError, TypeError, OverflowError):
+            check = None
+
+        # NOTE(steve): anything that isn't a finite number is parsed now
+        # so that invalid prices raise the same errors as EquityData
+        data = cls.__new__(cls)
+        if check is not None and check - check == 0:
+            data._places = prices
+        else:
+            data._parse(prices)
+        data._volume = int(volume)
+        return data
+
+    def _parse(self, prices):
+        """Parses the prices given when the object was created."""
+        open, high, low, close, adj_close = prices
+        raw_open, open_places = _parse_price(open)
+        raw_high, high_places = _parse_price(high)
+        raw_low, low_places = _parse_price(low)
+        raw_close, close_places = _parse_price(close)
+        raw_adj_close, adj_close_places = _parse_price(adj_close)
+        places = (open_places | high_places << 3 | low_places << 6 |
+                  close_places << 9 | adj_close_places << 12)
+
+        # NOTE(steve): frozen equity data can't be set the usual way
+        _set_open(self, raw_open)
+        _set_high(self, raw_high)
+        _set_low(self, raw_low)
+        _set_close(self, raw_close)
+        _set_adj_close(self, raw_adj_close)
+        _set_places(self, places)
+        return places
+
+    @classmethod
+    def from_fixed(cls, open, high, low, close, adj_close, volume):
+        """Creates equity data from fixed point prices (price * PRICE_SCALE)."""
+        data = cls.__new__(cls)
+        data._open = int(open)
+        data._high = int(high)
+        data._low = int(low)
+        data._close = int(close)
+        data._adj_close = int(adj_close)
+        data._volume = int(volume)
+        data._places = _FIXED_PLACES
+        return data
+
+    open = _price_property('open', 0)
+    high = _price_property('high', 1)
+    low = _price_property('low', 2)
+    close = _price_property('close', 3)
+    adj_close = _price_property('adj_close', 4)
+
+    @property
+    def volume(self):
+        return self._volume
+
+    @volume.setter
+    def volume(self, value):
+        self._volume = int(value)
+
+    def to_fixed(self):
+        """
+        Returns the fixed point prices (price * PRICE_SCALE) and volume as
+        a tuple (open, high, low, close, adj_close, volume).
+        """
+        if self._places.__class__ is tuple:
+            self._parse(self._places)
+        return (self._open, self._high, self._low, self._close,
+                self._adj_close, self._volume)
+
+    def freeze(self):
+        """Returns an immutable copy of the equity data."""
+        frozen = FrozenEquityData.__new__(FrozenEquityData)
+        frozen._copy_from(self)
+        return frozen
+
+    def _copy_from(self, other):
+        places = other._places
+        if places.__class__ is not tuple:
+            for name in _PRICE_SLOTS:
+                object.__setattr__(self, name, getattr(other, name))
+        object.__setattr__(self, '_volume', other._volume)
+        object.__setattr__(self, '_places', places)
 
     def __eq__(self, other):
-        d1 = [self.open, self.high, self.low,
-              self.close, self.adj_close, self.volume]
-        d2 = [other.open, other.high, other.low,
-              other.close, other.adj_close, other.volume]
-        results = (v1 == v2 for v1, v2 in zip(d1, d2))
-        return all(results)
+        if not isinstance(other, EquityData):
+            return NotImplemented
+        return self.to_fixed() == other.to_fixed()
+
+    __hash__ = None
 
     def __str__(self):
         s = f'[open={self.open}, '
@@ -35,6 +207,151 @@ class EquityData:
         s += f'volume={self.volume}]'
         return s
 
+_set_open = EquityData._open.__set__
+_set_high = EquityData._high.__set__
+_set_low = EquityData._low.__set__
+_set_close = EquityData._close.__set__
+_set_adj_close = EquityData._adj_close.__set__
+_set_volume = EquityData._volume.__set__
+_set_places = EquityData._places.__set__
+
+class FrozenEquityData(EquityData):
+    __slots__ = ()
+
+    def __init__(self, open=0, high=0, low=0, close=0,
+                adj_close=0, volume=0):
+        self._copy_from(EquityData(open, high, low, close, adj_close, volume))
+
+    # NOTE(steve): adapters return frozen equity data so it is created
+    # directly rather than by freezing a copy
+    @classmethod
+    def from_fixed(cls, open, high, low, close, adj_close, volume):
+        data = cls.__new__(cls)
+        _set_open(data, int(open))
+        _set_high(data, int(high))
+        _set_low(data, int(low))
+        _set_close(data, int(close))
+        _set_adj_close(data, int(adj_close))
+        _set_volume(data, int(volume))
+        _set_places(data, _FIXED_PLACES)
+        return data
+
+    @classmethod
+    def from_stored(cls, open, high, low, close, adj_close, volume):
+        return EquityData.from_stored(open, high, low, close, adj_close,
+                                      volume).freeze()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    # NOTE(steve): frozen equity data can't be changed so a copy is the
+    # same object. It is pickled with its prices as Decimals so it is
+    # created again with the same decimal places.
+    def freeze(self):
+        return self
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return FrozenEquityData, (self.open, self.high, self.low, self.close,
+                                  self.adj_close, self.volume)
+
+    def __hash__(self):
+        return hash(self.to_fixed())
+
+class EquitySeries:
+    """
+    Equity data for a single security sorted by date (newest to oldest).
+
+    Dates are stored as a datetime64[D] array, prices as int64 arrays
+    of fixed point values (price * PRICE_SCALE) and volume as an int64
+    array. Indexing with an integer and iterating returns (date,
+    equity_data) tuples. Slicing returns an EquitySeries which shares
+    the same arrays.
+    """
+
+    FIELDS = ('open', 'high', 'low', 'close', 'adj_close', 'volume')
+
+    def __init__(self, dates=(), open=(), high=(), low=(), close=(),
+                 adj_close=(), volume=()):
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.open = np.asarray(open, dtype=np.int64)
+        self.high = np.asarray(high, dtype=np.int64)
+        self.low = np.asarray(low, dtype=np.int64)
+        self.close = np.asarray(close, dtype=np.int64)
+        self.adj_close = np.asarray(adj_close, dtype=np.int64)
+        self.volume = np.asarray(volume, dtype=np.int64)
+
+    @classmethod
+    def from_equity_data(cls, data):
+        """
+        Creates a series from a list of (date, equity_data) tuples which
+        are sorted by date (newest to oldest).
+        """
+        if len(data) == 0:
+            return cls()
+
+        dates, equity_data = zip(*data)
+        return cls(dates, *zip(*(d.to_fixed() for d in equity_data)))
+
+    def prices(self, field):
+        """Returns the prices for a field as a float64 array."""
+        return getattr(self, field) / PRICE_SCALE
+
+    def to_records(self):
+        """
+        Returns the series as a numpy record array with the fields date,
+        open, high, low, close, adj_close and volume. Prices are float64.
+        """
+        columns = [self.dates]
+        columns += [self.prices(field) for field in self.FIELDS[:-1]]
+        columns.append(self.volume)
+        return np.rec.fromarrays(columns, names=('date', ) + self.FIELDS)
+
+    def _columns(self):
+        return (self.dates, self.open, self.high, self.low, self.close,
+                self.adj_close, self.volume)
+
+    @staticmethod
+    def _to_row(dt, open, high, low, close, adj_close, volume):
+        dt = datetime.datetime(dt.year, dt.month, dt.day)
+        data = EquityData.from_fixed(open, high, low, close, adj_close, volume)
+        return dt, data
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return EquitySeries(*(c[index] for c in self._columns()))
+
+        return self._to_row(*(c[index].item() for c in self._columns()))
+
+    def __iter__(self):
+        for row in zip(*(c.tolist() for c in self._columns())):
+            yield self._to_row(*row)
+
+    def __eq__(self, other):
+        if isinstance(other, EquitySeries):
+            return all(np.array_equal(c1, c2) for c1, c2 in
+                       zip(self._columns(), other._columns()))
+
+        try:
+            if len(self) != len(other):
+                return False
+        except TypeError:
+            return NotImplemented
+
+        return all(tuple(d1) == tuple(d2) for d1, d2 in zip(self, other))
+
+    def __str__(self):
+        return '[' + ', '.join(f'({d[0]:%Y-%m-%d}, {d[1]})'
+                               for d in self) + ']'
+
 class InvalidTickerError(Exception):
     pass
 
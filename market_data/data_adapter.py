@@ -10,66 +10,124 @@ def get_adapter(source):
     elif source == DataAdapterSource.SQLITE3:
         import market_data.sqlite3_data_adapter
         return market_data.sqlite3_data_adapter.Sqlite3DataAdapter
+    elif source == DataAdapterSource.COLUMNAR:
+        import market_data.columnar_data_adapter
+        return market_data.columnar_data_adapter.ColumnarDataAdapter
     else:
         raise InvalidDataAdapterSourceError(source)
 
 class DataAdapterSource(Enum):
     JSON = 1
     SQLITE3 = 2
+    COLUMNAR = 3
 
-class DataAdapter(metaclass=ABCMeta):
+# NOTE(steve): the methods of a connected data adapter. Adapters that
+# wrap another connected adapter (e.g. CachingDataAdapter) only need to
+# implement these as they don't create or connect to databases.
+class DataAdapterConnection(metaclass=ABCMeta):
 
-    @abstractproperty
-    def test_database(self):
-        raise NotImplementedError
+    @abstractmethod
+    def close(self):
+        pass
 
-    @classmethod
     @abstractmethod
-    def create_test_database(cls):
+    def get_securities_list(self):
         pass
 
-    @classmethod
     @abstractmethod
-    def delete_test_database(cls):
+    def insert_securities(self, securities_to_add):
         pass
 
-    @classmethod
     @abstractmethod
-    def create_database(cls, database):
+    def update_market_data(self, security, equity_data):
         pass
 
-    @classmethod
     @abstractmethod
-    def connect(cls, conn_string):
+    def bulk_update_market_data(self, security, equity_data):
         pass
 
     @abstractmethod
-    def close(self):
+    def get_equity_data(self, security, dt):
+        """Returns the frozen equity data of the security on dt"""
         pass
 
     @abstractmethod
-    def get_securities_list(self):
+    def get_equity_data_many(self, pairs):
+        """
+        Returns a tuple of a dict of (security, dt) to frozen equity data
+        for the pairs found and a list of InvalidTickerError or
+        InvalidDateError for the pairs that weren't
+        """
         pass
 
+    def get_cross_section(self, securities, dt):
+        """
+        Returns a tuple of a dict of security to equity data on dt and a
+        list of errors for the securities without equity data on dt
+        """
+        data, errors = self.get_equity_data_many(
+                [(security, dt) for security in securities])
+        return {security: d for (security, _), d in data.items()}, errors
+
     @abstractmethod
-    def insert_securities(self, securities_to_add):
+    def get_equity_data_series(self, security):
+        """Returns equity data series sorted by date (newest to oldest)"""
         pass
 
     @abstractmethod
-    def update_market_data(self, security, equity_data):
+    def iter_equity_data_series(self, security, chunk_size):
+        """
+        Returns an iterator of equity data series of up to chunk_size rows
+        sorted by date (newest to oldest). Raises InvalidTickerError when
+        called rather than when iterated.
+        """
         pass
 
     @abstractmethod
-    def bulk_update_market_data(self, security, equity_data):
+    def get_equity_data_range(self, security, start, end):
+        """
+        Returns equity data series between start and end dates (inclusive)
+        sorted by date (newest to oldest)
+        """
         pass
 
     @abstractmethod
-    def get_equity_data(self, security, dt):
+    def get_last_n(self, security, n):
+        """Returns the n most recent equity data sorted (newest to oldest)"""
         pass
 
     @abstractmethod
-    def get_equity_data_series(self, security):
-        """Returns equity data series sorted by date (newest to oldest)"""
+    def get_latest_dates(self):
+        """
+        Returns dict of every security to the date of its most recent
+        equity data or None if it has no equity data
+        """
+        pass
+
+class DataAdapter(DataAdapterConnection):
+
+    @abstractproperty
+    def test_database(self):
+        raise NotImplementedError
+
+    @classmethod
+    @abstractmethod
+    def create_test_database(cls):
+        pass
+
+    @classmethod
+    @abstractmethod
+    def delete_test_database(cls):
+        pass
+
+    @classmethod
+    @abstractmethod
+    def create_database(cls, database):
+        pass
+
+    @classmethod
+    @abstractmethod
+    def connect(cls, conn_string):
         pass
 
 class InvalidDataAdapterSourceError(Exception):
@@ -1,13 +1,34 @@
 import os
+import bisect
+import contextlib
 import datetime
 import json
+import tempfile
+import threading
+
+# NOTE(steve): file locks stop other processes renaming or removing the
+# journal files part way through a read, append or compaction. They
+# aren't available on windows where only threads are kept apart.
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 import market_data.data_adapter as data_adapter
-from market_data.data import EquityData, InvalidTickerError, InvalidDateError
+from market_data.data import EquityData, EquitySeries
+from market_data.data import InvalidTickerError, InvalidDateError
 
 class JsonDataAdapter(data_adapter.DataAdapter):
     test_database = 'testdb.json'
 
+    # NOTE(steve): the journal is folded into the database once it is
+    # at least this size and half the size of the database so the cost
+    # of rewriting the database is spread over many updates
+    compaction_min_size = 256 * 1024
+
+    _journal_lock = threading.RLock()
+    _compacting = set()
+
     @classmethod
     def create_test_database(cls):
         if os.path.isfile(cls.test_database):
@@ -21,104 +42,414 @@ class JsonDataAdapter(data_adapter.DataAdapter):
             raise data_adapter.DatabaseNotFoundError(cls.test_database)
 
         os.remove(cls.test_database)
+        cls._remove_journal_files(cls.test_database)
 
+    # NOTE(steve): in_memory loads the database once on connect and
+    # serves reads from memory. Writes are only saved to disk on
+    # flush or close.
     @classmethod
-    def connect(cls, conn_string):
+    def connect(cls, conn_string, in_memory=False):
         if not os.path.isfile(conn_string):
             raise data_adapter.DatabaseNotFoundError(conn_string)
 
-        return cls(conn_string)
+        return cls(conn_string, in_memory=in_memory)
 
     # TODO(steve): need to write unit tests around this method
     # what happens if this is not a valid path or file extension???
     @classmethod
     def create_database(cls, database):
         cls._save_data(database, TextDataModel())
+        cls._remove_journal_files(database)
+
+    # NOTE(steve): updates are appended to a journal file next to the
+    # database instead of rewriting the whole database. The journal is
+    # renamed to the compacting file while it is being folded into the
+    # database so that new updates can keep being appended.
+    # Replaying a journal entry twice gives the same result so it is
+    # fine for a reader to see both the compacted database and the
+    # compacting file.
+    @classmethod
+    def _journal_files(cls, conn_string):
+        return conn_string + '.compacting', conn_string + '.journal'
+
+    @classmethod
+    def _lock_file(cls, conn_string):
+        return conn_string + '.lock'
+
+    @classmethod
+    def _remove_journal_files(cls, conn_string):
+        for path in cls._journal_files(conn_string) + (
+                cls._lock_file(conn_string), ):
+            if os.path.isfile(path):
+                os.remove(path)
+
+    # NOTE(steve): the journal lock is still taken so the threads of this
+    # process are kept apart where file locks aren't available
+    @classmethod
+    @contextlib.contextmanager
+    def _locked(cls, conn_string):
+        with cls._journal_lock:
+            if fcntl is None:
+                yield
+                return
+
+            with open(cls._lock_file(conn_string), 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                yield
 
     @classmethod
     def _load_data(cls, conn_string):
-        with open(conn_string, 'r') as db:
-            data = json.load(db, object_hook=TextDataModel.json_decoder)
+        with cls._locked(conn_string):
+            with open(conn_string, 'r') as db:
+                data = json.load(db, object_hook=TextDataModel.json_decoder)
+
+            for path in cls._journal_files(conn_string):
+                for entry in cls._read_journal(path):
+                    data.apply_journal_entry(entry)
+
         return data
 
+    # NOTE(steve): a crash part way through an append can leave the last
+    # line incomplete so any line that can't be decoded is skipped
+    @classmethod
+    def _read_journal(cls, path):
+        try:
+            with open(path, 'r') as journal:
+                for line in journal:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        pass
+        except FileNotFoundError:
+            return
+
+    # NOTE(steve): the data is written to a temporary file first and then
+    # swapped in so that a crash part way through never leaves a half
+    # written database behind
     @classmethod
     def _save_data(cls, conn_string, data):
-        with open(conn_string, 'w') as db:
-            json.dump(data, db, default=TextDataModel.json_encoder)
+        tmp_path = cls._save_temp_data(conn_string, data)
+        os.replace(tmp_path, conn_string)
+
+    @classmethod
+    def _save_temp_data(cls, conn_string, data):
+        directory, filename = os.path.split(os.path.abspath(conn_string))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=filename + '.',
+                                        suffix='.tmp')
+        try:
+            os.chmod(tmp_path, _file_mode(conn_string))
+            with os.fdopen(fd, 'w') as db:
+                json.dump(data, db, default=TextDataModel.json_encoder)
+                db.flush()
+                os.fsync(db.fileno())
+        except:
+            os.remove(tmp_path)
+            raise
+
+        return tmp_path
+
+    @classmethod
+    def _append_journal(cls, conn_string, entries):
+        lines = ''.join(json.dumps(entry) + '\n' for entry in entries)
+        _, journal_path = cls._journal_files(conn_string)
+        with cls._locked(conn_string):
+            with open(journal_path, 'a+b') as journal:
+                # NOTE(steve): make sure we don't add onto an incomplete
+                # line left behind by a crash
+                if journal.tell() > 0:
+                    journal.seek(-1, os.SEEK_END)
+                    if journal.read(1) != b'\n':
+                        lines = '\n' + lines
+                journal.write(lines.encode('utf-8'))
+
+    @classmethod
+    def _needs_compaction(cls, conn_string):
+        _, journal_path = cls._journal_files(conn_string)
+        try:
+            journal_size = os.path.getsize(journal_path)
+        except FileNotFoundError:
+            return False
+
+        threshold = max(cls.compaction_min_size,
+                        os.path.getsize(conn_string) // 2)
+        return journal_size >= threshold
+
+    # NOTE(steve): the compacting file is locked while it is folded into
+    # the database so only one process compacts at a time. A compacting
+    # file left behind by a process that died isn't locked and is
+    # folded in by the next compaction.
+    @classmethod
+    def compact(cls, conn_string):
+        """Folds the journal into the database file."""
+        compacting_path, journal_path = cls._journal_files(conn_string)
+        with cls._locked(conn_string):
+            if conn_string in cls._compacting:
+                return
+            if not os.path.isfile(compacting_path):
+                if not os.path.isfile(journal_path):
+                    return
+                os.replace(journal_path, compacting_path)
+            compacting = open(compacting_path, 'r')
+            if not _try_lock(compacting):
+                compacting.close()
+                return
+            cls._compacting.add(conn_string)
 
-    def __init__(self, conn_string):
+        try:
+            with compacting:
+                with open(conn_string, 'r') as db:
+                    data = json.load(db,
+                                     object_hook=TextDataModel.json_decoder)
+                for entry in cls._read_journal(compacting_path):
+                    data.apply_journal_entry(entry)
+                tmp_path = cls._save_temp_data(conn_string, data)
+
+                with cls._locked(conn_string):
+                    os.replace(tmp_path, conn_string)
+                    os.remove(compacting_path)
+        finally:
+            with cls._journal_lock:
+                cls._compacting.discard(conn_string)
+
+    def __init__(self, conn_string, in_memory=False):
         self.conn_string = conn_string
+        self.in_memory = in_memory
+        self._data = None
+        self._signature = None
+        self._pending = []
+        self._compactor = None
+        self._lock = threading.RLock()
+
+        if self.in_memory:
+            self._reload()
+
+    # NOTE(steve): the size is included as some file systems have
+    # a coarse modified time resolution
+    def _file_signature(self):
+        signature = []
+        for path in (self.conn_string, ) + self._journal_files(self.conn_string):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _reload(self):
+        self._signature = self._file_signature()
+        self._data = JsonDataAdapter._load_data(self.conn_string)
+        for entry in self._pending:
+            self._data.apply_journal_entry(entry)
+
+    # NOTE(steve): in memory mode the files are only read again if
+    # another process has changed them. Any unsaved changes are
+    # applied again on top of the new data. The data is shared by all
+    # the threads using the connection so the lock is held until the
+    # caller is done with it.
+    @contextlib.contextmanager
+    def _get_data(self):
+        if not self.in_memory:
+            yield JsonDataAdapter._load_data(self.conn_string)
+            return
+
+        with self._lock:
+            if self._file_signature() != self._signature:
+                self._reload()
+
+            yield self._data
+
+    def _write(self, data, entry):
+        if self.in_memory:
+            data.apply_journal_entry(entry)
+            self._pending.append(entry)
+        else:
+            self._save_entries([entry])
+
+    def _save_entries(self, entries):
+        JsonDataAdapter._append_journal(self.conn_string, entries)
+
+        if JsonDataAdapter._needs_compaction(self.conn_string):
+            if self._compactor is None or not self._compactor.is_alive():
+                self._compactor = threading.Thread(
+                        target=JsonDataAdapter.compact,
+                        args=(self.conn_string, ),
+                        daemon=True)
+                self._compactor.start()
+
+    # NOTE(steve): the files are only marked as read after the append if
+    # nothing else changed them since they were loaded. Otherwise the
+    # next read loads them again to pick up the other changes.
+    def flush(self):
+        """Saves any changes held in memory to the database journal."""
+        with self._lock:
+            if self.in_memory and len(self._pending) > 0:
+                unchanged = self._file_signature() == self._signature
+                self._save_entries(self._pending)
+                self._pending = []
+                self._signature = (self._file_signature() if unchanged
+                                   else None)
 
     # NOTE(steve): this method will close the connection
     # to the database. For the json implementation
-    # nothing needs to be done here.
+    # we only need to save any changes held in memory
+    # and wait for any compaction to finish.
     def close(self):
-        pass
+        self.flush()
+        if self._compactor is not None:
+            self._compactor.join()
+            self._compactor = None
 
     def get_securities_list(self):
-        return JsonDataAdapter._load_data(self.conn_string).securities
+        with self._get_data() as data:
+            return list(data.securities)
 
     # TODO(steve): we need to check with this creates 
     # a race condition?!?! I'm confident that it does
     def insert_securities(self, securities_to_add):
-        data = JsonDataAdapter._load_data(self.conn_string)
-        data.securities = list(set(data.securities + securities_to_add))
-        for sec in securities_to_add:
-            if not sec in data.equity_data:
-                data.equity_data[sec] = {}
-
-        JsonDataAdapter._save_data(self.conn_string, data)
+        with self._get_data() as data:
+            self._write(data, {'securities': list(securities_to_add)})
 
     def update_market_data(self, security, equity_data):
         self.bulk_update_market_data(security, [equity_data])
 
     def bulk_update_market_data(self, security, equity_data):
-        securities = self.get_securities_list()
-
-        if security in securities:
-            data = JsonDataAdapter._load_data(self.conn_string)
-            if security not in data.equity_data:
-                data.equity_data[security] = {}
+        with self._get_data() as data:
+            if security not in data.securities:
+                raise InvalidTickerError(security)
 
+            entry_data = {}
             for d in equity_data:
                 dt_key = d[0].strftime('%d-%b-%Y')
-                data.equity_data[security][dt_key] = d[1]
+                entry_data[dt_key] = TextDataModel.equity_data_to_dict(d[1])
 
-            JsonDataAdapter._save_data(self.conn_string, data)
-        else:
-            raise InvalidTickerError(security)
+            self._write(data, {'ticker': security, 'data': entry_data})
 
     def get_equity_data(self, security, dt):
-        if security in self.get_securities_list():
-            data = JsonDataAdapter._load_data(self.conn_string)
+        with self._get_data() as data:
+            if security not in data.securities:
+                raise InvalidTickerError(security)
 
-            dt_key = dt.strftime('%d-%b-%Y')
-            if dt_key in data.equity_data[security]:
-                return data.equity_data[security][dt_key]
-            else:
+            equity_data = data.equity_data[security].get(
+                    dt.strftime('%d-%b-%Y'))
+            if equity_data is None:
                 raise InvalidDateError(dt)
-        else:
-            raise InvalidTickerError(security)
+
+            return equity_data.freeze()
+
+    # NOTE(steve): all the pairs are looked up in a single load of the
+    # database. Like get_equity_data, frozen copies are returned so the
+    # data held in memory can't be changed by the caller.
+    def get_equity_data_many(self, pairs):
+        with self._get_data() as data:
+            securities = set(data.securities)
+
+            found = {}
+            errors = []
+            for security, dt in pairs:
+                if security not in securities:
+                    errors.append(InvalidTickerError(security))
+                    continue
+
+                equity_data = data.equity_data[security].get(
+                        dt.strftime('%d-%b-%Y'))
+                if equity_data is None:
+                    errors.append(InvalidDateError(dt))
+                else:
+                    found[(security, dt)] = equity_data.freeze()
+
+            return found, errors
+
+    # NOTE(steve): get_bounds takes the sorted dates of the security
+    # and returns the slice of them to return
+    def _get_series(self, security, get_bounds):
+        with self._get_data() as data:
+            if security not in data.securities:
+                raise InvalidTickerError(security)
+
+            dates, keys = data.sorted_dates(security)
+            sec_data = data.equity_data[security]
+            lo, hi = get_bounds(dates)
+            return EquitySeries.from_equity_data(
+                    [(dates[i], sec_data[keys[i]])
+                     for i in reversed(range(lo, hi))])
 
     # NOTE(steve): data series sorted by date (newest to oldest)
     def get_equity_data_series(self, security):
-        if security in self.get_securities_list():
-            data = JsonDataAdapter._load_data(self.conn_string)
-
-            # convert to list
-            ret_data = [(datetime.datetime.strptime(dt, '%d-%b-%Y'), d) for
-                         (dt, d) in data.equity_data[security].items()]
-
-            return sorted(ret_data, reverse=True)
-        else:
-            pass
-            raise InvalidTickerError(security)
+        return self._get_series(security, lambda dates: (0, len(dates)))
+
+    # NOTE(steve): the database is a single json document so it is loaded
+    # as usual but each chunk of the series is only built when needed.
+    # The chunks are built from the sorted dates taken under the lock and
+    # any dates added afterwards aren't included.
+    def iter_equity_data_series(self, security, chunk_size):
+        with self._get_data() as data:
+            if security not in data.securities:
+                raise InvalidTickerError(security)
+
+            dates, keys = data.sorted_dates(security)
+            sec_data = data.equity_data[security]
+
+        def chunks():
+            for hi in range(len(dates), 0, -chunk_size):
+                lo = max(hi - chunk_size, 0)
+                yield EquitySeries.from_equity_data(
+                        [(dates[i], sec_data[keys[i]])
+                         for i in reversed(range(lo, hi))])
+
+        return chunks()
+
+    def get_equity_data_range(self, security, start, end):
+        start, end = _normalise_date(start), _normalise_date(end)
+        return self._get_series(security, lambda dates: (
+                bisect.bisect_left(dates, start),
+                bisect.bisect_right(dates, end)))
+
+    def get_last_n(self, security, n):
+        return self._get_series(security, lambda dates: (
+                max(len(dates) - max(n, 0), 0), len(dates)))
+
+    def get_latest_dates(self):
+        latest_dates = {}
+        with self._get_data() as data:
+            for security in data.securities:
+                dates, _ = data.sorted_dates(security)
+                latest_dates[security] = (dates[-1] if len(dates) > 0
+                                          else None)
+
+        return latest_dates
+
+def _try_lock(f):
+    if fcntl is None:
+        return True
+
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+# NOTE(steve): temporary files are created readable by the owner only so
+# they are given the mode of the file they replace (or the default mode
+# for a new file) before being swapped in
+def _file_mode(path):
+    try:
+        return os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+# NOTE(steve): the json database stores dates without times so any
+# time is dropped before comparing dates
+def _normalise_date(dt):
+    return datetime.datetime(dt.year, dt.month, dt.day)
 
 class TextDataModel:
 
     def __init__(self):
         self.securities = list()
         self.equity_data = {}
+        self._date_index = {}
 
     @classmethod
     def json_encoder(cls, o):
@@ -127,8 +458,14 @@ class TextDataModel:
         else:
             raise TypeError(f'{repr(o)} is not JSON serialized')
 
+    # NOTE(steve): the hook is called for every object in the file but
+    # only the top level object is a data model. Checking for it first
+    # saves raising and catching an error for every day of equity data.
     @classmethod
     def json_decoder(cls, o):
+        if 'securities' not in o:
+            return o
+
         try:
             return TextDataModel._from_dict(o)
         except:
@@ -144,17 +481,61 @@ class TextDataModel:
             if sec in dict_data:
                 data.equity_data[sec] = {}
                 for dt, equity_data in dict_data[sec].items():
-                    data.equity_data[sec][dt] = EquityData(
-                        open=equity_data['open'],
-                        high=equity_data['high'],
-                        low=equity_data['low'],
-                        close=equity_data['close'],
-                        adj_close=equity_data['adj_close'],
-                        volume=equity_data['volume']
-                    )
+                    data.equity_data[sec][dt] = \
+                            cls.equity_data_from_dict(equity_data)
 
         return data
 
+    @staticmethod
+    def equity_data_from_dict(equity_data):
+        return EquityData.from_stored(
+            open=equity_data['open'],
+            high=equity_data['high'],
+            low=equity_data['low'],
+            close=equity_data['close'],
+            adj_close=equity_data['adj_close'],
+            volume=equity_data['volume']
+        )
+
+    @staticmethod
+    def equity_data_to_dict(equity_data):
+        return {
+            'open': str(equity_data.open),
+            'high': str(equity_data.high),
+            'low': str(equity_data.low),
+            'close': str(equity_data.close),
+            'adj_close': str(equity_data.adj_close),
+            'volume': equity_data.volume
+        }
+
+    # NOTE(steve): journal entries either add securities or
+    # add/replace equity data for a single security
+    def apply_journal_entry(self, entry):
+        if 'securities' in entry:
+            for sec in entry['securities']:
+                if sec not in self.securities:
+                    self.securities.append(sec)
+                if sec not in self.equity_data:
+                    self.equity_data[sec] = {}
+        else:
+            sec_data = self.equity_data.setdefault(entry['ticker'], {})
+            for dt, equity_data in entry['data'].items():
+                sec_data[dt] = TextDataModel.equity_data_from_dict(equity_data)
+            self._date_index.pop(entry['ticker'], None)
+
+    def sorted_dates(self, security):
+        """
+        Returns the dates with equity data for the security sorted from
+        oldest to newest and the matching keys into equity_data.
+        """
+        if security not in self._date_index:
+            dates = sorted(datetime.datetime.strptime(dt, '%d-%b-%Y')
+                           for dt in self.equity_data.get(security, {}))
+            keys = [dt.strftime('%d-%b-%Y') for dt in dates]
+            self._date_index[security] = dates, keys
+
+        return self._date_index[security]
+
     def _to_dict(self):
         d = {}
 
@@ -163,14 +544,7 @@ class TextDataModel:
             if sec in self.equity_data:
                 d[sec] = {}
                 for dt, equity_data in self.equity_data[sec].items():
-                    d[sec][dt] = {
-                        'open': str(equity_data.open),
-                        'high': str(equity_data.high),
-                        'low': str(equity_data.low),
-                        'close': str(equity_data.close),
-                        'adj_close': str(equity_data.adj_close),
-                        'volume': equity_data.volume
-                    }
+                    d[sec][dt] = self.equity_data_to_dict(equity_data)
 
         return d
 
@@ -1,7 +1,14 @@
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import bisect
+import datetime
 import json
+import threading
 
 from market_data.scraper import Scraper
+from market_data.caching_data_adapter import CachingDataAdapter
+import market_data.snapshot as snapshot
+import market_data.trading_calendar as trading_calendar
 from market_data.data import InvalidTickerError, InvalidDateError, NoDataError
 from market_data.data_adapter import DatabaseNotFoundError
 import market_data.data_adapter as data_adapter
@@ -9,6 +16,8 @@ import market_data.data_adapter as data_adapter
 class MarketData:
 
     Database = namedtuple('Database', ['conn_string', 'source'])
+    UpdatePlan = namedtuple('UpdatePlan', ['ticker', 'dates'])
+    UpdateResult = namedtuple('UpdateResult', ['ticker', 'dates', 'errors'])
     _init = False
 
 
@@ -18,17 +27,30 @@ class MarketData:
     # TODO(steve): the DataAdapter should be passed into the 
     # MarketData class not a connection string to connect to
     # the database???
-    def run(self, database):
+    def run(self, database, transport=None, cache_size=None,
+            connect_options=None):
         """
         Initialises MarketData class with scraper and data adapter.
 
         Args:
             database: namedtuple('Database', ['conn_string', 'source']).
+            transport: Object with a get(url) method used by the scraper
+                to fetch web pages e.g. a ReplayTransport to update from
+                recorded pages. Defaults to fetching over http.
+            cache_size: Number of lookups and series to keep in a read
+                through LRU cache in front of the database. Defaults to no
+                cache.
+            connect_options: Dictionary of keyword arguments for the data
+                adapter's connect e.g. {'profile': 'performance',
+                'pooled': True} for a sqlite3 database shared by threads.
         """
         self._init = True
-        self._scraper = Scraper('yahoo')
+        self._scraper = Scraper('yahoo', transport=transport)
         da = data_adapter.get_adapter(database.source)
-        self._database = da.connect(database.conn_string)
+        self._database = da.connect(database.conn_string,
+                                    **(connect_options or {}))
+        if cache_size:
+            self._database = CachingDataAdapter(self._database, cache_size)
 
     # NOTE(steve): this method will be used to clean up
     # all the dependency e.g. closing of the database
@@ -85,6 +107,40 @@ class MarketData:
         data = self._database.get_equity_data(ticker, dt)
         return data
 
+    def get_equity_data_many(self, pairs):
+        """
+        Returns equity data for many tickers and dates in one lookup.
+
+        Args:
+            pairs: List of (ticker, date) tuples.
+
+        Returns:
+            A tuple of the equity data and errors. The equity data is a
+            dictionary of (ticker, date) to equity data object for the
+            pairs found. Errors is a list of InvalidTickerError or
+            InvalidDateError for the pairs not found.
+        """
+        self._check_initialised()
+        return self._database.get_equity_data_many(pairs)
+
+    def get_cross_section(self, tickers, dt):
+        """
+        Returns equity data for many tickers on the same date e.g. the
+        close of every index member on a day.
+
+        Args:
+            tickers: List of Yahoo tickers.
+            dt: date of equity data.
+
+        Returns:
+            A tuple of the equity data and errors. The equity data is a
+            dictionary of ticker to equity data object for the tickers
+            with equity data on the date. Errors is a list of
+            InvalidTickerError or InvalidDateError for the others.
+        """
+        self._check_initialised()
+        return self._database.get_cross_section(tickers, dt)
+
     def get_equity_data_series(self, ticker):
         """
         Return equity data for all available dates for the selected ticker.
@@ -93,8 +149,8 @@ class MarketData:
             ticker: Yahoo ticker.
 
         Returns:
-            Equity data series sorted by date (newest to oldest) as a list of
-            tuples (date, equity_data).
+            EquitySeries sorted by date (newest to oldest) which returns
+            (date, equity_data) tuples when indexed or iterated.
 
         Raises:
             InvalidTickerError: Security not in market data.
@@ -103,6 +159,66 @@ class MarketData:
         data = self._database.get_equity_data_series(ticker)
         return data
 
+    def iter_equity_data_series(self, ticker, chunk_size=1000):
+        """
+        Return equity data for all available dates for the selected ticker
+        a chunk at a time so long histories can be processed without
+        loading them all at once.
+
+        Args:
+            ticker: Yahoo ticker.
+            chunk_size: Maximum number of dates in each chunk.
+
+        Returns:
+            Iterator of EquitySeries sorted by date (newest to oldest).
+
+        Raises:
+            InvalidTickerError: Security not in market data.
+        """
+        self._check_initialised()
+        if chunk_size < 1:
+            raise ValueError(f'chunk_size must be at least 1: {chunk_size}')
+        return self._database.iter_equity_data_series(ticker, chunk_size)
+
+    def get_equity_data_range(self, ticker, start, end):
+        """
+        Return equity data for the selected ticker between two dates.
+
+        Args:
+            ticker: Yahoo ticker.
+            start: first date of the range (inclusive).
+            end: last date of the range (inclusive).
+
+        Returns:
+            EquitySeries sorted by date (newest to oldest) which returns
+            (date, equity_data) tuples when indexed or iterated.
+
+        Raises:
+            InvalidTickerError: Security not in market data.
+        """
+        self._check_initialised()
+        data = self._database.get_equity_data_range(ticker, start, end)
+        return data
+
+    def get_last_n(self, ticker, n):
+        """
+        Return the n most recent equity data for the selected ticker.
+
+        Args:
+            ticker: Yahoo ticker.
+            n: maximum number of dates to return.
+
+        Returns:
+            EquitySeries sorted by date (newest to oldest) which returns
+            (date, equity_data) tuples when indexed or iterated.
+
+        Raises:
+            InvalidTickerError: Security not in market data.
+        """
+        self._check_initialised()
+        data = self._database.get_last_n(ticker, n)
+        return data
+
     def get_latest_equity_data(self, ticker):
         """
         Return the most recent equity data object for the selected ticker.
@@ -119,7 +235,7 @@ class MarketData:
             NoDataError: No data availabe for selected security.
         """
         self._check_initialised()
-        data = self.get_equity_data_series(ticker)
+        data = self._database.get_last_n(ticker, 1)
         if len(data) > 0:
             return data[0]
         else:
@@ -167,5 +283,190 @@ class MarketData:
         else:
             raise InvalidTickerError(ticker)
 
+    def plan_updates(self, tickers=None):
+        """
+        Works out the dates to fetch for each security to bring it up
+        to date. The latest date of all securities is read from the
+        database in a single query.
+
+        Args:
+            tickers: List of Yahoo tickers. Defaults to all securities.
+
+        Returns:
+            A tuple of the plan and errors. The plan is a list of
+            UpdatePlan(ticker, dates) for securities with dates to fetch,
+            which are the weekdays after their latest equity data up to
+            today or just today if they have no equity data. Errors is a
+            list of InvalidTickerError for tickers not in market data.
+        """
+        self._check_initialised()
+        latest_dates = self._database.get_latest_dates()
+        if tickers is None:
+            tickers = list(latest_dates.keys())
+
+        today = datetime.datetime.today()
+        today = datetime.datetime(today.year, today.month, today.day)
+
+        # NOTE(steve): most securities are updated together so share the
+        # same latest date. The trading days of each exchange are
+        # generated once from the earliest start and each security takes
+        # a slice of them.
+        starts = {}
+        errors = []
+        for ticker in tickers:
+            if ticker not in latest_dates:
+                errors.append(InvalidTickerError(ticker))
+                continue
+
+            latest = latest_dates[ticker]
+            if latest is None:
+                start = today
+            else:
+                start = latest + datetime.timedelta(days=1)
+
+            calendar = trading_calendar.get_calendar(ticker)
+            starts.setdefault(calendar, []).append((ticker, start))
+
+        plan = []
+        for calendar, ticker_starts in starts.items():
+            first = min(start for _, start in ticker_starts)
+            trading_days = calendar.trading_days(first, today)
+            for ticker, start in ticker_starts:
+                i = bisect.bisect_left(trading_days, start)
+                if i < len(trading_days):
+                    plan.append(MarketData.UpdatePlan(ticker,
+                                                      trading_days[i:]))
+
+        return plan, errors
+
+    def update_all(self, tickers=None, max_workers=8, max_per_host=4):
+        """
+        Updates market data for the selected securities from the day after
+        their latest equity data up to today.
+
+        Web pages are fetched and parsed concurrently but all the database
+        updates are made from the calling thread.
+
+        Args:
+            tickers: List of Yahoo tickers. Defaults to all securities.
+            max_workers: Number of securities fetched concurrently.
+            max_per_host: Maximum number of concurrent requests to the
+                scraper's website.
+
+        Returns:
+            Dictionary of ticker to UpdateResult(ticker, dates, errors)
+            where dates are the dates updated and errors is a list of
+            errors or an empty list if no errors.
+        """
+        self._check_initialised()
+        if tickers is None:
+            tickers = self._database.get_securities_list()
+
+        plan, errors = self.plan_updates(tickers)
+        results = {ticker: MarketData.UpdateResult(ticker, [], [])
+                   for ticker in tickers}
+        for e in errors:
+            ticker = e.args[0]
+            results[ticker] = MarketData.UpdateResult(ticker, [], [e])
+
+        host_limit = threading.BoundedSemaphore(max_per_host)
+        def scrape(ticker, date_list):
+            with host_limit:
+                return self._scraper.scrape_eq_multiple_dates(ticker,
+                                                              date_list)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(scrape, ticker, date_list): ticker
+                       for ticker, date_list in plan}
+
+            for future in as_completed(futures):
+                ticker = futures[future]
+                try:
+                    data, errors = future.result()
+                    self._database.bulk_update_market_data(ticker, data)
+                    dates = [d[0] for d in data]
+                    results[ticker] = MarketData.UpdateResult(ticker, dates,
+                                                              errors)
+                except Exception as e:
+                    results[ticker] = MarketData.UpdateResult(ticker, [], [e])
+
+        return results
+
+    def export(self, path, tickers=None, start=None, end=None,
+               format='parquet'):
+        """
+        Exports equity data to a single file one security at a time so
+        only one series is held in memory.
+
+        Parquet and arrow files have the columns ticker, date, open, high,
+        low, close, adj_close (float64) and volume (int64) with a row group
+        or record batch per security sorted by date (oldest to newest).
+        They need pyarrow to be installed. Csv files have the same columns.
+
+        Args:
+            path: File to write.
+            tickers: List of Yahoo tickers. Defaults to all securities.
+            start: Earliest date to export. Defaults to the first date.
+            end: Latest date to export. Defaults to the last date.
+            format: One of 'parquet', 'arrow' or 'csv'.
+
+        Returns:
+            Number of rows exported.
+
+        Raises:
+            InvalidTickerError: Security not in market data.
+            InvalidFormatError: Format not supported.
+        """
+        self._check_initialised()
+        if tickers is None:
+            tickers = self._database.get_securities_list()
+
+        rows = 0
+        writer = snapshot.open_writer(path, format)
+        try:
+            for ticker in tickers:
+                if start is None and end is None:
+                    series = self._database.get_equity_data_series(ticker)
+                else:
+                    series = self._database.get_equity_data_range(ticker,
+                            start or datetime.datetime.min,
+                            end or datetime.datetime.max)
+                writer.write(ticker, series)
+                rows += len(series)
+        finally:
+            writer.close()
+
+        return rows
+
+    def import_(self, path, format='parquet'):
+        """
+        Imports equity data from a file written by export. The file is
+        read a row group, record batch or block of csv rows at a time.
+        Securities which aren't in market data are added and existing
+        equity data for the same dates is replaced.
+
+        Args:
+            path: File to read.
+            format: One of 'parquet', 'arrow' or 'csv'.
+
+        Returns:
+            Number of rows imported.
+
+        Raises:
+            InvalidFormatError: Format not supported.
+        """
+        self._check_initialised()
+        securities = set(self._database.get_securities_list())
+
+        rows = 0
+        for ticker, data in snapshot.read_snapshot(path, format):
+            if ticker not in securities:
+                self._database.insert_securities([ticker])
+                securities.add(ticker)
+            self._database.bulk_update_market_data(ticker, data)
+            rows += len(data)
+
+        return rows
+
 class NotInitialisedError(Exception):
     pass
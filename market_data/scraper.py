@@ -1,17 +1,89 @@
+import asyncio
 import datetime
-import urllib.request
-from bs4 import BeautifulSoup
+import threading
+import time
+from collections import OrderedDict
+from html.parser import HTMLParser
+from urllib.parse import quote
 
 from market_data.data import EquityData, EmptyDateListError
 from market_data.data import InvalidTickerError, InvalidDateError
+from market_data.transport import HttpTransport, AsyncHttpTransport
+from market_data.throttle import Throttle, ThrottledTransport
+from market_data.throttle import AsyncThrottledTransport
 
 class Scraper:
 
-    def __init__(self, source):
-        if not source == 'yahoo':
+    # NOTE(steve): the history page changes at most once a day so parsed
+    # pages are kept for a short while. This means looking up several
+    # dates for a ticker within one update only fetches the page once.
+    cache_ttl = 300
+    cache_size = 256
+
+    _urls = {
+        'yahoo': r'https://finance.yahoo.com/quote/{ticker}/history?p={ticker}'
+    }
+
+    # NOTE(steve): keyword arguments for the Throttle which limits how
+    # fast pages are fetched from each source. These need to be set
+    # before the first scraper for the source is created.
+    source_limits = {
+        'yahoo': {'rate': 2.0, 'burst': 4, 'max_retries': 4, 'backoff': 1.0,
+                  'max_backoff': 30.0, 'failure_threshold': 10,
+                  'reset_timeout': 60.0}
+    }
+
+    # NOTE(steve): the transport is anything with a get(url) method that
+    # returns the page as a string. By default pages are fetched over a
+    # pooled http transport through a throttle for the source, both of
+    # which are shared by all scrapers so the limits hold across threads.
+    # Transports passed in are used as is.
+    #
+    # The async methods fetch pages with async_transport, anything with an
+    # async get(url) method. By default each scraper has its own async
+    # http transport (its connections belong to one event loop) through
+    # the source's shared throttle. If only a transport is passed in the
+    # async methods call it from the executor instead.
+    _http_transport = None
+    _default_transports = {}
+    _default_lock = threading.Lock()
+
+    def __init__(self, source, cache_ttl=None, cache_size=None,
+                 transport=None, async_transport=None):
+        if source not in Scraper._urls:
             raise InvalidSourceError(source)
         self.source = source
 
+        if transport is None:
+            transport = Scraper._get_default_transport(source)
+            if async_transport is None:
+                async_transport = AsyncThrottledTransport(
+                        AsyncHttpTransport(), transport.throttle)
+        self.transport = transport
+        self.async_transport = async_transport
+
+        if cache_ttl is not None:
+            self.cache_ttl = cache_ttl
+        if cache_size is not None:
+            self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @staticmethod
+    def _get_default_transport(source):
+        with Scraper._default_lock:
+            if Scraper._http_transport is None:
+                Scraper._http_transport = HttpTransport()
+
+            transport = Scraper._default_transports.get(source)
+            if transport is None:
+                throttle = Throttle(**Scraper.source_limits[source])
+                transport = ThrottledTransport(Scraper._http_transport,
+                                               throttle)
+                Scraper._default_transports[source] = transport
+
+        return transport
+
     # NOTE(steve): this allows the scrape equity data to accept
     # both datetime and date objects. It only needs to the date.
     @staticmethod
@@ -21,83 +93,320 @@ class Scraper:
         except AttributeError:
             return date
 
-    @staticmethod
-    def _get_web_page(ticker):
-        url = r'https://finance.yahoo.com/quote/{ticker}/history?p={ticker}'
-        req = urllib.request.Request(url.replace('{ticker}', ticker))
-        with urllib.request.urlopen(req) as response:
-            page = response.read().decode('utf-8')
+    def _get_url(self, ticker):
+        return Scraper._urls[self.source].replace('{ticker}',
+                                                  quote(ticker, safe=''))
 
-        return page
+    def _get_web_page(self, ticker):
+        return self.transport.get(self._get_url(ticker))
 
     @staticmethod
-    def _get_hist_price_data_table(page, ticker):
-        # NOTE(steve): parse the html page and find the table
-        # of historical price data based on table attributes
-        # to make it slightly more robust to changes in the webpage
-        # NOTE(steve): we use a try/except here to capture any errors in 
-        # finding the historical prices table as it hides more of the
-        # implementation.
-        try:
-            parsed_html = BeautifulSoup(page, features='html.parser')
-            data_table = parsed_html.body.find('table',
-                                attrs={'data-test':'historical-prices'})
-            data_table = data_table.find('tbody')
-
-            return data_table
-        except:
+    def _get_hist_price_rows(page, ticker):
+        # NOTE(steve): find the table of historical price data based on
+        # table attributes to make it slightly more robust to changes
+        # in the webpage
+        parser = _HistPriceTableParser()
+        rows = parser.parse(page)
+        if rows is None:
             raise InvalidTickerError(ticker)
 
+        return rows
+
+    def _get_cached(self, ticker, now):
+        with self._cache_lock:
+            entry = self._cache.get(ticker)
+            if entry is not None:
+                expires, data = entry
+                if now < expires:
+                    self._cache.move_to_end(ticker)
+                    return data
+                del self._cache[ticker]
+
+        return None
+
+    def _put_cached(self, ticker, now, data):
+        if self.cache_ttl > 0 and self.cache_size > 0:
+            with self._cache_lock:
+                self._cache[ticker] = (now + self.cache_ttl, data)
+                self._cache.move_to_end(ticker)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+    def _get_hist_prices(self, ticker):
+        now = time.monotonic()
+        data = self._get_cached(ticker, now)
+        if data is not None:
+            return data
+
+        # NOTE(steve): the page is fetched outside of the lock so other
+        # tickers aren't held up. Two threads asking for the same ticker
+        # at the same time may both fetch it which is harmless.
+        page = self._get_web_page(ticker)
+        rows = Scraper._get_hist_price_rows(page, ticker)
+        data = _HistPrices(rows)
+        self._put_cached(ticker, now, data)
+
+        return data
+
+    # NOTE(steve): parsing the page is cpu bound so it is run in the
+    # executor to keep the event loop free
+    async def _get_hist_prices_async(self, ticker, executor):
+        now = time.monotonic()
+        data = self._get_cached(ticker, now)
+        if data is not None:
+            return data
+
+        loop = asyncio.get_running_loop()
+        if self.async_transport is not None:
+            page = await self.async_transport.get(self._get_url(ticker))
+        else:
+            page = await loop.run_in_executor(executor, self._get_web_page,
+                                              ticker)
+        rows = await loop.run_in_executor(
+                executor, Scraper._get_hist_price_rows, page, ticker)
+        data = _HistPrices(rows)
+        self._put_cached(ticker, now, data)
+
+        return data
+
+    def clear_cache(self, ticker=None):
+        with self._cache_lock:
+            if ticker is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(ticker, None)
+
     def scrape_equity_data(self, ticker, date):
         date_only = Scraper._normalise_datetime(date)
-        page = Scraper._get_web_page(ticker)
-        data_table = Scraper._get_hist_price_data_table(page, ticker)
+        data = self._get_hist_prices(ticker).get_dates((date_only,))
 
-        for row in data_table.children:
-            values = [col.next_element.text for col in
-                      row.children if col.find('span')]
+        try:
+            return data[date_only]
+        except KeyError:
+            raise InvalidDateError(f'{ticker}: {date}')
 
-            dt = datetime.datetime.strptime(values[0], '%b %d, %Y')
-            values[0] = dt.date()
-            if values[0] == date_only:
-                d = EquityData(*(v.replace(',', '') for v in values[1:]))
-                return d
+    async def scrape_equity_data_async(self, ticker, date, executor=None):
+        """Async version of scrape_equity_data."""
+        date_only = Scraper._normalise_datetime(date)
+        hist_prices = await self._get_hist_prices_async(ticker, executor)
+        data = await asyncio.get_running_loop().run_in_executor(
+                executor, hist_prices.get_dates, (date_only,))
 
-        raise InvalidDateError(f'{ticker}: {date}')
+        try:
+            return data[date_only]
+        except KeyError:
+            raise InvalidDateError(f'{ticker}: {date}')
 
     def scrape_eq_multiple_dates(self, ticker, date_list):
         if date_list is None or len(date_list) == 0:
             raise EmptyDateListError(ticker)
 
         clean_date_list = [Scraper._normalise_datetime(dt) for dt in date_list]
-        page = Scraper._get_web_page(ticker)
-        data_table = Scraper._get_hist_price_data_table(page, ticker)
+        data = self._get_hist_prices(ticker).get_dates(set(clean_date_list))
 
-        data = {}
-        for row in data_table.children:
-            values = [col.next_element.text for col in
-                      row.children if col.find('span')]
+        return Scraper._order_dates(clean_date_list, data)
 
-            dt = datetime.datetime.strptime(values[0], '%b %d, %Y')
-            values[0] = dt.date()
-            if values[0] in clean_date_list:
-                d = EquityData(*(v.replace(',', '') for v in values[1:]))
-                data[values[0]] = (values[0], d)
+    async def scrape_eq_multiple_dates_async(self, ticker, date_list,
+                                             executor=None):
+        """
+        Async version of scrape_eq_multiple_dates. The page is fetched
+        without blocking the event loop and parsed in the executor
+        (defaults to the loop's default executor).
+        """
+        if date_list is None or len(date_list) == 0:
+            raise EmptyDateListError(ticker)
 
-            if len(data) == len(date_list):
-                break
+        clean_date_list = [Scraper._normalise_datetime(dt) for dt in date_list]
+        hist_prices = await self._get_hist_prices_async(ticker, executor)
+        data = await asyncio.get_running_loop().run_in_executor(
+                executor, hist_prices.get_dates, set(clean_date_list))
 
-        # NOTE(steve): we need to order the data based on the
-        # order provided in the input date list
+        return Scraper._order_dates(clean_date_list, data)
+
+    # NOTE(steve): we need to order the data based on the
+    # order provided in the input date list
+    @staticmethod
+    def _order_dates(date_list, data):
         ordered_data = []
         errors = []
-        for date in clean_date_list:
+        for date in date_list:
             if date in data:
-                ordered_data.append(data[date])
+                ordered_data.append((date, data[date]))
             else:
                 errors.append(InvalidDateError(date))
 
         return ordered_data, errors
 
+_MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+           'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+
+def _parse_row_date(value):
+    """Parses dates in the 'Aug 30, 2019' format used by the price table."""
+    # NOTE(steve): strptime is slow and locale dependent so the format is
+    # unpacked by hand and anything unexpected falls back to strptime
+    try:
+        month, day, year = value.split(' ')
+        if day.endswith(','):
+            return datetime.date(int(year), _MONTHS[month], int(day[:-1]))
+    except (KeyError, ValueError):
+        pass
+
+    return datetime.datetime.strptime(value, '%b %d, %Y').date()
+
+class _HistPrices:
+    """
+    Parsed prices for a history page. The table rows are sorted newest to
+    oldest so rows are only parsed as far back as the oldest date that
+    has been asked for.
+    """
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._next_row = 0
+        self._oldest = None
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _parse_until(self, oldest):
+        rows = self._rows
+        while self._next_row < len(rows):
+            if self._oldest is not None and self._oldest <= oldest:
+                break
+
+            row = rows[self._next_row]
+            self._next_row += 1
+            # NOTE(steve): dividend and split rows only have a date and a
+            # description so they are skipped
+            if len(row) != 7:
+                continue
+
+            dt = _parse_row_date(row[0])
+            self._oldest = dt
+            # NOTE(steve): the parsed data is shared by everyone asking
+            # for this page while it is cached so it is frozen
+            if dt not in self._data:
+                d = EquityData(*(v.replace(',', '') for v in row[1:]))
+                self._data[dt] = d.freeze()
+
+    def get_dates(self, dates):
+        """Returns dict of date to equity data for the dates found."""
+        with self._lock:
+            self._parse_until(min(dates))
+
+        data = self._data
+        return {dt: data[dt] for dt in dates if dt in data}
+
+# NOTE(steve): html elements which never have a closing tag
+_VOID_ELEMENTS = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img',
+                            'input', 'link', 'meta', 'param', 'source',
+                            'track', 'wbr'])
+
+class _StopParsing(Exception):
+    pass
+
+class _HistPriceTableParser(HTMLParser):
+    """
+    Pulls the rows out of the historical prices table without building a
+    tree of the whole page. For each row the text of the first child of
+    every cell containing a span is returned, which for price rows is the
+    date, open, high, low, close, adj close and volume. Parsing stops at
+    the end of the table body.
+    """
+
+    def parse(self, page):
+        """Returns list of row tuples or None if the table isn't found."""
+        self._table_depth = 0
+        self._rows = None
+        self._row = None
+        self._in_cell = False
+        try:
+            self.feed(page)
+            self.close()
+        except _StopParsing:
+            pass
+
+        return self._rows
+
+    # NOTE(steve): the first child of a cell is either text or an element.
+    # For an element we keep all the text inside it so we track how deep
+    # we are in the cell and at which depth the first child was opened.
+    def _start_cell(self):
+        self._in_cell = True
+        self._cell_text = ''
+        self._cell_has_span = False
+        self._cell_depth = 0
+        self._first_child_depth = None
+
+    def handle_starttag(self, tag, attrs):
+        if self._table_depth == 0:
+            if tag == 'table' and ('data-test', 'historical-prices') in attrs:
+                self._table_depth = 1
+            return
+
+        if self._in_cell:
+            if tag == 'span':
+                self._cell_has_span = True
+            if tag in _VOID_ELEMENTS:
+                if self._first_child_depth is None:
+                    self._first_child_depth = 0
+            else:
+                self._cell_depth += 1
+                if self._first_child_depth is None:
+                    self._first_child_depth = self._cell_depth
+            return
+
+        if tag == 'table':
+            self._table_depth += 1
+        elif self._table_depth > 1:
+            pass
+        elif tag == 'tbody':
+            self._rows = []
+        elif tag == 'tr' and self._rows is not None:
+            self._row = []
+        elif tag == 'td' and self._row is not None:
+            self._start_cell()
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in _VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self._table_depth == 0:
+            return
+
+        if self._in_cell and tag != 'td':
+            if tag not in _VOID_ELEMENTS and self._cell_depth > 0:
+                if self._first_child_depth == self._cell_depth:
+                    self._first_child_depth = 0
+                self._cell_depth -= 1
+            return
+
+        if tag == 'table':
+            self._table_depth -= 1
+            if self._table_depth == 0:
+                raise _StopParsing()
+        elif self._table_depth > 1:
+            pass
+        elif tag == 'td' and self._in_cell:
+            if self._cell_has_span:
+                self._row.append(self._cell_text)
+            self._in_cell = False
+        elif tag == 'tr' and self._row is not None:
+            self._rows.append(tuple(self._row))
+            self._row = None
+        elif tag == 'tbody' and self._rows is not None:
+            raise _StopParsing()
+
+    def handle_data(self, data):
+        if not self._in_cell:
+            return
+
+        if self._first_child_depth is None:
+            self._cell_text = data
+            self._first_child_depth = 0
+        elif self._first_child_depth > 0:
+            self._cell_text += data
+
 class InvalidSourceError(Exception):
     pass
@@ -0,0 +1,166 @@
+import csv
+import datetime
+
+import numpy as np
+
+from market_data.data import EquityData, PRICE_SCALE
+
+# NOTE(steve): pyarrow is only needed for parquet and arrow snapshots so
+# csv snapshots work without it installed
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+FORMATS = ('parquet', 'arrow', 'csv')
+COLUMNS = ('ticker', 'date', 'open', 'high', 'low', 'close', 'adj_close',
+           'volume')
+PRICE_COLUMNS = COLUMNS[2:7]
+
+# NOTE(steve): number of csv rows read before they are written to the
+# database which bounds the memory used when importing
+CSV_BATCH_SIZE = 10000
+
+def _require_pyarrow(format):
+    if pa is None:
+        raise ImportError(f'pyarrow is required for {format} snapshots')
+
+def _schema():
+    fields = [('ticker', pa.string()), ('date', pa.date32())]
+    fields += [(name, pa.float64()) for name in PRICE_COLUMNS]
+    fields.append(('volume', pa.int64()))
+    return pa.schema(fields)
+
+def _record_batch(ticker, series):
+    """Returns the series (oldest to newest) as an arrow record batch."""
+    series = series[::-1]
+    columns = [pa.array([ticker] * len(series), pa.string()),
+               pa.array(series.dates, pa.date32())]
+    columns += [pa.array(series.prices(name)) for name in PRICE_COLUMNS]
+    columns.append(pa.array(series.volume))
+    return pa.RecordBatch.from_arrays(columns, schema=_schema())
+
+class _ParquetWriter:
+
+    def __init__(self, path):
+        self._writer = pq.ParquetWriter(path, _schema())
+
+    # NOTE(steve): each security is written as its own row group
+    def write(self, ticker, series):
+        batch = _record_batch(ticker, series)
+        self._writer.write_table(pa.Table.from_batches([batch]))
+
+    def close(self):
+        self._writer.close()
+
+class _ArrowWriter:
+
+    def __init__(self, path):
+        self._sink = pa.OSFile(path, 'wb')
+        self._writer = pa.ipc.new_file(self._sink, _schema())
+
+    def write(self, ticker, series):
+        self._writer.write_batch(_record_batch(ticker, series))
+
+    def close(self):
+        self._writer.close()
+        self._sink.close()
+
+class _CsvWriter:
+
+    def __init__(self, path):
+        self._file = open(path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(COLUMNS)
+
+    def write(self, ticker, series):
+        for dt, data in series[::-1]:
+            self._writer.writerow((ticker, dt.strftime('%Y-%m-%d'), data.open,
+                                   data.high, data.low, data.close,
+                                   data.adj_close, data.volume))
+
+    def close(self):
+        self._file.close()
+
+def open_writer(path, format):
+    """
+    Returns a writer for a snapshot file. Call write(ticker, series) for
+    each security and then close().
+    """
+    if format not in FORMATS:
+        raise InvalidFormatError(format)
+
+    if format == 'csv':
+        return _CsvWriter(path)
+
+    _require_pyarrow(format)
+    if format == 'parquet':
+        return _ParquetWriter(path)
+    return _ArrowWriter(path)
+
+def _rows_from_batch(batch):
+    """Returns list of (ticker, list of (date, equity_data)) in a batch."""
+    tickers = batch.column('ticker').to_pylist()
+    dates = batch.column('date').to_pylist()
+    fixed = [np.rint(batch.column(name).to_numpy() * PRICE_SCALE)
+             .astype(np.int64).tolist() for name in PRICE_COLUMNS]
+    fixed.append(batch.column('volume').to_pylist())
+
+    rows = {}
+    for i, ticker in enumerate(tickers):
+        dt = dates[i]
+        data = EquityData.from_fixed(*(c[i] for c in fixed))
+        rows.setdefault(ticker, []).append(
+                (datetime.datetime(dt.year, dt.month, dt.day), data))
+
+    return list(rows.items())
+
+def _read_parquet(path):
+    parquet_file = pq.ParquetFile(path)
+    for i in range(parquet_file.num_row_groups):
+        yield from _rows_from_batch(parquet_file.read_row_group(i))
+
+def _read_arrow(path):
+    with pa.memory_map(path, 'r') as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            yield from _rows_from_batch(reader.get_batch(i))
+
+def _read_csv(path):
+    with open(path, 'r', newline='') as f:
+        reader = csv.DictReader(f)
+        rows = {}
+        count = 0
+        for row in reader:
+            dt = datetime.datetime.strptime(row['date'], '%Y-%m-%d')
+            data = EquityData(*(row[name] for name in COLUMNS[2:]))
+            rows.setdefault(row['ticker'], []).append((dt, data))
+            count += 1
+            if count >= CSV_BATCH_SIZE:
+                yield from rows.items()
+                rows = {}
+                count = 0
+
+        yield from rows.items()
+
+def read_snapshot(path, format):
+    """
+    Yields (ticker, list of (date, equity_data)) from a snapshot file a
+    row group, record batch or CSV_BATCH_SIZE rows at a time. A security
+    may be yielded more than once.
+    """
+    if format not in FORMATS:
+        raise InvalidFormatError(format)
+
+    if format == 'csv':
+        return _read_csv(path)
+
+    _require_pyarrow(format)
+    if format == 'parquet':
+        return _read_parquet(path)
+    return _read_arrow(path)
+
+class InvalidFormatError(Exception):
+    pass
@@ -2,11 +2,14 @@ import os
 import datetime
 from decimal import Decimal
 import sqlite3
+import threading
+import weakref
 
 import freezegun
 
 import market_data.data_adapter as data_adapter
-from market_data.data import EquityData, InvalidTickerError, InvalidDateError
+from market_data.data import FrozenEquityData, EquitySeries, PRICE_SCALE
+from market_data.data import InvalidTickerError, InvalidDateError
 
 def adapt_date(dt):
     return dt.strftime('%Y-%m-%d')
@@ -19,11 +22,55 @@ sqlite3.register_converter("decimal", lambda d: Decimal(d.decode('utf-8')))
 # to string for the sqlite3 database so we explicit convert it
 sqlite3.register_adapter(freezegun.api.FakeDatetime, adapt_date)
 sqlite3.register_adapter(datetime.datetime, adapt_date)
+sqlite3.register_adapter(datetime.date, adapt_date)
 sqlite3.register_converter("date",
         lambda dt: datetime.datetime.strptime(dt.decode('utf-8'), '%Y-%m-%d'))
 
+# NOTE(steve): connection settings applied as pragmas when connecting.
+# The default profile keeps sqlite's defaults: a rollback journal with a
+# full fsync on every commit and readers blocked while a write commits.
+#
+# The performance profile uses write ahead logging so readers (including
+# other processes) carry on while a write commits, and with synchronous
+# NORMAL commits don't wait on fsync. The trade-off is durability:
+# commits made just before a power loss or os crash may be lost, though
+# the database is never corrupted and an application crash loses
+# nothing. Missing dates are fetched again on the next update so this
+# is a good fit for the price data. WAL needs the database on a local
+# file system and leaves -wal and -shm files next to it while in use.
+PROFILES = {
+    'default': {},
+    'performance': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -64 * 1024,           # KiB i.e. 64MiB of pages
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    },
+}
+
+_PRAGMAS = ('journal_mode', 'synchronous', 'cache_size', 'mmap_size',
+            'temp_store', 'busy_timeout')
+
+# NOTE(steve): a pooled adapter keeps each thread's reader connection in
+# one of these on a thread local. The thread local drops it when the
+# thread ends which closes the connection so threads that come and go
+# don't leave connections behind.
+class _Reader:
+
+    def __init__(self, conn, readers, lock):
+        self.conn = conn
+        weakref.finalize(self, _release_reader, conn, readers, lock)
+
+def _release_reader(conn, readers, lock):
+    with lock:
+        if conn in readers:
+            readers.remove(conn)
+    conn.close()
+
 class Sqlite3DataAdapter(data_adapter.DataAdapter):
     test_database = 'test.db'
+    profile = 'default'
 
     @classmethod
     def create_test_database(cls):
@@ -33,6 +80,9 @@ class Sqlite3DataAdapter(data_adapter.DataAdapter):
     def delete_test_database(cls):
         if os.path.isfile(cls.test_database):
             os.remove(cls.test_database)
+            for suffix in ('-wal', '-shm'):
+                if os.path.isfile(cls.test_database + suffix):
+                    os.remove(cls.test_database + suffix)
         else:
             raise data_adapter.DatabaseNotFoundError
 
@@ -69,100 +119,241 @@ class Sqlite3DataAdapter(data_adapter.DataAdapter):
                                         );"""
                 cursor.execute(equity_data_sql)
 
+            cls._migrate(conn)
+
         except sqlite3.Error as e:
             print(e)
         finally:
             if conn is not None:
                 conn.close()
 
+    # NOTE(steve): schema changes made after the first release. The
+    # position in the list is the schema version stored in the
+    # database's user_version so existing databases are brought up
+    # to date when they are opened.
+    _migrations = [
+        # NOTE(steve): covering index so that series reads are returned
+        # newest to oldest straight from the index
+        """CREATE INDEX IF NOT EXISTS equity_prices_ticker_date_idx
+            ON equity_prices(ticker_id, date DESC, open, high, low,
+                             close, adj_close, volume);""",
+    ]
+
     @classmethod
-    def connect(cls, conn_string):
+    def _migrate(cls, conn):
+        sql = """SELECT name FROM sqlite_master
+                    WHERE type = 'table' AND name = 'equity_prices'"""
+        if conn.execute(sql).fetchone() is None:
+            return
+
+        # NOTE(steve): nothing is written when the schema is up to date so
+        # connecting doesn't take a write lock or change the file
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version >= len(cls._migrations):
+            return
+
+        with conn:
+            for migration in cls._migrations[version:]:
+                conn.execute(migration)
+            conn.execute(f'PRAGMA user_version = {len(cls._migrations)}')
+
+    # NOTE(steve): profile is the name of one of PROFILES or a dict of
+    # pragmas and defaults to the class's profile. A pooled adapter can be
+    # shared between threads: each thread reads through its own connection
+    # and writes go through a single writer connection one at a time. It
+    # is best used with WAL (the performance profile) so reads aren't
+    # blocked by writes.
+    @classmethod
+    def connect(cls, conn_string, profile=None, pooled=False):
         if not os.path.isfile(conn_string):
             raise data_adapter.DatabaseNotFoundError
 
-        return cls(conn_string)
+        return cls(conn_string, profile=profile, pooled=pooled)
 
-    def __init__(self, conn_string):
+    def __init__(self, conn_string, profile=None, pooled=False):
         self.conn_string = conn_string
-        self._conn = sqlite3.connect(self.conn_string,
-                                    detect_types=sqlite3.PARSE_DECLTYPES)
-        self._conn.execute('PRAGMA foreign_keys = ON')
-
-    # TODO(steve): should this be a decorator???
-    def _check_is_valid_security(self, security):
-        tickers = self.get_securities_list()
-        if security not in tickers:
-            raise InvalidTickerError(security)
-
+        self.pooled = pooled
+        self._profile = self.profile if profile is None else profile
+        self._conn = self._open_connection()
+        Sqlite3DataAdapter._migrate(self._conn)
+        self._security_ids = None
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+
+    def _open_connection(self):
+        # NOTE(steve): pooled connections are closed by whichever thread
+        # closes the adapter so they can't be tied to the thread that
+        # opened them. Each is still only used by one thread at a time.
+        conn = sqlite3.connect(self.conn_string,
+                               detect_types=sqlite3.PARSE_DECLTYPES,
+                               check_same_thread=not self.pooled)
+        conn.execute('PRAGMA foreign_keys = ON')
+        Sqlite3DataAdapter._apply_profile(conn, self._profile)
+        return conn
+
+    @staticmethod
+    def _apply_profile(conn, profile):
+        if isinstance(profile, str):
+            if profile not in PROFILES:
+                raise InvalidProfileError(profile)
+            profile = PROFILES[profile]
+
+        for name, value in profile.items():
+            if name not in _PRAGMAS:
+                raise InvalidProfileError(name)
+            if isinstance(value, str) and not value.isalnum():
+                raise InvalidProfileError(f'{name} = {value}')
+            conn.execute(f'PRAGMA {name} = {value}').fetchall()
+
+    # NOTE(steve): a thread's connection is kept until the thread ends or
+    # the adapter is closed so pooled adapters suit long lived threads
+    # e.g. a server's worker threads
+    def _reader(self):
+        """Returns the connection for reads by the calling thread."""
+        if not self.pooled:
+            return self._conn
+
+        reader = getattr(self._local, 'reader', None)
+        if reader is None:
+            conn = self._open_connection()
+            with self._readers_lock:
+                if self._conn is None:
+                    conn.close()
+                    raise sqlite3.ProgrammingError(
+                            'Cannot operate on a closed database.')
+                self._readers.append(conn)
+            reader = _Reader(conn, self._readers, self._readers_lock)
+            self._local.reader = reader
+
+        return reader.conn
+
+    def get_pragma(self, name):
+        """Returns the current value of a connection setting."""
+        if name not in _PRAGMAS:
+            raise InvalidProfileError(name)
+        return self._reader().execute(f'PRAGMA {name}').fetchone()[0]
+
+    # NOTE(steve): the ticker to id cache is filled on first use rather
+    # than in the constructor so that connecting to a file which does
+    # not have the tables yet doesn't fail
+    def _get_security_ids(self):
+        if self._security_ids is None:
+            rows = self._reader().execute('SELECT ticker, id FROM securities')
+            self._security_ids = dict(rows.fetchall())
+        return self._security_ids
+
+    # NOTE(steve): the ticker to id lookup doubles as the check that the
+    # security is valid. If the ticker isn't cached another process may
+    # have added it so we check the database before raising an error.
     def _get_security_id(self, security):
-        with self._conn:
-            sql = "SELECT id FROM securities WHERE ticker = ?"
-            cursor = self._conn.cursor()
-            cursor.execute(sql, (security,))
-            ticker_id = cursor.fetchone()[0]
+        security_ids = self._get_security_ids()
+        try:
+            return security_ids[security]
+        except KeyError:
+            pass
+
+        sql = "SELECT id FROM securities WHERE ticker = ?"
+        row = self._reader().execute(sql, (security,)).fetchone()
+        if row is None:
+            raise InvalidTickerError(security)
 
-        return ticker_id
+        security_ids[security] = row[0]
+        return row[0]
 
     def close(self):
-        if self._conn is not None:
-            self._conn.close()
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
 
     def get_securities_list(self):
-        with self._conn:
-            cursor = self._conn.cursor()
+        conn = self._reader()
+        with conn:
+            cursor = conn.cursor()
             cursor.execute('SELECT ticker FROM securities')
             rows = cursor.fetchall()
         return [row[0] for row in rows]
 
     def insert_securities(self, securities_to_add):
+        security_ids = self._get_security_ids()
         sql = 'INSERT INTO securities(ticker) VALUES(?)'
-        with self._conn:
+        new_ids = {}
+        with self._write_lock, self._conn:
             cursor = self._conn.cursor()
             for security in securities_to_add:
                 try:
                     cursor.execute(sql, (security,))
+                    new_ids[security] = cursor.lastrowid
                 except sqlite3.IntegrityError:
                     pass
 
-    def update_market_data(self, security, equity_data):
-        self._check_is_valid_security(security)
-
-        ticker_id = self._get_security_id(security)
-        date, data = equity_data[0], equity_data[1]
+        security_ids.update(new_ids)
 
-        with self._conn:
-            sql = """REPLACE INTO equity_prices(ticker_id, date, open,
+    def update_market_data(self, security, equity_data):
+        self.bulk_update_market_data(security, [equity_data])
+
+    # NOTE(steve): bulk updates are staged in a temporary table and merged
+    # into equity_prices with a single statement. Each row is staged as
+    # the day number of its date and its fixed point prices, which are
+    # much cheaper to bind than date strings and Decimals, and sqlite
+    # turns them back into the date and prices in the merge. Dividing in
+    # sqlite gives the same floats as dividing in python so the same
+    # numbers are stored. Rows are merged in the order given so later
+    # rows for the same date replace earlier ones.
+    _staging_sql = """CREATE TEMP TABLE IF NOT EXISTS equity_prices_staging(
+                        day integer, open integer, high integer,
+                        low integer, close integer, adj_close integer,
+                        volume integer)"""
+    _merge_sql = f"""INSERT INTO equity_prices(ticker_id, date, open,
                         high, low, close, adj_close, volume)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
-            cursor = self._conn.cursor()
-            cursor.execute(sql, (ticker_id, date, data.open, data.high,
-                                 data.low, data.close, data.adj_close,
-                                 data.volume))
+                    SELECT ?, date(day + 1721424.5),
+                        open / {PRICE_SCALE}.0, high / {PRICE_SCALE}.0,
+                        low / {PRICE_SCALE}.0, close / {PRICE_SCALE}.0,
+                        adj_close / {PRICE_SCALE}.0, volume
+                    FROM temp.equity_prices_staging WHERE true
+                    ORDER BY rowid
+                    ON CONFLICT(ticker_id, date) DO UPDATE SET
+                        open = excluded.open, high = excluded.high,
+                        low = excluded.low, close = excluded.close,
+                        adj_close = excluded.adj_close,
+                        volume = excluded.volume"""
 
     def bulk_update_market_data(self, security, equity_data):
-        self._check_is_valid_security(security)
-
         ticker_id = self._get_security_id(security)
 
-        # TODO(steve): find a more efficient way to update the database
-        # instead of updating rows one by one
-        with self._conn:
-            for d in equity_data:
-                date, data = d[0], d[1]
-                sql = """REPLACE INTO equity_prices(ticker_id, date, open,
-                            high, low, close, adj_close, volume)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
-                cursor = self._conn.cursor()
-                cursor.execute(sql, (ticker_id, date, data.open, data.high,
-                                     data.low, data.close, data.adj_close,
-                                     data.volume))
+        sql = """INSERT INTO temp.equity_prices_staging
+                    VALUES (?, ?, ?, ?, ?, ?, ?)"""
+        with self._write_lock, self._conn:
+            self._conn.execute(self._staging_sql)
+            self._conn.executemany(sql, (
+                    (date.toordinal(), ) + data.to_fixed()
+                    for date, data in equity_data))
+            self._conn.execute(self._merge_sql, (ticker_id, ))
+            self._conn.execute('DELETE FROM temp.equity_prices_staging')
+
+    # NOTE(steve): prices are read as fixed point integers so that no
+    # Decimal objects are created for each row. Series also read the
+    # date as a string rather than a datetime object.
+    _price_columns = f"""CAST(ROUND(open * {PRICE_SCALE}) AS INTEGER),
+                    CAST(ROUND(high * {PRICE_SCALE}) AS INTEGER),
+                    CAST(ROUND(low * {PRICE_SCALE}) AS INTEGER),
+                    CAST(ROUND(close * {PRICE_SCALE}) AS INTEGER),
+                    CAST(ROUND(adj_close * {PRICE_SCALE}) AS INTEGER),
+                    volume"""
+    _series_columns = f"""CAST(date AS TEXT), {_price_columns}"""
 
     def _get_equity_data(self, ticker_id, date):
-        with self._conn:
-            sql = """SELECT open, high, low, close, adj_close, volume
+        conn = self._reader()
+        with conn:
+            sql = f"""SELECT {self._price_columns}
                         FROM equity_prices WHERE (ticker_id = ? and
                         date = ?)"""
-            cursor = self._conn.cursor()
+            cursor = conn.cursor()
             cursor.execute(sql, (ticker_id, date))
 
             rows = cursor.fetchall()
@@ -170,30 +361,142 @@ class Sqlite3DataAdapter(data_adapter.DataAdapter):
         return rows
 
     def get_equity_data(self, security, date):
-        self._check_is_valid_security(security)
-
         ticker_id = self._get_security_id(security)
 
         rows = self._get_equity_data(ticker_id, date)
         if len(rows) == 0:
             raise InvalidDateError(date)
         elif len(rows) == 1:
-            data = EquityData(*rows[0])
+            data = FrozenEquityData.from_fixed(*rows[0])
             return data
 
-    def get_equity_data_series(self, security):
-        self._check_is_valid_security(security)
+    # NOTE(steve): the pairs are joined against securities and prices in
+    # a single query per batch. Older sqlite builds allow at most 999
+    # variables in a statement and each pair takes three.
+    _max_pairs = 333
+
+    def get_equity_data_many(self, pairs):
+        pairs = list(pairs)
+        conn = self._reader()
+        found = {}
+        errors = []
+        for start in range(0, len(pairs), self._max_pairs):
+            batch = pairs[start:start + self._max_pairs]
+            values = ', '.join(['(?, ?, ?)'] * len(batch))
+            sql = f"""WITH wanted(i, ticker, date) AS (VALUES {values})
+                        SELECT wanted.i, securities.id, {self._price_columns}
+                        FROM wanted
+                        LEFT JOIN securities
+                            ON securities.ticker = wanted.ticker
+                        LEFT JOIN equity_prices
+                            ON equity_prices.ticker_id = securities.id
+                            AND equity_prices.date = wanted.date"""
+            params = [value for i, (security, dt) in enumerate(batch)
+                      for value in (i, security, dt)]
+
+            with conn:
+                rows = conn.execute(sql, params).fetchall()
+
+            for i, ticker_id, *prices in rows:
+                security, dt = batch[i]
+                if ticker_id is None:
+                    errors.append(InvalidTickerError(security))
+                elif prices[0] is None:
+                    errors.append(InvalidDateError(dt))
+                else:
+                    found[(security, dt)] = FrozenEquityData.from_fixed(
+                            *prices)
+
+        return found, errors
 
+    @staticmethod
+    def _series_from_cursor(cursor):
+        return EquitySeries(*zip(*cursor.fetchall()))
+
+    def get_equity_data_series(self, security):
         ticker_id = self._get_security_id(security)
 
-        with self._conn:
-            sql = """SELECT date, open, high, low, close, adj_close, volume
-                        FROM equity_prices WHERE (ticker_id = ?)"""
+        conn = self._reader()
+        with conn:
+            sql = f"""SELECT {self._series_columns}
+                        FROM equity_prices WHERE (ticker_id = ?)
+                        ORDER BY date DESC"""
 
-            cursor = self._conn.cursor()
+            cursor = conn.cursor()
             cursor.execute(sql, (ticker_id,))
+
+            return self._series_from_cursor(cursor)
+
+    # NOTE(steve): rows are fetched from the cursor a chunk at a time in
+    # index order so nothing is sorted or held in memory up front
+    def iter_equity_data_series(self, security, chunk_size):
+        ticker_id = self._get_security_id(security)
+
+        sql = f"""SELECT {self._series_columns}
+                    FROM equity_prices WHERE (ticker_id = ?)
+                    ORDER BY date DESC"""
+        cursor = self._reader().cursor()
+        cursor.execute(sql, (ticker_id,))
+
+        def chunks():
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if len(rows) == 0:
+                        break
+                    yield EquitySeries(*zip(*rows))
+            finally:
+                cursor.close()
+
+        return chunks()
+
+    def get_equity_data_range(self, security, start, end):
+        ticker_id = self._get_security_id(security)
+
+        conn = self._reader()
+        with conn:
+            sql = f"""SELECT {self._series_columns}
+                        FROM equity_prices WHERE (ticker_id = ? and
+                        date BETWEEN ? AND ?)
+                        ORDER BY date DESC"""
+
+            cursor = conn.cursor()
+            cursor.execute(sql, (ticker_id, start, end))
+
+            return self._series_from_cursor(cursor)
+
+    def get_last_n(self, security, n):
+        ticker_id = self._get_security_id(security)
+
+        conn = self._reader()
+        with conn:
+            sql = f"""SELECT {self._series_columns}
+                        FROM equity_prices WHERE (ticker_id = ?)
+                        ORDER BY date DESC LIMIT ?"""
+
+            cursor = conn.cursor()
+            cursor.execute(sql, (ticker_id, max(n, 0)))
+
+            return self._series_from_cursor(cursor)
+
+    # NOTE(steve): a single query for all securities. A correlated MAX
+    # lets sqlite seek to the last date of each ticker in the (ticker_id,
+    # date) index whereas a LEFT JOIN ... GROUP BY scans every price row
+    # (~0.3s vs ~4ms for 1000 tickers with 1000 dates each).
+    def get_latest_dates(self):
+        conn = self._reader()
+        with conn:
+            sql = """SELECT ticker, (SELECT MAX(date) FROM equity_prices
+                        WHERE ticker_id = securities.id)
+                        FROM securities"""
+
+            cursor = conn.cursor()
+            cursor.execute(sql)
             rows = cursor.fetchall()
 
-            data = [(row[0], EquityData(*row[1:])) for row in rows]
+        return {ticker: None if dt is None else
+                datetime.datetime.strptime(dt, '%Y-%m-%d')
+                for ticker, dt in rows}
 
-            return sorted(data, reverse=True)
+class InvalidProfileError(Exception):
+    pass
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import inspect
+file_path = os.path.dirname(inspect.getfile(inspect.currentframe()))
+sys.path.insert(0, os.path.split(os.path.split(file_path)[0])[0])
+
+import unittest
+from unittest.mock import patch
+import asyncio
+import datetime
+import threading
+
+from parameterized import parameterized_class
+
+from market_data.async_market_data import AsyncMarketData
+from market_data.market_data import MarketData, NotInitialisedError
+from market_data.data import InvalidTickerError
+import market_data.data_adapter as data_adapter
+import market_data.tests.utils as test_utils
+
+def load_page():
+    with open('market_data/tests/amzn_scrape_test_data.html', 'rb') as f:
+        return f.read()
+
+@parameterized_class(('data_adapter_source', ),[
+    [data_adapter.DataAdapterSource.JSON, ],
+    [data_adapter.DataAdapterSource.SQLITE3, ],
+    [data_adapter.DataAdapterSource.COLUMNAR, ]
+])
+class AsyncMarketDataTests(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.da = data_adapter.get_adapter(self.data_adapter_source)
+        self.da.create_test_database()
+        self.database = MarketData.Database(self.da.test_database,
+                                            self.data_adapter_source)
+
+        self.transport = test_utils.AsyncStubTransport(load_page())
+        self.app = AsyncMarketData(max_workers=4)
+        await self.app.run(self.database, async_transport=self.transport)
+        self.dates = [datetime.datetime(2019, 8, 27),
+                      datetime.datetime(2019, 8, 26),
+                      datetime.datetime(2019, 8, 23)]
+
+    async def asyncTearDown(self):
+        if self.app._init:
+            await self.app.close()
+        try:
+            self.da.delete_test_database()
+        except:
+            pass
+
+    async def test_not_initialised_before_run(self):
+        app = AsyncMarketData()
+        with self.assertRaises(NotInitialisedError):
+            await app.get_securities_list()
+
+    async def test_bulk_update_and_read(self):
+        await self.app.add_security('AMZN')
+
+        errors = await self.app.bulk_update_market_data('AMZN', self.dates)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.transport.urls), 1)
+
+        series = await self.app.get_equity_data_series('AMZN')
+        self.assertEqual([dt for dt, _ in series], self.dates)
+
+        data = await self.app.get_equity_data('AMZN', self.dates[1])
+        self.assertEqual(data, series[1][1])
+        self.assertEqual(await self.app.get_last_n('AMZN', 1), series[:1])
+        dt, latest = await self.app.get_latest_equity_data('AMZN')
+        self.assertEqual((dt, latest), series[0])
+
+    async def test_update_market_data(self):
+        await self.app.add_security('AMZN')
+
+        await self.app.update_market_data('AMZN', self.dates[0])
+
+        series = await self.app.get_equity_data_range('AMZN', self.dates[2],
+                                                      self.dates[0])
+        self.assertEqual([dt for dt, _ in series], self.dates[:1])
+
+    async def test_update_invalid_ticker_error(self):
+        with self.assertRaises(InvalidTickerError):
+            await self.app.update_market_data('AMZN', self.dates[0])
+        self.assertEqual(self.transport.urls, [])
+
+    async def test_concurrent_reads(self):
+        await self.app.add_security('AMZN')
+        await self.app.bulk_update_market_data('AMZN', self.dates)
+
+        results = await asyncio.gather(
+                *(self.app.get_equity_data('AMZN', self.dates[i % 3])
+                  for i in range(200)))
+
+        self.assertEqual(len(results), 200)
+        data, errors = await self.app.get_cross_section(['AMZN', 'GOOG'],
+                                                        self.dates[0])
+        self.assertEqual(data, {'AMZN': results[0]})
+        self.assertEqual(len(errors), 1)
+
+    async def test_update_all(self):
+        for ticker in ('AMZN', 'GOOG'):
+            await self.app.add_security(ticker)
+        plan = [MarketData.UpdatePlan('AMZN', self.dates),
+                MarketData.UpdatePlan('GOOG', self.dates[:1])]
+        pages = {'AMZN': load_page()}
+
+        async def get(url):
+            self.transport.urls.append(url)
+            return pages.get(url.split('/')[4], b'').decode('utf-8')
+        self.transport.get = get
+
+        with patch.object(MarketData, 'plan_updates', autospec=True,
+                          return_value=(plan, [])):
+            results = await self.app.update_all()
+
+        self.assertEqual(results['AMZN'].dates,
+                         [dt.date() for dt in self.dates])
+        self.assertEqual(results['AMZN'].errors, [])
+        self.assertEqual(results['GOOG'].dates, [])
+        self.assertIsInstance(results['GOOG'].errors[0], InvalidTickerError)
+        self.assertEqual(len(await self.app.get_equity_data_series('AMZN')),
+                         3)
+
+    async def test_close(self):
+        await self.app.close()
+
+        with self.assertRaises(NotInitialisedError):
+            await self.app.get_securities_list()
+
+    async def test_reads_run_on_threads_that_can_use_the_database(self):
+        def thread_name():
+            return threading.current_thread().name
+        name = await self.app._read(thread_name)
+        if self.data_adapter_source == data_adapter.DataAdapterSource.SQLITE3:
+            self.assertTrue(name.startswith('market_data_write'))
+
+            await self.app.close()
+            await self.app.run(self.database, async_transport=self.transport,
+                               connect_options={'pooled': True})
+            name = await self.app._read(thread_name)
+
+        self.assertTrue(name.startswith('market_data_read'))
+
+    # NOTE(steve): the reads are held until after close has started so
+    # they only finish if close waits for them without blocking the loop
+    async def test_close_waits_for_running_reads(self):
+        await self.app.add_security('AMZN')
+        await self.app.bulk_update_market_data('AMZN', self.dates)
+        release = threading.Event()
+        def read():
+            release.wait(5)
+            return self.app._app.get_equity_data_series('AMZN')
+        reads = [asyncio.ensure_future(self.app._read(read))
+                 for _ in range(6)]
+        await asyncio.sleep(0)
+        asyncio.get_running_loop().call_later(0.1, release.set)
+
+        await self.app.close()
+
+        self.assertTrue(release.is_set())
+        for series in await asyncio.gather(*reads):
+            self.assertEqual([dt for dt, _ in series], self.dates)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import inspect
+file_path = os.path.dirname(inspect.getfile(inspect.currentframe()))
+sys.path.insert(0, os.path.split(os.path.split(file_path)[0])[0])
+
+import unittest
+import datetime
+
+from parameterized import parameterized_class
+
+import market_data.data_adapter as data_adapter
+from market_data.caching_data_adapter import CachingDataAdapter
+from market_data.data import EquityData, InvalidTickerError
+
+def make_data(n):
+    start = datetime.datetime(2019, 8, 1)
+    return [(start + datetime.timedelta(days=i),
+             EquityData(f'{100 + i}.00', '101.00', '99.00', '100.50',
+                        '100.50', 1000 + i)) for i in range(n)]
+
+@parameterized_class(('data_adapter_source', ),[
+    [data_adapter.DataAdapterSource.JSON, ],
+    [data_adapter.DataAdapterSource.SQLITE3, ],
+    [data_adapter.DataAdapterSource.COLUMNAR, ]
+])
+class CachingDataAdapterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.da = data_adapter.get_adapter(self.data_adapter_source)
+        self.da.create_test_database()
+        self.database = CachingDataAdapter(
+                self.da.connect(self.da.test_database), cache_size=8)
+        self.database.insert_securities(['AMZN', 'GOOG'])
+        self.data = make_data(10)
+        self.database.bulk_update_market_data('AMZN', self.data)
+        self.database.bulk_update_market_data('GOOG', self.data)
+
+    def tearDown(self):
+        self.database.close()
+        try:
+            self.da.delete_test_database()
+        except:
+            pass
+
+    def test_repeated_reads_are_hits(self):
+        dt, expected = self.data[3]
+        for _ in range(3):
+            self.assertEqual(self.database.get_equity_data('AMZN', dt),
+                             expected)
+            self.assertEqual(self.database.get_last_n('AMZN', 1),
+                             self.data[-1:])
+
+        stats = self.database.stats()
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['hits'], 4)
+
+    def test_date_and_datetime_share_entry(self):
+        dt, expected = self.data[3]
+        self.database.get_equity_data('AMZN', dt)
+        self.assertEqual(self.database.get_equity_data('AMZN', dt.date()),
+                         expected)
+        self.assertEqual(self.database.hits, 1)
+
+    def test_update_invalidates_only_affected_entries(self):
+        dt, _ = self.data[3]
+        other_dt, other_data = self.data[7]
+        self.database.get_equity_data('AMZN', dt)
+        self.database.get_equity_data('AMZN', other_dt)
+        self.database.get_equity_data_range('AMZN', self.data[0][0],
+                                            self.data[1][0])
+        self.database.get_equity_data('GOOG', dt)
+
+        new_data = EquityData('1.00', '2.00', '0.50', '1.50', '1.50', 7)
+        self.database.update_market_data('AMZN', (dt, new_data))
+        misses = self.database.misses
+
+        self.assertEqual(self.database.get_equity_data('AMZN', dt), new_data)
+        self.assertEqual(self.database.misses, misses + 1)
+
+        self.assertEqual(self.database.get_equity_data('AMZN', other_dt),
+                         other_data)
+        self.database.get_equity_data_range('AMZN', self.data[0][0],
+                                            self.data[1][0])
+        self.database.get_equity_data('GOOG', dt)
+        self.assertEqual(self.database.misses, misses + 1)
+
+    def test_new_dates_invalidate_series(self):
+        self.assertEqual(len(self.database.get_equity_data_series('AMZN')), 10)
+        self.database.get_latest_dates()
+
+        new_dt = self.data[-1][0] + datetime.timedelta(days=1)
+        new_data = EquityData('1.00', '2.00', '0.50', '1.50', '1.50', 7)
+        self.database.bulk_update_market_data('AMZN', [(new_dt, new_data)])
+
+        series = self.database.get_equity_data_series('AMZN')
+        self.assertEqual(series[0], (new_dt, new_data))
+        self.assertEqual(self.database.get_latest_dates()['AMZN'], new_dt)
+
+    def test_insert_securities_invalidates_list(self):
+        self.assertEqual(self.database.get_securities_list(),
+                         ['AMZN', 'GOOG'])
+        self.database.insert_securities(['MSFT'])
+        self.assertEqual(self.database.get_securities_list(),
+                         ['AMZN', 'GOOG', 'MSFT'])
+
+    def test_least_recently_used_evicted(self):
+        for dt, _ in self.data[:8]:
+            self.database.get_equity_data('AMZN', dt)
+        self.database.get_equity_data('AMZN', self.data[0][0])
+
+        self.database.get_equity_data('GOOG', self.data[0][0])
+        self.assertEqual(self.database.evictions, 1)
+
+        misses = self.database.misses
+        self.database.get_equity_data('AMZN', self.data[0][0])
+        self.assertEqual(self.database.misses, misses)
+        self.database.get_equity_data('AMZN', self.data[1][0])
+        self.assertEqual(self.database.misses, misses + 1)
+
+    def test_get_equity_data_many_reads_only_missing_pairs(self):
+        self.database.get_equity_data('AMZN', self.data[0][0])
+        pairs = [('AMZN', dt) for dt, _ in self.data[:3]]
+
+        data, errors = self.database.get_equity_data_many(pairs)
+        self.assertEqual(data, {('AMZN', dt): d for dt, d in self.data[:3]})
+        self.assertEqual(errors, [])
+        self.assertEqual(self.database.hits, 1)
+
+        self.database.get_equity_data_many(pairs)
+        self.assertEqual(self.database.hits, 4)
+        self.assertEqual(self.database.misses, 3)
+
+    def test_cached_series_read_only(self):
+        series = self.database.get_equity_data_series('AMZN')
+        with self.assertRaises(ValueError):
+            series.close[0] = 0
+
+    def test_cached_equity_data_read_only(self):
+        dt, expected = self.data[3]
+        data = self.database.get_equity_data('AMZN', dt)
+        with self.assertRaises(AttributeError):
+            data.close = '999'
+
+        found, _ = self.database.get_equity_data_many([('AMZN', dt),
+                                                       ('GOOG', dt)])
+        for data in found.values():
+            with self.assertRaises(AttributeError):
+                data.volume = 0
+
+        self.assertEqual(self.database.get_equity_data('AMZN', dt), expected)
+        self.assertEqual(self.database.get_equity_data('GOOG', dt), expected)
+
+    def test_errors_not_cached(self):
+        with self.assertRaises(InvalidTickerError):
+            self.database.get_equity_data_series('MSFT')
+        self.database.insert_securities(['MSFT'])
+        self.assertEqual(len(self.database.get_equity_data_series('MSFT')), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import inspect
+file_path = os.path.dirname(inspect.getfile(inspect.currentframe()))
+sys.path.insert(0, os.path.split(os.path.split(file_path)[0])[0])
+
+import unittest
+import datetime
+
+import numpy as np
+
+from market_data.columnar_data_adapter import ColumnarDataAdapter
+from market_data.columnar_data_adapter import _INITIAL_CAPACITY
+from market_data.data import EquityData
+
+def make_data(start, n):
+    data = []
+    for i in range(n):
+        dt = start + datetime.timedelta(days=i)
+        data.append((dt, EquityData(f'{100 + i}.25', '101.50', '99.75',
+                                    '100.10', '100.10', 1000 + i)))
+    return data
+
+class ColumnarDataAdapterTests(unittest.TestCase):
+
+    def setUp(self):
+        ColumnarDataAdapter.create_test_database()
+        self.database = ColumnarDataAdapter.connect(
+                ColumnarDataAdapter.test_database)
+        self.database.insert_securities(['AMZN'])
+        self.start = datetime.datetime(2019, 1, 1)
+
+    def tearDown(self):
+        self.database.close()
+        try:
+            ColumnarDataAdapter.delete_test_database()
+        except:
+            pass
+
+    def security_path(self):
+        return self.database._get_file('AMZN').path
+
+    def test_series_is_view_of_mapped_file(self):
+        self.database.bulk_update_market_data('AMZN',
+                                              make_data(self.start, 10))
+
+        series = self.database.get_equity_data_series('AMZN')
+        data = self.database._get_file('AMZN').get_map()
+
+        for column in series._columns():
+            self.assertTrue(np.shares_memory(column, data))
+        self.assertEqual(series[0][0], self.start + datetime.timedelta(9))
+
+    def test_series_is_read_only(self):
+        expected = make_data(self.start, 10)
+        self.database.bulk_update_market_data('AMZN', expected)
+
+        series = self.database.get_equity_data_series('AMZN')
+        for column in series._columns():
+            with self.assertRaises(ValueError):
+                column[0] = 0
+
+        self.assertEqual(self.database.get_equity_data_series('AMZN'),
+                         expected[::-1])
+
+    def test_appends_written_in_place(self):
+        self.database.bulk_update_market_data('AMZN',
+                                              make_data(self.start, 10))
+        inode = os.stat(self.security_path()).st_ino
+
+        for dt, data in make_data(self.start + datetime.timedelta(10), 5):
+            self.database.update_market_data('AMZN', (dt, data))
+
+        self.assertEqual(os.stat(self.security_path()).st_ino, inode)
+        self.assertEqual(len(self.database.get_equity_data_series('AMZN')), 15)
+
+    def test_file_grows_past_capacity(self):
+        n = _INITIAL_CAPACITY + 10
+        expected = make_data(self.start, n)
+        self.database.bulk_update_market_data('AMZN', expected[:10])
+        self.database.bulk_update_market_data('AMZN', expected[10:])
+
+        series = self.database.get_equity_data_series('AMZN')
+        self.assertEqual(series, expected[::-1])
+
+    def test_out_of_order_and_replaced_dates(self):
+        expected = make_data(self.start, 10)
+        self.database.bulk_update_market_data('AMZN', expected[5:])
+        self.database.bulk_update_market_data('AMZN', expected[:5])
+
+        new_data = EquityData('1.00', '2.00', '0.50', '1.50', '1.50', 7)
+        self.database.update_market_data('AMZN', (expected[3][0], new_data))
+        expected[3] = (expected[3][0], new_data)
+
+        series = self.database.get_equity_data_series('AMZN')
+        self.assertEqual(series, expected[::-1])
+        self.assertEqual(self.database.get_equity_data('AMZN',
+                                                       expected[3][0]),
+                         new_data)
+
+    def test_replaced_dates_written_to_new_file(self):
+        expected = make_data(self.start, 10)
+        self.database.bulk_update_market_data('AMZN', expected)
+        inode = os.stat(self.security_path()).st_ino
+        series = self.database.get_equity_data_series('AMZN')
+
+        new_data = EquityData('1.00', '2.00', '0.50', '1.50', '1.50', 7)
+        self.database.update_market_data('AMZN', (expected[3][0], new_data))
+
+        self.assertNotEqual(os.stat(self.security_path()).st_ino, inode)
+        self.assertEqual(series, expected[::-1])
+        self.assertEqual(self.database.get_equity_data('AMZN',
+                                                       expected[3][0]),
+                         new_data)
+
+    def test_other_connection_sees_updates(self):
+        other = ColumnarDataAdapter.connect(ColumnarDataAdapter.test_database)
+        try:
+            expected = make_data(self.start, 10)
+            self.database.bulk_update_market_data('AMZN', expected[:5])
+            self.assertEqual(len(other.get_equity_data_series('AMZN')), 5)
+
+            self.database.bulk_update_market_data('AMZN', expected[5:])
+            self.database.insert_securities(['GOOG'])
+            self.assertEqual(other.get_equity_data_series('AMZN'),
+                             expected[::-1])
+            self.assertEqual(other.get_securities_list(), ['AMZN', 'GOOG'])
+        finally:
+            other.close()
+
+if __name__ == '__main__':
+    unittest.main()
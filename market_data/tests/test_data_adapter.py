@@ -13,7 +13,8 @@ from parameterized import parameterized_class
 
 import market_data
 import market_data.data_adapter as data_adapter
-from market_data.data import EquityData, InvalidTickerError, InvalidDateError
+from market_data.data import EquityData, EquitySeries, FrozenEquityData
+from market_data.data import InvalidTickerError, InvalidDateError
 import market_data.tests.utils as test_utils
 
 class DataAdapterSourceTests(unittest.TestCase):
@@ -32,7 +33,8 @@ class DataAdapterSourceTests(unittest.TestCase):
 
 @parameterized_class(('data_adapter_source', ),[
     [data_adapter.DataAdapterSource.JSON, ],
-    [data_adapter.DataAdapterSource.SQLITE3, ]
+    [data_adapter.DataAdapterSource.SQLITE3, ],
+    [data_adapter.DataAdapterSource.COLUMNAR, ]
 ])
 class DataAdapterTests(unittest.TestCase):
 
@@ -97,7 +99,8 @@ class DataAdapterTests(unittest.TestCase):
 
 @parameterized_class(('data_adapter_source', ),[
     [data_adapter.DataAdapterSource.JSON, ],
-    [data_adapter.DataAdapterSource.SQLITE3, ]
+    [data_adapter.DataAdapterSource.SQLITE3, ],
+    [data_adapter.DataAdapterSource.COLUMNAR, ]
 ])
 class DataAdapterSecuritiesTests(unittest.TestCase):
 
@@ -146,6 +149,20 @@ class DataAdapterSecuritiesTests(unittest.TestCase):
         tickers = self.database.get_securities_list()
         self.assertEqual(len(expected_tickers), len(tickers))
 
+    def test_security_inserted_by_other_connection_can_be_updated(self):
+        ticker, dt, expected_data = test_utils.get_expected_equity_data()
+        with self.assertRaises(InvalidTickerError):
+            self.database.get_equity_data(ticker, dt)
+
+        other = self.da.connect(self.da.test_database)
+        other.insert_securities([ticker])
+        other.close()
+
+        self.database.update_market_data(ticker, (dt, expected_data))
+
+        actual_data = self.database.get_equity_data(ticker, dt)
+        self.assertEqual(expected_data, actual_data)
+
     def test_update_equity_data_for_security_not_in_list_raises_error(self):
         ticker = 'AMZN'
         with self.assertRaises(InvalidTickerError):
@@ -207,6 +224,23 @@ class DataAdapterSecuritiesTests(unittest.TestCase):
         self.assertEqual(dt_2, data_series[1][0])
         self.assertEqual(expected_data_2, data_series[1][1])
 
+    def test_bulk_update_duplicate_date_keeps_last(self):
+        ticker = 'AMZN'
+        self.database.insert_securities([ticker])
+
+        dt_1 = datetime.datetime(2019, 8, 27)
+        dt_2 = datetime.datetime(2019, 8, 26)
+        first = EquityData('1.00', '2.00', '0.50', '1.50', '1.50', 1)
+        other = EquityData('3.00', '4.00', '2.50', '3.50', '3.50', 2)
+        last = EquityData('5.00', '6.00', '4.50', '5.50', '5.50', 3)
+
+        self.database.bulk_update_market_data(ticker, [(dt_1, first),
+                                                       (dt_2, other),
+                                                       (dt_1, last)])
+
+        data_series = self.database.get_equity_data_series(ticker)
+        self.assertEqual([(dt_1, last), (dt_2, other)], list(data_series))
+
     def test_update_duplicate_equity_data_overrides_existing(self):
         ticker, dt, expected_data = test_utils.get_expected_equity_data()
         self.database.insert_securities([ticker])
@@ -224,6 +258,20 @@ class DataAdapterSecuritiesTests(unittest.TestCase):
         actual_data = self.database.get_equity_data(ticker, dt)
         self.assertEqual(expected_data, actual_data)
 
+    def test_returned_equity_data_is_frozen(self):
+        ticker, dt, expected_data = test_utils.get_expected_equity_data()
+        self.database.insert_securities([ticker])
+        self.database.update_market_data(ticker, (dt, expected_data))
+
+        found, _ = self.database.get_equity_data_many([(ticker, dt)])
+        cross_section, _ = self.database.get_cross_section([ticker], dt)
+        for actual_data in (self.database.get_equity_data(ticker, dt),
+                            found[(ticker, dt)], cross_section[ticker]):
+            self.assertIsInstance(actual_data, FrozenEquityData)
+            self.assertEqual(expected_data, actual_data)
+            with self.assertRaises(AttributeError):
+                actual_data.volume = 0
+
     # NOTE(steve): multiple dates and securities are not duplications
     # of the market_data.py unit tests as these do not make calls
     # to get the data but assumes the data is provided in the correct form
@@ -264,7 +312,132 @@ class DataAdapterSecuritiesTests(unittest.TestCase):
 
         data = self.database.get_equity_data_series('AMZN')
         self.assertEqual(len(data), 0)
-        self.assertIsInstance(data, list)
+        self.assertIsInstance(data, EquitySeries)
+
+    def update_with_all_test_data(self, ticker):
+        self.database.insert_securities([ticker])
+        test_data = test_utils.load_test_data()
+        data = []
+        for date_string in test_data[ticker]:
+            dt = datetime.datetime.strptime(date_string, '%d-%b-%Y')
+            data.append((dt, test_utils.get_test_data(test_data, ticker, dt)))
+        self.database.bulk_update_market_data(ticker, data)
+
+        return sorted(data, key=lambda d: d[0], reverse=True)
+
+    def test_get_equity_data_range(self):
+        expected_data = self.update_with_all_test_data('AMZN')
+
+        start = datetime.datetime(2019, 8, 24)
+        end = datetime.datetime(2019, 8, 27)
+        data_series = self.database.get_equity_data_range('AMZN', start, end)
+
+        self.assertEqual(expected_data[:2], data_series)
+
+    def test_get_equity_data_range_ignores_time_and_accepts_dates(self):
+        expected_data = self.update_with_all_test_data('AMZN')
+
+        start = datetime.date(2019, 8, 23)
+        end = datetime.datetime(2019, 8, 26, 9, 30)
+        data_series = self.database.get_equity_data_range('AMZN', start, end)
+
+        self.assertEqual(expected_data[1:], data_series)
+
+    def test_get_equity_data_range_with_no_data(self):
+        self.update_with_all_test_data('AMZN')
+
+        start = datetime.datetime(2019, 9, 1)
+        end = datetime.datetime(2019, 9, 30)
+        data_series = self.database.get_equity_data_range('AMZN', start, end)
+
+        self.assertEqual([], data_series)
+
+    def test_get_equity_data_range_invalid_ticker_error(self):
+        dt = datetime.datetime(2019, 8, 27)
+        with self.assertRaises(InvalidTickerError):
+            self.database.get_equity_data_range('AMZN', dt, dt)
+
+    def test_get_last_n(self):
+        expected_data = self.update_with_all_test_data('AMZN')
+
+        self.assertEqual(expected_data[:2],
+                         self.database.get_last_n('AMZN', 2))
+        self.assertEqual(expected_data, self.database.get_last_n('AMZN', 10))
+        self.assertEqual([], self.database.get_last_n('AMZN', 0))
+
+    def test_get_last_n_invalid_ticker_error(self):
+        with self.assertRaises(InvalidTickerError):
+            self.database.get_last_n('AMZN', 1)
+
+    def test_iter_equity_data_series(self):
+        expected_data = self.update_with_all_test_data('AMZN')
+
+        chunks = list(self.database.iter_equity_data_series('AMZN', 2))
+
+        self.assertEqual([2, 1], [len(chunk) for chunk in chunks])
+        for chunk in chunks:
+            self.assertIsInstance(chunk, EquitySeries)
+        self.assertEqual(expected_data,
+                         [row for chunk in chunks for row in chunk])
+
+    def test_iter_equity_data_series_no_data(self):
+        self.database.insert_securities(['AMZN'])
+        self.assertEqual([],
+                         list(self.database.iter_equity_data_series('AMZN',
+                                                                    10)))
+
+    def test_iter_equity_data_series_invalid_ticker_error(self):
+        with self.assertRaises(InvalidTickerError):
+            self.database.iter_equity_data_series('AMZN', 10)
+
+    def test_get_equity_data_many(self):
+        amzn_data = self.update_with_all_test_data('AMZN')
+        goog_data = self.update_with_all_test_data('GOOG')
+        missing_dt = datetime.datetime(2019, 8, 25)
+
+        pairs = [('AMZN', dt) for dt, _ in amzn_data]
+        pairs += [('GOOG', goog_data[0][0]), ('GOOG', missing_dt),
+                  ('MSFT', missing_dt)]
+        data, errors = self.database.get_equity_data_many(pairs)
+
+        expected = {('AMZN', dt): d for dt, d in amzn_data}
+        expected[('GOOG', goog_data[0][0])] = goog_data[0][1]
+        self.assertEqual(data, expected)
+        self.assertEqual([type(e) for e in errors],
+                         [InvalidDateError, InvalidTickerError])
+
+    def test_get_equity_data_many_no_data(self):
+        self.database.insert_securities(['AMZN'])
+        dt = datetime.datetime(2019, 8, 27)
+
+        data, errors = self.database.get_equity_data_many([('AMZN', dt)])
+
+        self.assertEqual(data, {})
+        self.assertEqual([type(e) for e in errors], [InvalidDateError])
+
+    def test_get_cross_section(self):
+        amzn_data = self.update_with_all_test_data('AMZN')
+        goog_data = self.update_with_all_test_data('GOOG')
+        dt = amzn_data[0][0]
+
+        data, errors = self.database.get_cross_section(
+                ['AMZN', 'GOOG', 'MSFT'], dt)
+
+        self.assertEqual(data, {'AMZN': amzn_data[0][1],
+                                'GOOG': dict(goog_data)[dt]})
+        self.assertEqual([type(e) for e in errors], [InvalidTickerError])
+
+    def test_get_latest_dates(self):
+        self.assertEqual(self.database.get_latest_dates(), {})
+
+        self.update_with_all_test_data('AMZN')
+        self.database.insert_securities(['GOOG'])
+
+        latest_dates = self.database.get_latest_dates()
+        self.assertEqual(latest_dates, {
+            'AMZN': datetime.datetime(2019, 8, 27),
+            'GOOG': None
+        })
 
     def test_get_equity_data_for_multiple_securities(self):
         self.database.insert_securities(['AMZN', 'GOOG'])
@@ -7,9 +7,16 @@ file_path = os.path.dirname(inspect.getfile(inspect.currentframe()))
 sys.path.insert(0, os.path.split(os.path.split(file_path)[0])[0])
 
 import unittest
+import copy
+import datetime
+import pickle
 from decimal import Decimal
 
-from market_data.data import EquityData
+import numpy as np
+
+from market_data.data import EquityData, FrozenEquityData
+from market_data.data import EquitySeries, PRICE_SCALE
+import market_data.tests.utils as test_utils
 
 # TODO(steve): test to make sure the decimal representations
 # that are created are correct. e.g. Decimal(1793.03) != 1793.03
@@ -51,5 +58,160 @@ class EquityDataTests(unittest.TestCase):
                        adj_close=1.28, volume=2240)
         self.assertNotEqual(d1, d2)
 
+    def test_equity_data_has_no_instance_dict(self):
+        d = EquityData()
+        self.assertFalse(hasattr(d, '__dict__'))
+        with self.assertRaises(AttributeError):
+            d.price = 10
+
+    def test_prices_keep_decimal_places_given(self):
+        d = EquityData(open='1898.00', high=Decimal('1903.7'), low=10,
+                       close='0.123456', adj_close=15.5)
+        self.assertEqual('1898.00', str(d.open))
+        self.assertEqual('1903.7', str(d.high))
+        self.assertEqual('10', str(d.low))
+        self.assertEqual('0.123456', str(d.close))
+        self.assertEqual('15.5', str(d.adj_close))
+
+    def test_prices_rounded_to_six_decimal_places(self):
+        d = EquityData(open='1.12345678')
+        self.assertEqual(Decimal('1.123457'), d.open)
+
+    def test_setting_field_converts_value(self):
+        d = EquityData()
+        d.close = '12.34'
+        d.volume = 400.5
+        self.assertEqual(Decimal('12.34'), d.close)
+        self.assertIsInstance(d.close, Decimal)
+        self.assertEqual(400, d.volume)
+
+    def test_fixed_point_round_trip(self):
+        d = EquityData(open='1898.00', high='1903.79', low='1856.00',
+                       close='1889.98', adj_close='1889.98', volume=5718000)
+        self.assertEqual((1898000000, 1903790000, 1856000000, 1889980000,
+                          1889980000, 5718000), d.to_fixed())
+        self.assertEqual(d, EquityData.from_fixed(*d.to_fixed()))
+        self.assertEqual(str(d), str(EquityData.from_fixed(*d.to_fixed())))
+
+    def test_invalid_price_raises_error(self):
+        with self.assertRaises(ArithmeticError):
+            EquityData(open='abc')
+        with self.assertRaises(ArithmeticError):
+            EquityData.from_stored('abc', 0, 0, 0, 0, 0)
+
+    def test_stored_prices_parsed_when_first_used(self):
+        prices = ('1898.00', '1903.79', '1856.00', '1889.98', '1889.98')
+        self.assertNotIsInstance(EquityData(*prices)._places, tuple)
+
+        d = EquityData.from_stored(*prices, volume=5718000)
+        frozen = d.freeze()
+        self.assertIsInstance(d._places, tuple)
+
+        self.assertEqual(Decimal('1903.79'), d.high)
+        self.assertNotIsInstance(d._places, tuple)
+        self.assertEqual('1898.00', str(frozen.open))
+        self.assertEqual(d, frozen)
+
+    def test_frozen_equity_data_is_immutable(self):
+        d = FrozenEquityData(open='10.50', volume=100)
+        with self.assertRaises(AttributeError):
+            d.open = 5
+        with self.assertRaises(AttributeError):
+            d.volume = 5
+        self.assertEqual(Decimal('10.50'), d.open)
+        self.assertEqual(100, d.volume)
+
+    def test_freeze_returns_equal_hashable_copy(self):
+        d = EquityData(open='10.50', volume=100)
+        frozen = d.freeze()
+        self.assertIsInstance(frozen, FrozenEquityData)
+        self.assertEqual(d, frozen)
+        self.assertEqual(str(d), str(frozen))
+        self.assertEqual(hash(frozen), hash(EquityData(open='10.5',
+                                                       volume=100).freeze()))
+
+        d.open = 1
+        self.assertEqual(Decimal('10.50'), frozen.open)
+
+    def test_copy_and_pickle(self):
+        for d in (EquityData(open='10.50', high='11', volume=100),
+                  EquityData.from_fixed(10500000, 0, 0, 0, 0, 100),
+                  EquityData.from_stored('10.50', '11', 0, 0, 0, 100),
+                  FrozenEquityData.from_stored('10.50', '11', 0, 0, 0, 100),
+                  FrozenEquityData(open='10.50', high='11', volume=100),
+                  FrozenEquityData.from_fixed(10500000, 0, 0, 0, 0, 100)):
+            for copied in (copy.copy(d), copy.deepcopy(d),
+                           pickle.loads(pickle.dumps(d))):
+                self.assertIs(type(d), type(copied))
+                self.assertEqual(d, copied)
+                self.assertEqual(str(d), str(copied))
+
+    def test_copy_of_equity_data_can_be_changed(self):
+        d = EquityData(open='10.50', volume=100)
+        copied = copy.copy(d)
+        copied.open = 1
+        self.assertEqual(Decimal('10.50'), d.open)
+
+class EquitySeriesTests(unittest.TestCase):
+
+    def setUp(self):
+        test_data = test_utils.load_test_data()
+        self.data = []
+        for dt in (datetime.datetime(2019, 8, 27),
+                   datetime.datetime(2019, 8, 26),
+                   datetime.datetime(2019, 8, 23)):
+            self.data.append((dt, test_utils.get_test_data(test_data,
+                                                           'AMZN', dt)))
+        self.series = EquitySeries.from_equity_data(self.data)
+
+    def test_empty_series(self):
+        series = EquitySeries()
+        self.assertEqual(0, len(series))
+        self.assertEqual([], list(series))
+        self.assertEqual([], series)
+
+    def test_columns_are_numpy_arrays(self):
+        self.assertEqual(np.dtype('datetime64[D]'), self.series.dates.dtype)
+        for field in EquitySeries.FIELDS:
+            self.assertEqual(np.int64, getattr(self.series, field).dtype)
+
+        self.assertEqual(1761830000, self.series.close[0])
+        self.assertEqual(PRICE_SCALE, 10 ** 6)
+        self.assertEqual(3019700, self.series.volume[0])
+
+    def test_index_returns_date_and_equity_data(self):
+        for i, (dt, data) in enumerate(self.data):
+            self.assertEqual(dt, self.series[i][0])
+            self.assertIsInstance(self.series[i][0], datetime.datetime)
+            self.assertEqual(data, self.series[i][1])
+
+        self.assertEqual(self.data[-1], self.series[-1])
+
+    def test_prices_keep_their_decimal_places(self):
+        self.assertEqual('1770.00', str(self.series[1][1].high))
+        self.assertEqual('1761.83', str(self.series[0][1].close))
+
+    def test_iterate_series(self):
+        self.assertEqual(self.data, list(self.series))
+
+    def test_slice_returns_series_sharing_arrays(self):
+        series = self.series[1:]
+        self.assertIsInstance(series, EquitySeries)
+        self.assertEqual(self.data[1:], series)
+        self.assertTrue(np.shares_memory(series.close, self.series.close))
+
+    def test_series_equality(self):
+        other = EquitySeries.from_equity_data(self.data)
+        self.assertEqual(self.series, other)
+        self.assertNotEqual(self.series, other[:2])
+        self.assertEqual(self.data, self.series)
+
+    def test_to_records(self):
+        records = self.series.to_records()
+        self.assertEqual(3, len(records))
+        self.assertEqual(np.datetime64('2019-08-27'), records.date[0])
+        self.assertAlmostEqual(1761.83, records.close[0])
+        self.assertEqual(3019700, records.volume[0])
+
 if __name__ == '__main__':
     unittest.main()
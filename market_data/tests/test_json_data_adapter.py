@@ -7,8 +7,13 @@ file_path = os.path.dirname(inspect.getfile(inspect.currentframe()))
 sys.path.insert(0, os.path.split(os.path.split(file_path)[0])[0])
 
 import unittest
+from unittest.mock import patch
+import datetime
 import json
-from market_data.json_data_adapter import TextDataModel
+import stat
+import threading
+from market_data.json_data_adapter import JsonDataAdapter, TextDataModel
+from market_data.json_data_adapter import fcntl
 import market_data.tests.utils as test_utils
 
 class TextDataModelTests(unittest.TestCase):
@@ -77,5 +82,233 @@ class TextDataModelTests(unittest.TestCase):
         # test
         self.assertEqual(expected_data, actual_data)
 
+class JsonDataAdapterJournalTests(unittest.TestCase):
+
+    def setUp(self):
+        JsonDataAdapter.create_test_database()
+        self.database = JsonDataAdapter.connect(JsonDataAdapter.test_database)
+        self.compacting_file, self.journal_file = \
+                JsonDataAdapter._journal_files(JsonDataAdapter.test_database)
+        self.ticker, self.dt, self.equity_data = \
+                test_utils.get_expected_equity_data()
+
+    def tearDown(self):
+        self.database.close()
+        try:
+            JsonDataAdapter.delete_test_database()
+        except:
+            pass
+
+    def test_updates_are_appended_to_journal(self):
+        with open(JsonDataAdapter.test_database, 'r') as db:
+            expected_db = db.read()
+
+        self.database.insert_securities([self.ticker])
+        self.database.update_market_data(self.ticker,
+                                         (self.dt, self.equity_data))
+
+        with open(JsonDataAdapter.test_database, 'r') as db:
+            self.assertEqual(expected_db, db.read())
+        with open(self.journal_file, 'r') as journal:
+            self.assertEqual(2, len(journal.readlines()))
+
+        actual_data = self.database.get_equity_data(self.ticker, self.dt)
+        self.assertEqual(self.equity_data, actual_data)
+
+    def test_compact_folds_journal_into_database(self):
+        self.database.insert_securities([self.ticker])
+        self.database.update_market_data(self.ticker,
+                                         (self.dt, self.equity_data))
+
+        JsonDataAdapter.compact(JsonDataAdapter.test_database)
+
+        self.assertFalse(os.path.isfile(self.journal_file))
+        self.assertFalse(os.path.isfile(self.compacting_file))
+        with open(JsonDataAdapter.test_database, 'r') as db:
+            data = json.load(db, object_hook=TextDataModel.json_decoder)
+        self.assertEqual([self.ticker], data.securities)
+        self.assertEqual(self.equity_data,
+                data.equity_data[self.ticker][self.dt.strftime('%d-%b-%Y')])
+
+    def test_journal_compacted_in_background_once_large_enough(self):
+        self.database.insert_securities([self.ticker])
+        with patch.object(JsonDataAdapter, 'compaction_min_size', 1):
+            self.database.update_market_data(self.ticker,
+                                             (self.dt, self.equity_data))
+            self.database.close()
+
+        self.assertFalse(os.path.isfile(self.journal_file))
+        actual_data = self.database.get_equity_data(self.ticker, self.dt)
+        self.assertEqual(self.equity_data, actual_data)
+
+    def test_left_over_compacting_file_is_replayed(self):
+        self.database.insert_securities([self.ticker])
+        os.replace(self.journal_file, self.compacting_file)
+        self.database.insert_securities(['GOOG'])
+
+        tickers = self.database.get_securities_list()
+        self.assertEqual([self.ticker, 'GOOG'], tickers)
+
+        JsonDataAdapter.compact(JsonDataAdapter.test_database)
+        JsonDataAdapter.compact(JsonDataAdapter.test_database)
+
+        self.assertFalse(os.path.isfile(self.journal_file))
+        self.assertFalse(os.path.isfile(self.compacting_file))
+        tickers = self.database.get_securities_list()
+        self.assertEqual([self.ticker, 'GOOG'], tickers)
+
+    def test_compact_keeps_database_file_mode(self):
+        os.chmod(JsonDataAdapter.test_database, 0o644)
+        self.database.insert_securities([self.ticker])
+
+        JsonDataAdapter.compact(JsonDataAdapter.test_database)
+
+        mode = stat.S_IMODE(os.stat(JsonDataAdapter.test_database).st_mode)
+        self.assertEqual(0o644, mode)
+
+    @unittest.skipIf(fcntl is None, 'file locks not available')
+    def test_compact_skipped_while_another_process_compacts(self):
+        self.database.insert_securities([self.ticker])
+        os.replace(self.journal_file, self.compacting_file)
+
+        with open(self.compacting_file, 'r') as compacting:
+            fcntl.flock(compacting, fcntl.LOCK_EX)
+            JsonDataAdapter.compact(JsonDataAdapter.test_database)
+            self.assertTrue(os.path.isfile(self.compacting_file))
+
+        JsonDataAdapter.compact(JsonDataAdapter.test_database)
+        self.assertFalse(os.path.isfile(self.compacting_file))
+        self.assertEqual([self.ticker], self.database.get_securities_list())
+
+    def test_incomplete_journal_entry_is_ignored(self):
+        self.database.insert_securities([self.ticker])
+        with open(self.journal_file, 'a') as journal:
+            journal.write('{"securities": ["GO')
+
+        self.assertEqual([self.ticker], self.database.get_securities_list())
+
+        self.database.insert_securities(['TLS.AX'])
+        tickers = self.database.get_securities_list()
+        self.assertEqual([self.ticker, 'TLS.AX'], tickers)
+
+class JsonDataAdapterInMemoryTests(unittest.TestCase):
+
+    def setUp(self):
+        JsonDataAdapter.create_test_database()
+        self.database = JsonDataAdapter.connect(JsonDataAdapter.test_database,
+                                                in_memory=True)
+        self.ticker, self.dt, self.equity_data = \
+                test_utils.get_expected_equity_data()
+
+    def tearDown(self):
+        self.database.close()
+        try:
+            JsonDataAdapter.delete_test_database()
+        except:
+            pass
+
+    def test_writes_are_not_saved_until_flush(self):
+        self.database.insert_securities([self.ticker])
+        self.database.update_market_data(self.ticker,
+                                         (self.dt, self.equity_data))
+
+        other = JsonDataAdapter.connect(JsonDataAdapter.test_database)
+        self.assertEqual([], other.get_securities_list())
+
+        self.database.flush()
+
+        self.assertEqual([self.ticker], other.get_securities_list())
+        actual_data = other.get_equity_data(self.ticker, self.dt)
+        self.assertEqual(self.equity_data, actual_data)
+
+    def test_writes_are_saved_on_close(self):
+        self.database.insert_securities([self.ticker])
+        self.database.close()
+
+        other = JsonDataAdapter.connect(JsonDataAdapter.test_database)
+        self.assertEqual([self.ticker], other.get_securities_list())
+
+    def test_reads_pick_up_changes_from_other_connections(self):
+        self.assertEqual([], self.database.get_securities_list())
+
+        other = JsonDataAdapter.connect(JsonDataAdapter.test_database)
+        other.insert_securities([self.ticker])
+        other.update_market_data(self.ticker, (self.dt, self.equity_data))
+
+        self.assertEqual([self.ticker], self.database.get_securities_list())
+        actual_data = self.database.get_equity_data(self.ticker, self.dt)
+        self.assertEqual(self.equity_data, actual_data)
+
+    def test_changes_to_updated_equity_data_are_not_stored(self):
+        self.database.insert_securities([self.ticker])
+        self.database.update_market_data(self.ticker,
+                                         (self.dt, self.equity_data))
+        expected_volume = self.equity_data.volume
+
+        self.equity_data.volume = 0
+
+        actual_data = self.database.get_equity_data(self.ticker, self.dt)
+        self.assertEqual(expected_volume, actual_data.volume)
+
+    def test_changes_to_returned_equity_data_are_not_allowed(self):
+        self.database.insert_securities([self.ticker])
+        self.database.update_market_data(self.ticker,
+                                         (self.dt, self.equity_data))
+
+        actual_data = self.database.get_equity_data(self.ticker, self.dt)
+        with self.assertRaises(AttributeError):
+            actual_data.volume = 0
+
+        found, _ = self.database.get_equity_data_many([(self.ticker,
+                                                        self.dt)])
+        with self.assertRaises(AttributeError):
+            found[(self.ticker, self.dt)].close = '1.00'
+
+        self.assertEqual(self.equity_data,
+                         self.database.get_equity_data(self.ticker, self.dt))
+
+    def test_flush_picks_up_changes_from_other_connections(self):
+        self.database.insert_securities([self.ticker])
+        self.assertEqual([self.ticker], self.database.get_securities_list())
+
+        other = JsonDataAdapter.connect(JsonDataAdapter.test_database)
+        other.insert_securities(['GOOG'])
+        self.database.flush()
+
+        self.assertEqual(['GOOG', self.ticker],
+                         self.database.get_securities_list())
+
+    # NOTE(steve): the readers keep reading for as long as the writer is
+    # adding dates and securities
+    def test_reads_while_writing_from_other_threads(self):
+        self.database.insert_securities([self.ticker])
+        errors = []
+        done = threading.Event()
+        def write():
+            for i in range(1000):
+                dt = self.dt + datetime.timedelta(days=i + 1)
+                self.database.insert_securities([f'T{i}'])
+                self.database.update_market_data(self.ticker,
+                                                 (dt, self.equity_data))
+            done.set()
+        def read():
+            try:
+                while not done.is_set():
+                    self.database.get_latest_dates()
+                    self.database.get_equity_data_series(self.ticker)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=read) for _ in range(3)]
+        threads.append(threading.Thread(target=write))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.database.get_equity_data_series(
+                self.ticker)), 1000)
+
 if __name__ == '__main__':
     unittest.main()
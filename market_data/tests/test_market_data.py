@@ -10,14 +10,20 @@ import unittest
 from unittest.mock import patch
 import datetime
 import json
+import shutil
+import tempfile
+import threading
 
 from parameterized import parameterized_class
+from freezegun import freeze_time
 
 from market_data.market_data import MarketData
 from market_data.market_data import NotInitialisedError
+from market_data.caching_data_adapter import CachingDataAdapter
 from market_data.data import EquityData
 from market_data.data import InvalidTickerError, InvalidDateError, NoDataError
 import market_data.data_adapter as data_adapter
+import market_data.snapshot as snapshot
 import market_data.tests.utils as test_utils
 
 def common_setup(obj):
@@ -39,7 +45,8 @@ def common_teardown(obj):
 
 @parameterized_class(('data_adapter_source', ),[
     [data_adapter.DataAdapterSource.JSON, ],
-    [data_adapter.DataAdapterSource.SQLITE3, ]
+    [data_adapter.DataAdapterSource.SQLITE3, ],
+    [data_adapter.DataAdapterSource.COLUMNAR, ]
 ])
 class MarketDataTests(unittest.TestCase):
 
@@ -79,9 +86,22 @@ class MarketDataTests(unittest.TestCase):
         with self.assertRaises(NotInitialisedError):
             self.app.add_security('GOOG')
 
+    def test_run_with_cache(self):
+        self.app.close()
+        self.app = MarketData()
+        self.app.run(database=self.database, cache_size=16)
+        self.assertIsInstance(self.app._database, CachingDataAdapter)
+
+        self.app.add_security('AMZN')
+        self.assertEqual(self.app.get_securities_list(), ['AMZN'])
+        self.app.add_security('GOOG')
+        self.assertEqual(self.app.get_securities_list(), ['AMZN', 'GOOG'])
+        self.assertEqual(self.app._database.stats()['misses'], 2)
+
 @parameterized_class(('data_adapter_source', ),[
     [data_adapter.DataAdapterSource.JSON, ],
-    [data_adapter.DataAdapterSource.SQLITE3, ]
+    [data_adapter.DataAdapterSource.SQLITE3, ],
+    [data_adapter.DataAdapterSource.COLUMNAR, ]
 ])
 class MarketDataPersistentStorageTests(unittest.TestCase):
 
@@ -118,6 +138,8 @@ class MarketDataPersistentStorageTests(unittest.TestCase):
             method += 'json_data_adapter.JsonDataAdapter.close'
         elif source == data_adapter.DataAdapterSource.SQLITE3:
             method += 'sqlite3_data_adapter.Sqlite3DataAdapter.close'
+        elif source == data_adapter.DataAdapterSource.COLUMNAR:
+            method += 'columnar_data_adapter.ColumnarDataAdapter.close'
         else:
             raise InvalidDataAdapterSourceError(self.data_adapter_source)
 
@@ -146,7 +168,8 @@ class MarketDataPersistentStorageTests(unittest.TestCase):
 
 @parameterized_class(('data_adapter_source', ),[
     [data_adapter.DataAdapterSource.JSON, ],
-    [data_adapter.DataAdapterSource.SQLITE3, ]
+    [data_adapter.DataAdapterSource.SQLITE3, ],
+    [data_adapter.DataAdapterSource.COLUMNAR, ]
 ])
 class EquityDataTests(unittest.TestCase):
 
@@ -343,6 +366,58 @@ class EquityDataTests(unittest.TestCase):
         self.assertEqual(dt_1, dt)
         self.assertEqual(expected_data[1], actual_data)
 
+    @patch('market_data.scraper.Scraper.scrape_equity_data', autospec=True)
+    def test_get_equity_data_range_and_last_n(self, mock_scraper):
+        self.app.add_security(self.ticker)
+
+        dt = [datetime.datetime(2019, 8, 27), datetime.datetime(2019, 8, 26),
+              datetime.datetime(2019, 8, 23)]
+        params = zip([self.ticker] * 3, dt)
+        expected_data = self.update_with_test_data(params, mock_scraper)
+        expected_series = list(zip(dt, expected_data))
+
+        data_series = self.app.get_equity_data_range(self.ticker, dt[1], dt[0])
+        self.assertEqual(expected_series[:2], data_series)
+
+        data_series = self.app.get_last_n(self.ticker, 2)
+        self.assertEqual(expected_series[:2], data_series)
+
+    @patch('market_data.scraper.Scraper.scrape_equity_data', autospec=True)
+    def test_iter_equity_data_series(self, mock_scraper):
+        self.app.add_security(self.ticker)
+
+        dt = [datetime.datetime(2019, 8, 27), datetime.datetime(2019, 8, 26),
+              datetime.datetime(2019, 8, 23)]
+        params = zip([self.ticker] * 3, dt)
+        expected_data = self.update_with_test_data(params, mock_scraper)
+        expected_series = list(zip(dt, expected_data))
+
+        chunks = list(self.app.iter_equity_data_series(self.ticker,
+                                                       chunk_size=2))
+        self.assertEqual([expected_series[:2], expected_series[2:]], chunks)
+
+        with self.assertRaises(ValueError):
+            self.app.iter_equity_data_series(self.ticker, chunk_size=0)
+
+    @patch('market_data.scraper.Scraper.scrape_equity_data', autospec=True)
+    def test_get_cross_section(self, mock_scraper):
+        tickers = ['AMZN', 'GOOG']
+        for ticker in tickers:
+            self.app.add_security(ticker)
+
+        params = list(zip(tickers, [self.test_date] * 2))
+        expected_data = self.update_with_test_data(params, mock_scraper)
+
+        data, errors = self.app.get_cross_section(tickers + ['MSFT'],
+                                                  self.test_date)
+        self.assertEqual(data, dict(zip(tickers, expected_data)))
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], InvalidTickerError)
+
+        data, errors = self.app.get_equity_data_many(params)
+        self.assertEqual(data, dict(zip(params, expected_data)))
+        self.assertEqual(errors, [])
+
     def test_get_latest_equity_data_invalid_ticker_error(self):
         with self.assertRaises(InvalidTickerError):
             self.app.get_latest_equity_data(self.ticker)
@@ -353,5 +428,290 @@ class EquityDataTests(unittest.TestCase):
         with self.assertRaises(NoDataError):
             self.app.get_latest_equity_data(self.ticker)
 
+@parameterized_class(('data_adapter_source', ),[
+    [data_adapter.DataAdapterSource.JSON, ],
+    [data_adapter.DataAdapterSource.SQLITE3, ],
+    [data_adapter.DataAdapterSource.COLUMNAR, ]
+])
+class PlanUpdatesTests(unittest.TestCase):
+
+    def setUp(self):
+        common_setup(self)
+        self.test_data = test_utils.load_test_data()
+
+    def tearDown(self):
+        common_teardown(self)
+
+    @freeze_time('2019-08-27 15:30:00')
+    def test_plan_updates(self):
+        for ticker in ['AMZN', 'GOOG', 'TLS.AX']:
+            self.app.add_security(ticker)
+
+        dt = datetime.datetime(2019, 8, 23)
+        data = test_utils.get_test_data(self.test_data, 'AMZN', dt)
+        self.app._database.update_market_data('AMZN', (dt, data))
+        dt = datetime.datetime(2019, 8, 27)
+        data = test_utils.get_test_data(self.test_data, 'GOOG', dt)
+        self.app._database.update_market_data('GOOG', (dt, data))
+
+        plan, errors = self.app.plan_updates()
+
+        self.assertEqual([], errors)
+        expected_plan = [
+            MarketData.UpdatePlan('AMZN', [datetime.datetime(2019, 8, 26),
+                                           datetime.datetime(2019, 8, 27)]),
+            MarketData.UpdatePlan('TLS.AX', [datetime.datetime(2019, 8, 27)])
+        ]
+        self.assertEqual(sorted(expected_plan), sorted(plan))
+
+    @freeze_time('2019-08-27')
+    def test_plan_updates_selected_and_invalid_tickers(self):
+        self.app.add_security('AMZN')
+        self.app.add_security('GOOG')
+
+        plan, errors = self.app.plan_updates(['AMZN', 'AMZNN'])
+
+        self.assertEqual([('AMZN', [datetime.datetime(2019, 8, 27)])], plan)
+        self.assertEqual(1, len(errors))
+        self.assertIsInstance(errors[0], InvalidTickerError)
+        self.assertEqual('AMZNN', str(errors[0]))
+
+    @freeze_time('2019-09-03')
+    def test_plan_updates_skips_exchange_holidays(self):
+        for ticker in ['AMZN', 'TLS.AX']:
+            self.app.add_security(ticker)
+
+        dt = datetime.datetime(2019, 8, 27)
+        data = test_utils.get_test_data(self.test_data, 'AMZN', dt)
+        for ticker in ['AMZN', 'TLS.AX']:
+            self.app._database.update_market_data(ticker, (dt, data))
+
+        plan, errors = self.app.plan_updates()
+        plan = dict(plan)
+
+        # NOTE(steve): 2 Sep 2019 is labor day in the US
+        self.assertEqual([datetime.datetime(2019, 8, 28),
+                          datetime.datetime(2019, 8, 29),
+                          datetime.datetime(2019, 8, 30),
+                          datetime.datetime(2019, 9, 3)], plan['AMZN'])
+        self.assertEqual([datetime.datetime(2019, 8, 28),
+                          datetime.datetime(2019, 8, 29),
+                          datetime.datetime(2019, 8, 30),
+                          datetime.datetime(2019, 9, 2),
+                          datetime.datetime(2019, 9, 3)], plan['TLS.AX'])
+
+    @freeze_time('2019-08-25')
+    def test_plan_updates_on_weekend(self):
+        self.app.add_security('AMZN')
+
+        plan, errors = self.app.plan_updates()
+
+        self.assertEqual([], plan)
+        self.assertEqual([], errors)
+
+    def test_plan_updates_reads_latest_dates_once(self):
+        for ticker in ['AMZN', 'GOOG']:
+            self.app.add_security(ticker)
+
+        with patch.object(self.app._database, 'get_last_n') as mock_last_n:
+            with patch.object(self.app._database, 'get_latest_dates',
+                              wraps=self.app._database.get_latest_dates
+                              ) as mock_latest_dates:
+                self.app.plan_updates()
+
+        self.assertEqual(1, mock_latest_dates.call_count)
+        mock_last_n.assert_not_called()
+
+@parameterized_class(('data_adapter_source', ),[
+    [data_adapter.DataAdapterSource.JSON, ],
+    [data_adapter.DataAdapterSource.SQLITE3, ],
+    [data_adapter.DataAdapterSource.COLUMNAR, ]
+])
+class UpdateAllTests(unittest.TestCase):
+
+    def setUp(self):
+        common_setup(self)
+        self.test_data = test_utils.load_test_data()
+
+    def tearDown(self):
+        common_teardown(self)
+
+    def mock_scrape(self, scraper, ticker, date_list):
+        if ticker not in self.test_data:
+            raise InvalidTickerError(ticker)
+
+        data, errors = [], []
+        for dt in date_list:
+            try:
+                equity_data = test_utils.get_test_data(self.test_data,
+                                                       ticker, dt)
+                data.append((dt.date(), equity_data))
+            except KeyError:
+                errors.append(InvalidDateError(dt.date()))
+        return data, errors
+
+    @freeze_time('2019-08-27')
+    @patch('market_data.scraper.Scraper.scrape_eq_multiple_dates',
+           autospec=True)
+    def test_update_all_securities(self, mock_scraper):
+        mock_scraper.side_effect = self.mock_scrape
+        for ticker in ['AMZN', 'GOOG', 'AMZNN']:
+            self.app.add_security(ticker)
+
+        dt = datetime.datetime(2019, 8, 23)
+        data = test_utils.get_test_data(self.test_data, 'AMZN', dt)
+        self.app._database.update_market_data('AMZN', (dt, data))
+
+        results = self.app.update_all()
+
+        self.assertEqual(set(['AMZN', 'GOOG', 'AMZNN']), set(results))
+
+        expected_dates = [datetime.date(2019, 8, 26),
+                          datetime.date(2019, 8, 27)]
+        self.assertEqual(expected_dates, results['AMZN'].dates)
+        self.assertEqual([], results['AMZN'].errors)
+        data_series = self.app.get_equity_data_series('AMZN')
+        self.assertEqual(3, len(data_series))
+
+        dt = datetime.datetime(2019, 8, 27)
+        self.assertEqual([dt.date()], results['GOOG'].dates)
+        self.assertEqual([], results['GOOG'].errors)
+        actual_data = self.app.get_equity_data('GOOG', dt)
+        expected_data = test_utils.get_test_data(self.test_data, 'GOOG', dt)
+        self.assertEqual(expected_data, actual_data)
+
+        self.assertEqual([], results['AMZNN'].dates)
+        self.assertEqual(1, len(results['AMZNN'].errors))
+        self.assertIsInstance(results['AMZNN'].errors[0], InvalidTickerError)
+
+    @freeze_time('2019-08-27')
+    @patch('market_data.scraper.Scraper.scrape_eq_multiple_dates',
+           autospec=True)
+    def test_update_all_selected_tickers(self, mock_scraper):
+        mock_scraper.side_effect = self.mock_scrape
+        for ticker in ['AMZN', 'GOOG']:
+            self.app.add_security(ticker)
+
+        results = self.app.update_all(['GOOG'], max_workers=2)
+
+        self.assertEqual(['GOOG'], list(results))
+        self.assertEqual(0, len(self.app.get_equity_data_series('AMZN')))
+        self.assertEqual(1, len(self.app.get_equity_data_series('GOOG')))
+
+    @freeze_time('2019-08-27')
+    @patch('market_data.scraper.Scraper.scrape_eq_multiple_dates',
+           autospec=True)
+    def test_update_all_reports_errors(self, mock_scraper):
+        mock_scraper.side_effect = ConnectionError('503 Service Unavailable')
+        self.app.add_security('AMZN')
+
+        results = self.app.update_all(['AMZN', 'TLS.AX'])
+
+        self.assertIsInstance(results['AMZN'].errors[0], ConnectionError)
+        self.assertIsInstance(results['TLS.AX'].errors[0], InvalidTickerError)
+
+    @freeze_time('2019-08-27')
+    @patch('market_data.scraper.Scraper.scrape_eq_multiple_dates',
+           autospec=True)
+    def test_update_all_writes_from_calling_thread(self, mock_scraper):
+        mock_scraper.side_effect = self.mock_scrape
+        for ticker in ['AMZN', 'GOOG']:
+            self.app.add_security(ticker)
+
+        write_threads = []
+        bulk_update = self.app._database.bulk_update_market_data
+        def record_thread(*args):
+            write_threads.append(threading.get_ident())
+            return bulk_update(*args)
+
+        with patch.object(self.app._database, 'bulk_update_market_data',
+                          side_effect=record_thread):
+            self.app.update_all()
+
+        self.assertEqual([threading.get_ident()] * 2, write_threads)
+
+@parameterized_class(('data_adapter_source', ),[
+    [data_adapter.DataAdapterSource.JSON, ],
+    [data_adapter.DataAdapterSource.SQLITE3, ],
+    [data_adapter.DataAdapterSource.COLUMNAR, ]
+])
+class ExportImportTests(unittest.TestCase):
+
+    def setUp(self):
+        common_setup(self)
+        self.test_data = test_utils.load_test_data()
+        self.directory = tempfile.mkdtemp()
+
+        for ticker in ['AMZN', 'GOOG']:
+            self.app.add_security(ticker)
+            data = []
+            for date_string in self.test_data[ticker]:
+                dt = datetime.datetime.strptime(date_string, '%d-%b-%Y')
+                data.append((dt, test_utils.get_test_data(self.test_data,
+                                                          ticker, dt)))
+            self.app._database.bulk_update_market_data(ticker, data)
+
+        self.new_db = os.path.join(self.directory, 'new_db')
+        self.da.create_database(self.new_db)
+        self.new_app = MarketData()
+        self.new_app.run(MarketData.Database(self.new_db,
+                                             self.data_adapter_source))
+
+    def tearDown(self):
+        self.new_app.close()
+        common_teardown(self)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    # NOTE(steve): pyarrow is optional so parquet and arrow are skipped
+    # when it isn't installed
+    def skip_without_pyarrow(self, format):
+        if format != 'csv' and snapshot.pa is None:
+            self.skipTest(f'pyarrow is required for {format} snapshots')
+
+    def test_export_then_import(self):
+        for format in snapshot.FORMATS:
+            with self.subTest(format=format):
+                self.skip_without_pyarrow(format)
+                path = os.path.join(self.directory, f'snapshot.{format}')
+
+                self.assertEqual(4, self.app.export(path, format=format))
+                self.assertEqual(4, self.new_app.import_(path, format=format))
+
+                self.assertEqual(set(['AMZN', 'GOOG']),
+                                 set(self.new_app.get_securities_list()))
+                for ticker in ['AMZN', 'GOOG']:
+                    self.assertEqual(
+                            self.app.get_equity_data_series(ticker),
+                            self.new_app.get_equity_data_series(ticker))
+
+    def test_export_selected_tickers_and_dates(self):
+        for format in snapshot.FORMATS:
+            with self.subTest(format=format):
+                self.skip_without_pyarrow(format)
+                path = os.path.join(self.directory, f'snapshot.{format}')
+
+                rows = self.app.export(path, tickers=['AMZN'],
+                                       start=datetime.datetime(2019, 8, 24),
+                                       format=format)
+                self.assertEqual(2, rows)
+
+                self.new_app.import_(path, format=format)
+                series = self.new_app.get_equity_data_series('AMZN')
+                self.assertEqual(self.app.get_last_n('AMZN', 2), series)
+                self.assertEqual(['AMZN'], self.new_app.get_securities_list())
+
+    def test_export_invalid_format(self):
+        path = os.path.join(self.directory, 'snapshot.xlsx')
+        with self.assertRaises(snapshot.InvalidFormatError):
+            self.app.export(path, format='xlsx')
+        with self.assertRaises(snapshot.InvalidFormatError):
+            self.app.import_(path, format='xlsx')
+
+    def test_export_without_pyarrow(self):
+        path = os.path.join(self.directory, 'snapshot.parquet')
+        with patch('market_data.snapshot.pa', None):
+            with self.assertRaises(ImportError):
+                self.app.export(path)
+
 if __name__ == '__main__':
     unittest.main()
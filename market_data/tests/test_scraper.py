@@ -11,6 +11,8 @@ from unittest.mock import patch
 import datetime
 
 from market_data.scraper import Scraper, InvalidSourceError
+from market_data.scraper import _HistPriceTableParser, _HistPrices
+from market_data.scraper import _parse_row_date
 from market_data.data import EquityData, InvalidTickerError, InvalidDateError
 from market_data.data import EmptyDateListError
 import market_data.tests.utils as test_utils
@@ -33,16 +35,65 @@ def load_test_data():
 
     return data
 
+class HistPriceTableParserTests(unittest.TestCase):
+
+    def test_parse_price_rows(self):
+        page = load_test_data().decode('utf-8')
+        rows = _HistPriceTableParser().parse(page)
+
+        self.assertEqual(len(rows), 100)
+        self.assertEqual(rows[0], ('Aug 30, 2019', '1,797.49', '1,799.74',
+                                   '1,764.57', '1,776.29', '1,776.29',
+                                   '3,058,700'))
+
+    def test_parse_page_without_table(self):
+        parser = _HistPriceTableParser()
+        self.assertIsNone(parser.parse('<html><body></body></html>'))
+        self.assertIsNone(parser.parse('<table data-test="historical-prices">'
+                                       '</table>'))
+
+class HistPricesTests(unittest.TestCase):
+
+    def setUp(self):
+        page = load_test_data().decode('utf-8')
+        self.rows = _HistPriceTableParser().parse(page)
+
+    def test_parse_row_date(self):
+        self.assertEqual(_parse_row_date('Aug 30, 2019'),
+                         datetime.date(2019, 8, 30))
+        self.assertEqual(_parse_row_date('Jan 2, 2020'),
+                         datetime.date(2020, 1, 2))
+        with self.assertRaises(ValueError):
+            _parse_row_date('30/08/2019')
+        with self.assertRaises(ValueError):
+            _parse_row_date('Aug 30 2019')
+
+    def test_only_parses_rows_up_to_oldest_date(self):
+        prices = _HistPrices(self.rows)
+
+        dates = {datetime.date(2019, 8, 28), datetime.date(2019, 8, 26)}
+        data = prices.get_dates(dates)
+        self.assertEqual(set(data.keys()), dates)
+        self.assertEqual(prices._next_row, 5)
+
+        data = prices.get_dates({datetime.date(2019, 8, 29)})
+        self.assertEqual(len(data), 1)
+        self.assertEqual(prices._next_row, 5)
+
+    def test_missing_date_stops_at_older_row(self):
+        prices = _HistPrices(self.rows)
+
+        data = prices.get_dates({datetime.date(2019, 8, 25)})
+        self.assertEqual(len(data), 0)
+        self.assertEqual(prices._next_row, 6)
+
 class ScraperYahooEquityPricesTests(unittest.TestCase):
 
-    @patch('urllib.request.urlopen', autospec=True)
-    def test_scrape_returns_correct_equity_data(self, mock_urlopen):
+    def test_scrape_returns_correct_equity_data(self):
         ticker, dt, expected_data = test_utils.get_expected_equity_data()
-        scraper = Scraper('yahoo')
+        scraper = Scraper('yahoo', transport=test_utils.StubTransport())
 
-        mock_urlopen_context = mock_urlopen.return_value.__enter__.return_value
-        mock_urlopen_context.status = 200
-        mock_urlopen_context.read.return_value = load_test_data()
+        scraper.transport.page = load_test_data()
 
         results = scraper.scrape_equity_data(ticker, dt)
 
@@ -50,16 +101,13 @@ class ScraperYahooEquityPricesTests(unittest.TestCase):
         self.assertEqual(results, expected_data,
                          msg=f'res: {results} != ex: {expected_data}')
 
-    @patch('urllib.request.urlopen', autospec=True)
-    def test_scrape_equity_data_with_date_and_time(self, mock_urlopen):
+    def test_scrape_equity_data_with_date_and_time(self):
         ticker, dt, expected_data = test_utils.get_expected_equity_data()
-        scraper = Scraper('yahoo')
+        scraper = Scraper('yahoo', transport=test_utils.StubTransport())
 
         dt = datetime.datetime(dt.year, dt.month, dt.day, 19, 35, 33)
 
-        mock_urlopen_context = mock_urlopen.return_value.__enter__.return_value
-        mock_urlopen_context.status = 200
-        mock_urlopen_context.read.return_value = load_test_data()
+        scraper.transport.page = load_test_data()
 
         results = scraper.scrape_equity_data(ticker, dt)
 
@@ -67,40 +115,32 @@ class ScraperYahooEquityPricesTests(unittest.TestCase):
         self.assertEqual(results, expected_data,
                          msg=f'res: {results} != ex: {expected_data}')
 
-    @patch('urllib.request.urlopen', autospec=True)
-    def test_scrape_invalid_date(self, mock_urlopen):
+    def test_scrape_invalid_date(self):
         ticker = 'AMZN'
         dt = datetime.datetime(2019, 9, 3)
-        scraper = Scraper('yahoo')
+        scraper = Scraper('yahoo', transport=test_utils.StubTransport())
 
-        mock_urlopen_context = mock_urlopen.return_value.__enter__.return_value
-        mock_urlopen_context.status = 200
-        mock_urlopen_context.read.return_value = load_test_data()
+        scraper.transport.page = load_test_data()
 
         with self.assertRaises(InvalidDateError):
             results = scraper.scrape_equity_data(ticker, dt)
 
-    @patch('urllib.request.urlopen', autospec=True)
-    def test_scrape_invalid_ticker(self, mock_urlopen):
+    def test_scrape_invalid_ticker(self):
         ticker = 'AMZNN'
         dt = datetime.datetime(2019, 8, 23)
-        scraper = Scraper('yahoo')
+        scraper = Scraper('yahoo', transport=test_utils.StubTransport())
 
-        mock_urlopen_context = mock_urlopen.return_value.__enter__.return_value
-        mock_urlopen_context.read.return_value = b''
+        scraper.transport.page = b''
 
         with self.assertRaises(InvalidTickerError):
             results = scraper.scrape_equity_data(ticker, dt)
 
-    @patch('urllib.request.urlopen', autospec=True)
-    def test_scrape_page_found_but_invalid_ticker(self, mock_urlopen):
+    def test_scrape_page_found_but_invalid_ticker(self):
         ticker = 'AMZNN'
         dt = datetime.datetime(2019, 8, 23)
-        scraper = Scraper('yahoo')
+        scraper = Scraper('yahoo', transport=test_utils.StubTransport())
 
-        mock_urlopen_context = mock_urlopen.return_value.__enter__.return_value
-        mock_urlopen_context.status = 200
-        mock_urlopen_context.read.return_value = b'<HTML><body></body></HTML>'
+        scraper.transport.page = b'<HTML><body></body></HTML>'
 
         with self.assertRaises(InvalidTickerError):
             results = scraper.scrape_equity_data(ticker, dt)
@@ -110,37 +150,29 @@ class ScraperYahooEquityMultipleDatesTests(unittest.TestCase):
     def setUp(self):
         self.ticker = 'AMZN'
 
-    @patch('urllib.request.urlopen', autospec=True)
-    def test_scrape_invalid_ticker(self, mock_urlopen):
+    def test_scrape_invalid_ticker(self):
         ticker = 'AMZNN'
         dt = datetime.datetime(2019, 8, 23)
-        scraper = Scraper('yahoo')
+        scraper = Scraper('yahoo', transport=test_utils.StubTransport())
 
-        mock_urlopen = mock_urlopen.return_value.__enter__.return_value
-        mock_urlopen.read.return_value = b''
+        scraper.transport.page = b''
 
         with self.assertRaises(InvalidTickerError):
             _, _ = scraper.scrape_eq_multiple_dates(ticker, [dt])
 
-    @patch('urllib.request.urlopen', autospec=True)
-    def test_scraper_empty_date_list_input(self, mock_urlopen):
-        scraper = Scraper('yahoo')
+    def test_scraper_empty_date_list_input(self):
+        scraper = Scraper('yahoo', transport=test_utils.StubTransport())
 
-        mock_urlopen = mock_urlopen.return_value.__enter__.return_value
-        mock_urlopen.status = 200
-        mock_urlopen.read.return_value = load_test_data()
+        scraper.transport.page = load_test_data()
 
         with self.assertRaises(EmptyDateListError):
             _, _ = scraper.scrape_eq_multiple_dates(self.ticker, [])
 
-    @patch('urllib.request.urlopen', autospec=True)
-    def test_scraper_single_date(self, mock_urlopen):
+    def test_scraper_single_date(self):
         ticker, dt, expected_data = test_utils.get_expected_equity_data()
-        scraper = Scraper('yahoo')
+        scraper = Scraper('yahoo', transport=test_utils.StubTransport())
 
-        mock_urlopen = mock_urlopen.return_value.__enter__.return_value
-        mock_urlopen.status = 200
-        mock_urlopen.read.return_value = load_test_data()
+        scraper.transport.page = load_test_data()
 
         data, errors = scraper.scrape_eq_multiple_dates(ticker, [dt])
 
@@ -151,14 +183,11 @@ class ScraperYahooEquityMultipleDatesTests(unittest.TestCase):
         self.assertEqual(data[0][1], expected_data,
                          msg=f'res: {data[0][1]} != ex: {expected_data}')
 
-    @patch('urllib.request.urlopen', autospec=True)
-    def test_scraper_multiple_valid_dates(self, mock_urlopen):
+    def test_scraper_multiple_valid_dates(self):
         test_data = test_utils.load_test_data()
-        scraper = Scraper('yahoo')
+        scraper = Scraper('yahoo', transport=test_utils.StubTransport())
 
-        mock_urlopen = mock_urlopen.return_value.__enter__.return_value
-        mock_urlopen.status = 200
-        mock_urlopen.read.return_value = load_test_data()
+        scraper.transport.page = load_test_data()
 
         dt_1 = datetime.datetime(2019, 8, 26)
         dt_2 = datetime.datetime(2019, 8, 23)
@@ -179,14 +208,11 @@ class ScraperYahooEquityMultipleDatesTests(unittest.TestCase):
             self.assertEqual(data[i][1], expected_data,
                              msg=f'res: {data[i][1]} != ex: {expected_data}')
 
-    @patch('urllib.request.urlopen', autospec=True)
-    def test_valid_and_non_valid_dates(self, mock_urlopen):
+    def test_valid_and_non_valid_dates(self):
         test_data = test_utils.load_test_data()
-        scraper = Scraper('yahoo')
+        scraper = Scraper('yahoo', transport=test_utils.StubTransport())
 
-        mock_urlopen = mock_urlopen.return_value.__enter__.return_value
-        mock_urlopen.status = 200
-        mock_urlopen.read.return_value = load_test_data()
+        scraper.transport.page = load_test_data()
 
         dt_1 = datetime.datetime(2019, 8, 26)
         dt_2 = datetime.datetime(2019, 8, 23)
@@ -216,13 +242,10 @@ class ScraperYahooEquityMultipleDatesTests(unittest.TestCase):
             self.assertIsInstance(errors[i], InvalidDateError)
             self.assertEqual(str(date.date()), str(errors[i]))
 
-    @patch('urllib.request.urlopen', autospec=True)
-    def test_no_valid_dates(self, mock_urlopen):
-        scraper = Scraper('yahoo')
+    def test_no_valid_dates(self):
+        scraper = Scraper('yahoo', transport=test_utils.StubTransport())
 
-        mock_urlopen = mock_urlopen.return_value.__enter__.return_value
-        mock_urlopen.status = 200
-        mock_urlopen.read.return_value = load_test_data()
+        scraper.transport.page = load_test_data()
 
         dt_1 = datetime.datetime(2019, 9, 2)
         dt_2 = datetime.datetime(2019, 9, 4)
@@ -237,5 +260,114 @@ class ScraperYahooEquityMultipleDatesTests(unittest.TestCase):
             self.assertIsInstance(error, InvalidDateError)
             self.assertEqual(str(dates[i].date()), str(error))
 
+class ScraperCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.ticker = 'AMZN'
+        self.dates = (datetime.date(2019, 8, 26), datetime.date(2019, 8, 23))
+
+    def test_page_fetched_once_for_multiple_lookups(self):
+        scraper = Scraper('yahoo', transport=test_utils.StubTransport())
+
+        scraper.transport.page = load_test_data()
+
+        for dt in self.dates:
+            scraper.scrape_equity_data(self.ticker, dt)
+        data, errors = scraper.scrape_eq_multiple_dates(self.ticker,
+                                                        self.dates)
+
+        self.assertEqual(len(data), 2)
+        self.assertEqual(len(errors), 0)
+        self.assertEqual(len(scraper.transport.urls), 1)
+
+    def test_expired_page_fetched_again(self):
+        scraper = Scraper('yahoo', cache_ttl=60,
+                          transport=test_utils.StubTransport())
+
+        scraper.transport.page = load_test_data()
+
+        with patch('time.monotonic', return_value=1000.0):
+            scraper.scrape_equity_data(self.ticker, self.dates[0])
+        with patch('time.monotonic', return_value=1059.0):
+            scraper.scrape_equity_data(self.ticker, self.dates[1])
+        self.assertEqual(len(scraper.transport.urls), 1)
+
+        with patch('time.monotonic', return_value=1060.0):
+            scraper.scrape_equity_data(self.ticker, self.dates[1])
+        self.assertEqual(len(scraper.transport.urls), 2)
+
+    def test_least_recently_used_page_evicted(self):
+        scraper = Scraper('yahoo', cache_size=2,
+                          transport=test_utils.StubTransport())
+
+        scraper.transport.page = load_test_data()
+
+        for ticker in ('AMZN', 'GOOG', 'AMZN', 'NFLX', 'AMZN'):
+            scraper.scrape_equity_data(ticker, self.dates[0])
+        self.assertEqual(len(scraper.transport.urls), 3)
+
+        scraper.scrape_equity_data('GOOG', self.dates[0])
+        self.assertEqual(len(scraper.transport.urls), 4)
+
+    def test_invalid_ticker_not_cached(self):
+        scraper = Scraper('yahoo', transport=test_utils.StubTransport())
+
+        scraper.transport.page = b'<HTML><body></body></HTML>'
+
+        for _ in range(2):
+            with self.assertRaises(InvalidTickerError):
+                scraper.scrape_equity_data(self.ticker, self.dates[0])
+        self.assertEqual(len(scraper.transport.urls), 2)
+
+    def test_clear_cache(self):
+        scraper = Scraper('yahoo', transport=test_utils.StubTransport())
+
+        scraper.transport.page = load_test_data()
+
+        scraper.scrape_equity_data(self.ticker, self.dates[0])
+        scraper.clear_cache(self.ticker)
+        scraper.scrape_equity_data(self.ticker, self.dates[0])
+        self.assertEqual(len(scraper.transport.urls), 2)
+
+class ScraperAsyncTests(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.ticker = 'AMZN'
+        self.dates = [datetime.date(2019, 8, 26), datetime.date(2019, 8, 23),
+                      datetime.date(2019, 8, 24)]
+
+    async def test_scrape_with_async_transport(self):
+        transport = test_utils.AsyncStubTransport(load_test_data())
+        scraper = Scraper('yahoo', transport=test_utils.StubTransport(),
+                          async_transport=transport)
+
+        data, errors = await scraper.scrape_eq_multiple_dates_async(
+                self.ticker, self.dates)
+
+        self.assertEqual([dt for dt, _ in data], self.dates[:2])
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(data[0][1], scraper.scrape_equity_data(self.ticker,
+                                                                self.dates[0]))
+        self.assertEqual(len(transport.urls), 1)
+        self.assertEqual(scraper.transport.urls, [])
+
+    async def test_scrape_with_sync_transport_in_executor(self):
+        scraper = Scraper('yahoo',
+                          transport=test_utils.StubTransport(load_test_data()))
+
+        data = await scraper.scrape_equity_data_async(self.ticker,
+                                                      self.dates[0])
+
+        self.assertIsInstance(data, EquityData)
+        self.assertEqual(len(scraper.transport.urls), 1)
+
+    async def test_scrape_async_invalid_ticker(self):
+        transport = test_utils.AsyncStubTransport(
+                b'<HTML><body></body></HTML>')
+        scraper = Scraper('yahoo', async_transport=transport)
+
+        with self.assertRaises(InvalidTickerError):
+            await scraper.scrape_equity_data_async(self.ticker, self.dates[0])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import inspect
+file_path = os.path.dirname(inspect.getfile(inspect.currentframe()))
+sys.path.insert(0, os.path.split(os.path.split(file_path)[0])[0])
+
+import unittest
+import datetime
+import sqlite3
+import threading
+import time
+
+from market_data.sqlite3_data_adapter import Sqlite3DataAdapter
+from market_data.sqlite3_data_adapter import InvalidProfileError
+from market_data.data import EquityData, InvalidTickerError
+
+class Sqlite3DataAdapterMigrationTests(unittest.TestCase):
+
+    def setUp(self):
+        Sqlite3DataAdapter.create_test_database()
+
+    def tearDown(self):
+        try:
+            Sqlite3DataAdapter.delete_test_database()
+        except:
+            pass
+
+    def get_indexes(self):
+        conn = sqlite3.connect(Sqlite3DataAdapter.test_database)
+        sql = "SELECT name FROM sqlite_master WHERE type = 'index'"
+        indexes = [row[0] for row in conn.execute(sql)]
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        conn.close()
+        return indexes, version
+
+    def test_new_database_has_latest_schema(self):
+        indexes, version = self.get_indexes()
+        self.assertIn('equity_prices_ticker_date_idx', indexes)
+        self.assertEqual(len(Sqlite3DataAdapter._migrations), version)
+
+    def test_existing_database_migrated_on_connect(self):
+        conn = sqlite3.connect(Sqlite3DataAdapter.test_database)
+        conn.execute('DROP INDEX equity_prices_ticker_date_idx')
+        conn.execute('PRAGMA user_version = 0')
+        conn.close()
+
+        indexes, version = self.get_indexes()
+        self.assertNotIn('equity_prices_ticker_date_idx', indexes)
+        self.assertEqual(0, version)
+
+        database = Sqlite3DataAdapter.connect(Sqlite3DataAdapter.test_database)
+        database.close()
+
+        indexes, version = self.get_indexes()
+        self.assertIn('equity_prices_ticker_date_idx', indexes)
+        self.assertEqual(len(Sqlite3DataAdapter._migrations), version)
+
+    def test_up_to_date_database_not_written_on_connect(self):
+        os.chmod(Sqlite3DataAdapter.test_database, 0o444)
+        mtime = os.stat(Sqlite3DataAdapter.test_database).st_mtime_ns
+        try:
+            database = Sqlite3DataAdapter.connect(
+                    Sqlite3DataAdapter.test_database)
+            database.get_securities_list()
+            database.close()
+        finally:
+            os.chmod(Sqlite3DataAdapter.test_database, 0o644)
+
+        self.assertEqual(mtime,
+                         os.stat(Sqlite3DataAdapter.test_database).st_mtime_ns)
+
+    def test_series_read_uses_covering_index(self):
+        database = Sqlite3DataAdapter.connect(Sqlite3DataAdapter.test_database)
+        sql = f"""EXPLAIN QUERY PLAN
+                    SELECT {Sqlite3DataAdapter._series_columns}
+                    FROM equity_prices WHERE (ticker_id = ?)
+                    ORDER BY date DESC"""
+        plan = ' '.join(row[3] for row in database._conn.execute(sql, (1,)))
+        database.close()
+
+        self.assertIn('COVERING INDEX equity_prices_ticker_date_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+class Sqlite3DataAdapterBulkUpdateTests(unittest.TestCase):
+
+    def setUp(self):
+        Sqlite3DataAdapter.create_test_database()
+        self.database = Sqlite3DataAdapter.connect(
+                Sqlite3DataAdapter.test_database)
+        self.database.insert_securities(['AMZN'])
+        self.start = datetime.datetime(2019, 1, 1)
+
+    def tearDown(self):
+        self.database.close()
+        try:
+            Sqlite3DataAdapter.delete_test_database()
+        except:
+            pass
+
+    def test_prices_stored_exactly(self):
+        prices = ['0.000001', '1898.00', '1889.98', '123456789.123456',
+                  '0', '3.5']
+        data = [(self.start + datetime.timedelta(days=i),
+                 EquityData(price, price, price, price, price, i))
+                for i, price in enumerate(prices)]
+
+        self.database.bulk_update_market_data('AMZN', data)
+
+        for dt, expected in data:
+            actual = self.database.get_equity_data('AMZN', dt)
+            self.assertEqual(expected.to_fixed(), actual.to_fixed())
+        self.assertEqual(data[::-1],
+                         list(self.database.get_equity_data_series('AMZN')))
+
+    def test_invalid_ticker_writes_nothing(self):
+        data = [(self.start, EquityData('1.00', '2.00', '0.50', '1.50',
+                                        '1.50', 7))]
+
+        with self.assertRaises(InvalidTickerError):
+            self.database.bulk_update_market_data('GOOG', data)
+
+        count = self.database._conn.execute(
+                'SELECT COUNT(*) FROM equity_prices').fetchone()[0]
+        self.assertEqual(0, count)
+
+    def test_failed_update_leaves_nothing_staged(self):
+        good = (self.start, EquityData('1.00', '2.00', '0.50', '1.50',
+                                       '1.50', 7))
+        bad = (self.start + datetime.timedelta(days=1), None)
+
+        with self.assertRaises(AttributeError):
+            self.database.bulk_update_market_data('AMZN', [good, bad])
+        self.database.bulk_update_market_data('AMZN', [good])
+
+        series = self.database.get_equity_data_series('AMZN')
+        self.assertEqual([good], list(series))
+
+class Sqlite3DataAdapterProfileTests(unittest.TestCase):
+
+    def setUp(self):
+        Sqlite3DataAdapter.create_test_database()
+
+    def tearDown(self):
+        try:
+            Sqlite3DataAdapter.delete_test_database()
+        except:
+            pass
+
+    def connect(self, profile=None):
+        database = Sqlite3DataAdapter.connect(Sqlite3DataAdapter.test_database,
+                                              profile=profile)
+        self.addCleanup(database.close)
+        return database
+
+    def test_default_profile_keeps_sqlite_defaults(self):
+        database = self.connect()
+        self.assertEqual(database.get_pragma('journal_mode'), 'delete')
+        self.assertEqual(database.get_pragma('synchronous'), 2)
+
+    def test_performance_profile(self):
+        database = self.connect('performance')
+        self.assertEqual(database.get_pragma('journal_mode'), 'wal')
+        self.assertEqual(database.get_pragma('synchronous'), 1)
+        self.assertEqual(database.get_pragma('cache_size'), -64 * 1024)
+        self.assertEqual(database.get_pragma('temp_store'), 2)
+
+    def test_custom_profile(self):
+        database = self.connect({'cache_size': -1024, 'busy_timeout': 500})
+        self.assertEqual(database.get_pragma('cache_size'), -1024)
+        self.assertEqual(database.get_pragma('busy_timeout'), 500)
+
+    def test_invalid_profile_error(self):
+        for profile in ['fastest', {'page_size': 1024},
+                        {'journal_mode': 'WAL; DROP TABLE securities'}]:
+            with self.assertRaises(InvalidProfileError):
+                self.connect(profile)
+
+    def test_reader_not_blocked_by_open_write(self):
+        writer = self.connect('performance')
+        reader = self.connect('performance')
+        writer.insert_securities(['AMZN'])
+        dt = datetime.datetime(2019, 8, 27)
+        data = EquityData('1.00', '2.00', '0.50', '1.50', '1.50', 7)
+        writer.update_market_data('AMZN', (dt, data))
+
+        writer._conn.execute('BEGIN IMMEDIATE')
+        writer._conn.execute('DELETE FROM equity_prices')
+        self.assertEqual(reader.get_equity_data('AMZN', dt), data)
+        writer._conn.rollback()
+
+class Sqlite3DataAdapterPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        Sqlite3DataAdapter.create_test_database()
+        self.database = Sqlite3DataAdapter.connect(
+                Sqlite3DataAdapter.test_database, profile='performance',
+                pooled=True)
+        self.database.insert_securities(['AMZN'])
+        self.dt = datetime.datetime(2019, 8, 27)
+        self.data = EquityData('1.00', '2.00', '0.50', '1.50', '1.50', 7)
+        self.database.update_market_data('AMZN', (self.dt, self.data))
+
+    def tearDown(self):
+        self.database.close()
+        try:
+            Sqlite3DataAdapter.delete_test_database()
+        except:
+            pass
+
+    def run_threads(self, target, n):
+        threads = [threading.Thread(target=target) for _ in range(n)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_each_thread_reads_with_its_own_connection(self):
+        connections = []
+        results = []
+
+        def read():
+            connections.append(self.database._reader())
+            for _ in range(50):
+                results.append(self.database.get_equity_data('AMZN', self.dt))
+
+        self.run_threads(read, 4)
+
+        self.assertEqual(len(set(map(id, connections))), 4)
+        self.assertNotIn(self.database._conn, connections)
+        self.assertEqual(results, [self.data] * 200)
+
+    def test_writes_from_threads_seen_by_readers(self):
+        start = datetime.datetime(2019, 1, 1)
+        errors = []
+
+        def write(offset):
+            try:
+                for i in range(offset, 100, 4):
+                    dt = start + datetime.timedelta(days=i)
+                    self.database.update_market_data('AMZN', (dt, self.data))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write, args=(i, ))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.database.get_equity_data_series('AMZN')),
+                         101)
+
+    def test_close_closes_reader_connections(self):
+        connections = []
+        closed = threading.Event()
+
+        def read():
+            connections.append(self.database._reader())
+            closed.wait()
+
+        threads = [threading.Thread(target=read) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        while len(connections) < 2:
+            time.sleep(0.01)
+
+        self.database.close()
+
+        try:
+            for conn in connections:
+                with self.assertRaises(sqlite3.ProgrammingError):
+                    conn.execute('SELECT 1')
+        finally:
+            closed.set()
+            for thread in threads:
+                thread.join()
+
+    def test_reader_connections_closed_when_threads_end(self):
+        connections = []
+
+        def read():
+            connections.append(self.database._reader())
+            self.database.get_equity_data('AMZN', self.dt)
+
+        for _ in range(10):
+            self.run_threads(read, 4)
+
+        # NOTE(steve): only the test thread's connection is left
+        self.assertEqual(self.database._readers, [self.database._reader()])
+        for conn in connections:
+            with self.assertRaises(sqlite3.ProgrammingError):
+                conn.execute('SELECT 1')
+        self.assertEqual(self.database.get_equity_data('AMZN', self.dt),
+                         self.data)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import inspect
+file_path = os.path.dirname(inspect.getfile(inspect.currentframe()))
+sys.path.insert(0, os.path.split(os.path.split(file_path)[0])[0])
+
+import unittest
+import asyncio
+from unittest.mock import patch
+
+from market_data.throttle import TokenBucket, CircuitBreaker, Throttle
+from market_data.throttle import ThrottledTransport, CircuitOpenError
+from market_data.throttle import AsyncThrottledTransport
+from market_data.transport import HttpError
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+class FlakyTransport:
+
+    def __init__(self, errors, page='page'):
+        self.errors = list(errors)
+        self.page = page
+        self.calls = 0
+
+    def get(self, url):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.page
+
+def http_error(status, retry_after=None):
+    return HttpError('https://example.com', status, 'Error', retry_after)
+
+class TokenBucketTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = TokenBucket(2.0, 3, clock=self.clock,
+                                  sleep=self.clock.sleep)
+
+    def test_burst_then_rate(self):
+        for _ in range(3):
+            self.bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+
+        self.bucket.acquire()
+        self.bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [0.5, 0.5])
+
+    def test_tokens_refill_over_time(self):
+        for _ in range(3):
+            self.bucket.acquire()
+        self.clock.now += 10
+
+        for _ in range(3):
+            self.bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_rate_adapts_within_limits(self):
+        for _ in range(10):
+            self.bucket.slow_down()
+        self.assertEqual(self.bucket.rate, self.bucket.min_rate)
+
+        for _ in range(100):
+            self.bucket.speed_up()
+        self.assertEqual(self.bucket.rate, self.bucket.max_rate)
+
+class CircuitBreakerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(3, 60, clock=self.clock)
+
+    def open_breaker(self):
+        for _ in range(3):
+            self.breaker.before_call()
+            self.breaker.record_failure()
+
+    def test_opens_after_failures_in_a_row(self):
+        for _ in range(2):
+            self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.is_open)
+
+        self.breaker.record_success()
+        self.open_breaker()
+        self.assertTrue(self.breaker.is_open)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+    def test_trial_call_closes_breaker(self):
+        self.open_breaker()
+        self.clock.now += 60
+
+        self.breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+        self.breaker.record_success()
+        self.assertFalse(self.breaker.is_open)
+        self.breaker.before_call()
+
+    def test_failed_trial_call_opens_breaker(self):
+        self.open_breaker()
+        self.clock.now += 60
+
+        self.breaker.before_call()
+        self.breaker.record_failure()
+
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+class ThrottleTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.throttle = Throttle(rate=100.0, burst=100, max_retries=3,
+                                 backoff=1.0, max_backoff=8.0,
+                                 failure_threshold=5, reset_timeout=60,
+                                 clock=self.clock, sleep=self.clock.sleep)
+
+    def test_transient_errors_retried(self):
+        transport = FlakyTransport([http_error(503), ConnectionResetError()])
+
+        page = self.throttle.call(transport.get, 'url')
+
+        self.assertEqual(page, 'page')
+        self.assertEqual(transport.calls, 3)
+        self.assertEqual(len(self.clock.sleeps), 2)
+
+    def test_other_errors_not_retried(self):
+        transport = FlakyTransport([http_error(404)])
+
+        with self.assertRaises(HttpError):
+            self.throttle.call(transport.get, 'url')
+        self.assertEqual(transport.calls, 1)
+
+    def test_gives_up_after_max_retries(self):
+        transport = FlakyTransport([http_error(502)] * 4)
+
+        with self.assertRaises(HttpError):
+            self.throttle.call(transport.get, 'url')
+        self.assertEqual(transport.calls, 4)
+
+    def test_backoff_is_exponential_with_jitter(self):
+        transport = FlakyTransport([http_error(500)] * 3)
+
+        with patch('random.uniform', side_effect=lambda a, b: b):
+            self.throttle.call(transport.get, 'url')
+        self.assertEqual(self.clock.sleeps, [1.0, 2.0, 4.0])
+
+    def test_retry_after_respected(self):
+        transport = FlakyTransport([http_error(429, retry_after=5.0)])
+
+        self.throttle.call(transport.get, 'url')
+
+        self.assertGreaterEqual(self.clock.sleeps[0], 5.0)
+        self.assertLess(self.throttle.bucket.rate, 100.0)
+
+    def test_open_breaker_stops_calls(self):
+        transport = FlakyTransport([http_error(503)] * 10)
+
+        with self.assertRaises(HttpError):
+            self.throttle.call(transport.get, 'url')
+        with self.assertRaises(HttpError):
+            self.throttle.call(transport.get, 'url')
+        self.assertEqual(transport.calls, 5)
+
+        with self.assertRaises(CircuitOpenError):
+            self.throttle.call(transport.get, 'url')
+        self.assertEqual(transport.calls, 5)
+
+    def test_throttled_transport(self):
+        transport = ThrottledTransport(FlakyTransport([http_error(503)]),
+                                       self.throttle)
+
+        self.assertEqual(transport.get('url'), 'page')
+
+class AsyncFlakyTransport(FlakyTransport):
+
+    async def get(self, url):
+        return FlakyTransport.get(self, url)
+
+class AsyncThrottleTests(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.throttle = Throttle(rate=1000.0, burst=100, max_retries=3,
+                                 backoff=0.01, max_backoff=0.01,
+                                 failure_threshold=5, reset_timeout=60)
+
+    async def test_transient_errors_retried(self):
+        transport = AsyncFlakyTransport([http_error(503),
+                                         ConnectionResetError()])
+
+        page = await self.throttle.call_async(transport.get, 'url')
+
+        self.assertEqual(page, 'page')
+        self.assertEqual(transport.calls, 3)
+
+    async def test_other_errors_not_retried(self):
+        transport = AsyncFlakyTransport([http_error(404)])
+
+        with self.assertRaises(HttpError):
+            await self.throttle.call_async(transport.get, 'url')
+        self.assertEqual(transport.calls, 1)
+
+    async def test_async_throttled_transport(self):
+        transport = AsyncThrottledTransport(
+                AsyncFlakyTransport([http_error(503)]), self.throttle)
+        ticks = []
+
+        async def tick():
+            for _ in range(3):
+                ticks.append(1)
+                await asyncio.sleep(0)
+
+        page, _ = await asyncio.gather(transport.get('url'), tick())
+        self.assertEqual(page, 'page')
+        self.assertEqual(len(ticks), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import inspect
+file_path = os.path.dirname(inspect.getfile(inspect.currentframe()))
+sys.path.insert(0, os.path.split(os.path.split(file_path)[0])[0])
+
+import unittest
+import datetime
+
+import market_data.trading_calendar as trading_calendar
+from market_data.trading_calendar import TradingCalendar
+
+def dates(*args):
+    return set(datetime.date(*arg) for arg in args)
+
+class HolidayRuleTests(unittest.TestCase):
+
+    def test_easter_sunday(self):
+        self.assertEqual(trading_calendar.easter_sunday(2019),
+                         datetime.date(2019, 4, 21))
+        self.assertEqual(trading_calendar.easter_sunday(2024),
+                         datetime.date(2024, 3, 31))
+        self.assertEqual(trading_calendar.easter_sunday(2038),
+                         datetime.date(2038, 4, 25))
+
+    def test_nth_weekday(self):
+        # NOTE(steve): third monday in january and last monday in may
+        self.assertEqual(trading_calendar.nth_weekday(2019, 1, 0, 3),
+                         datetime.date(2019, 1, 21))
+        self.assertEqual(trading_calendar.nth_weekday(2019, 5, 0, -1),
+                         datetime.date(2019, 5, 27))
+        self.assertEqual(trading_calendar.nth_weekday(2019, 12, 1, -1),
+                         datetime.date(2019, 12, 31))
+
+class NyseCalendarTests(unittest.TestCase):
+
+    def setUp(self):
+        self.calendar = trading_calendar.CALENDARS['NYSE']
+
+    def test_holidays(self):
+        expected = dates((2019, 1, 1), (2019, 1, 21), (2019, 2, 18),
+                         (2019, 4, 19), (2019, 5, 27), (2019, 7, 4),
+                         (2019, 9, 2), (2019, 11, 28), (2019, 12, 25))
+        self.assertEqual(self.calendar.holidays(2019), expected)
+
+    def test_weekend_holidays_observed(self):
+        # NOTE(steve): new year's day 2022 is a saturday which isn't
+        # observed and juneteenth and christmas are sundays
+        expected = dates((2022, 1, 17), (2022, 2, 21), (2022, 4, 15),
+                         (2022, 5, 30), (2022, 6, 20), (2022, 7, 4),
+                         (2022, 9, 5), (2022, 11, 24), (2022, 12, 26))
+        self.assertEqual(self.calendar.holidays(2022), expected)
+        self.assertIn(datetime.date(2021, 12, 24),
+                      self.calendar.holidays(2021))
+        self.assertIn(datetime.date(2023, 1, 2), self.calendar.holidays(2023))
+
+class AsxCalendarTests(unittest.TestCase):
+
+    def setUp(self):
+        self.calendar = trading_calendar.CALENDARS['ASX']
+
+    def test_holidays(self):
+        expected = dates((2019, 1, 1), (2019, 1, 28), (2019, 4, 19),
+                         (2019, 4, 22), (2019, 4, 25), (2019, 6, 10),
+                         (2019, 12, 25), (2019, 12, 26))
+        self.assertEqual(self.calendar.holidays(2019), expected)
+
+    def test_christmas_on_weekend(self):
+        self.assertEqual(self.calendar.holidays(2021) & dates(
+                         (2021, 12, 24), (2021, 12, 27), (2021, 12, 28)),
+                         dates((2021, 12, 27), (2021, 12, 28)))
+        self.assertIn(datetime.date(2020, 12, 28),
+                      self.calendar.holidays(2020))
+
+class TradingCalendarTests(unittest.TestCase):
+
+    def test_get_calendar_from_ticker(self):
+        self.assertEqual(trading_calendar.get_calendar('AMZN').name, 'NYSE')
+        self.assertEqual(trading_calendar.get_calendar('TLS.AX').name, 'ASX')
+        self.assertEqual(trading_calendar.get_calendar('fgg.ax').name, 'ASX')
+        self.assertEqual(trading_calendar.get_calendar('VOD.L').name,
+                         'WEEKDAYS')
+
+    def test_register_calendar(self):
+        calendar = TradingCalendar('TEST', lambda year: [])
+        trading_calendar.register_calendar(calendar, ['TST'])
+        try:
+            self.assertIs(trading_calendar.get_calendar('ABC.TST'), calendar)
+        finally:
+            del trading_calendar.CALENDARS['TEST']
+            del trading_calendar._suffixes['TST']
+
+    def test_trading_days(self):
+        calendar = trading_calendar.CALENDARS['NYSE']
+        start = datetime.datetime(2019, 8, 29)
+        end = datetime.datetime(2019, 9, 4, 10, 30)
+
+        expected = [datetime.datetime(2019, 8, 29),
+                    datetime.datetime(2019, 8, 30),
+                    datetime.datetime(2019, 9, 3),
+                    datetime.datetime(2019, 9, 4)]
+        self.assertEqual(calendar.trading_days(start, end), expected)
+        self.assertFalse(calendar.is_trading_day(datetime.date(2019, 9, 2)))
+        self.assertTrue(calendar.is_trading_day(datetime.date(2019, 9, 3)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import inspect
+file_path = os.path.dirname(inspect.getfile(inspect.currentframe()))
+sys.path.insert(0, os.path.split(os.path.split(file_path)[0])[0])
+
+import unittest
+import asyncio
+import gzip
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from market_data.transport import HttpTransport, HttpError
+from market_data.transport import AsyncHttpTransport
+from market_data.transport import PageStore, RecordTransport, ReplayTransport
+from market_data.transport import PageNotRecordedError
+
+PAGE = '<html><body>' + 'price data ' * 1000 + '</body></html>'
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.client_address,
+                                     dict(self.headers)))
+
+        if self.path == '/moved':
+            self.send_response(302)
+            self.send_header('Location', '/page')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if self.path == '/busy':
+            self.send_response(503)
+            self.send_header('Retry-After', '7')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if self.path != '/page':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = PAGE.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+        # NOTE(steve): drops the connection without telling the client
+        # like a server timing out an idle keep-alive connection
+        if self.server.drop_connections:
+            self.close_connection = True
+
+class HttpTransportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.daemon_threads = True
+        self.server.requests = []
+        self.server.drop_connections = False
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       args=(0.05, ), daemon=True)
+        self.thread.start()
+
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.transport = HttpTransport(timeout=5)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get_gzip_page(self):
+        page = self.transport.get(self.url + '/page')
+
+        self.assertEqual(page, PAGE)
+        _, _, headers = self.server.requests[0]
+        self.assertIn('gzip', headers['Accept-Encoding'])
+
+    def test_connection_reused(self):
+        for _ in range(3):
+            self.assertEqual(self.transport.get(self.url + '/page'), PAGE)
+
+        clients = set(client for _, client, _ in self.server.requests)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(clients), 1)
+
+    def test_reconnect_after_server_closes_connection(self):
+        self.server.drop_connections = True
+        self.transport.get(self.url + '/page')
+
+        self.assertEqual(self.transport.get(self.url + '/page'), PAGE)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_redirect_followed(self):
+        page = self.transport.get(self.url + '/moved')
+
+        self.assertEqual(page, PAGE)
+        self.assertEqual([path for path, _, _ in self.server.requests],
+                         ['/moved', '/page'])
+
+    def test_page_not_found(self):
+        with self.assertRaises(HttpError) as cm:
+            self.transport.get(self.url + '/missing')
+
+        self.assertEqual(cm.exception.status, 404)
+        self.assertIsNone(cm.exception.retry_after)
+
+    def test_service_unavailable(self):
+        with self.assertRaises(HttpError) as cm:
+            self.transport.get(self.url + '/busy')
+
+        self.assertEqual(cm.exception.status, 503)
+        self.assertEqual(cm.exception.retry_after, 7.0)
+
+class AsyncHttpTransportTests(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.daemon_threads = True
+        self.server.requests = []
+        self.server.drop_connections = False
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       args=(0.05, ), daemon=True)
+        self.thread.start()
+
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.transport = AsyncHttpTransport(timeout=5)
+
+    async def asyncTearDown(self):
+        await self.transport.close()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    async def test_get_gzip_page(self):
+        page = await self.transport.get(self.url + '/page')
+
+        self.assertEqual(page, PAGE)
+        _, _, headers = self.server.requests[0]
+        self.assertIn('gzip', headers['Accept-Encoding'])
+
+    async def test_connection_reused(self):
+        for _ in range(3):
+            self.assertEqual(await self.transport.get(self.url + '/page'),
+                             PAGE)
+
+        clients = set(client for _, client, _ in self.server.requests)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(clients), 1)
+
+    async def test_concurrent_requests(self):
+        pages = await asyncio.gather(*(self.transport.get(self.url + '/page')
+                                       for _ in range(10)))
+
+        self.assertEqual(pages, [PAGE] * 10)
+        idle = sum(len(conns) for conns in self.transport._idle.values())
+        self.assertLessEqual(idle, self.transport.max_idle_per_host)
+
+    async def test_reconnect_after_server_closes_connection(self):
+        self.server.drop_connections = True
+        await self.transport.get(self.url + '/page')
+
+        self.assertEqual(await self.transport.get(self.url + '/page'), PAGE)
+        self.assertEqual(len(self.server.requests), 2)
+
+    async def test_redirect_followed(self):
+        page = await self.transport.get(self.url + '/moved')
+
+        self.assertEqual(page, PAGE)
+        self.assertEqual([path for path, _, _ in self.server.requests],
+                         ['/moved', '/page'])
+
+    async def test_page_not_found(self):
+        with self.assertRaises(HttpError) as cm:
+            await self.transport.get(self.url + '/missing')
+
+        self.assertEqual(cm.exception.status, 404)
+
+    async def test_service_unavailable(self):
+        with self.assertRaises(HttpError) as cm:
+            await self.transport.get(self.url + '/busy')
+
+        self.assertEqual(cm.exception.status, 503)
+        self.assertEqual(cm.exception.retry_after, 7.0)
+
+class StubTransport:
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.urls = []
+
+    def get(self, url):
+        self.urls.append(url)
+        return self.pages[url]
+
+class PageStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = PageStore(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_put_and_get_page(self):
+        url = 'https://example.com/a'
+        self.assertNotIn(url, self.store)
+        self.assertIsNone(self.store.get(url))
+
+        self.store.put(url, PAGE)
+
+        self.assertIn(url, self.store)
+        self.assertEqual(self.store.get(url), PAGE)
+        self.assertEqual(PageStore(self.directory).get(url), PAGE)
+
+    def test_same_content_stored_once(self):
+        digest_a = self.store.put('https://example.com/a', PAGE)
+        digest_b = self.store.put('https://example.com/b', PAGE)
+        self.store.put('https://example.com/c', 'another page')
+
+        self.assertEqual(digest_a, digest_b)
+        pages = os.listdir(os.path.join(self.directory, 'pages'))
+        self.assertEqual(len(pages), 2)
+
+    def test_url_points_to_latest_page(self):
+        url = 'https://example.com/a'
+        self.store.put(url, 'old page')
+        self.store.put(url, PAGE)
+
+        self.assertEqual(self.store.get(url), PAGE)
+
+class RecordReplayTransportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = PageStore(self.directory)
+        self.url = 'https://example.com/a'
+        self.transport = StubTransport({self.url: PAGE})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_record_then_replay(self):
+        recorder = RecordTransport(self.store, self.transport)
+        self.assertEqual(recorder.get(self.url), PAGE)
+
+        replayer = ReplayTransport(self.store)
+        self.assertEqual(replayer.get(self.url), PAGE)
+        self.assertEqual(self.transport.urls, [self.url])
+
+    def test_replay_missing_page(self):
+        replayer = ReplayTransport(self.store)
+        with self.assertRaises(PageNotRecordedError):
+            replayer.get(self.url)
+
+    def test_replay_fetches_and_records_missing_page(self):
+        replayer = ReplayTransport(self.store, self.transport)
+        for _ in range(2):
+            self.assertEqual(replayer.get(self.url), PAGE)
+
+        self.assertEqual(self.transport.urls, [self.url])
+        self.assertIn(self.url, self.store)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -32,3 +32,23 @@ def get_expected_equity_data():
     expected_data.adj_close = Decimal('1889.98')
     expected_data.volume = int(5718000)
     return ticker, dt, expected_data
+
+class StubTransport:
+    """Returns the same page for every url and records the urls fetched."""
+
+    def __init__(self, page=b''):
+        self.page = page
+        self.urls = []
+
+    def get(self, url):
+        self.urls.append(url)
+        page = self.page
+        if isinstance(page, bytes):
+            page = page.decode('utf-8')
+        return page
+
+class AsyncStubTransport(StubTransport):
+    """StubTransport with an async get(url)."""
+
+    async def get(self, url):
+        return StubTransport.get(self, url)
@@ -0,0 +1,233 @@
+import asyncio
+import http.client
+import random
+import threading
+import time
+
+from market_data.transport import HttpError
+
+# NOTE(steve): status codes where the server is overloaded or is telling
+# us to slow down. Anything else from the server e.g. a 404 for a bad
+# ticker won't change by asking again.
+THROTTLE_STATUSES = frozenset([429, 503])
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+def is_retryable(error):
+    if isinstance(error, HttpError):
+        return error.status in RETRY_STATUSES
+    return isinstance(error, (ConnectionError, TimeoutError,
+                              http.client.HTTPException))
+
+def is_throttled(error):
+    return isinstance(error, HttpError) and error.status in THROTTLE_STATUSES
+
+class TokenBucket:
+    """
+    Rate limiter which allows bursts of up to burst calls and rate calls
+    per second on average.
+
+    The rate adapts to the server: it is halved whenever the server says
+    it is overloaded and creeps back up towards max_rate after each
+    successful call.
+    """
+
+    def __init__(self, rate, burst, min_rate=None, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.max_rate = rate
+        self.min_rate = min_rate if min_rate is not None else rate / 16
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    # NOTE(steve): the token is taken straight away, even if that puts
+    # the bucket into debt, so the lock is never held while sleeping and
+    # waiting callers are served in order.
+    def _take(self):
+        """Takes a token and returns the seconds to wait before using it."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens +
+                               (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0
+
+    def acquire(self):
+        wait = self._take()
+        if wait > 0:
+            self._sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._take()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def slow_down(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def speed_up(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 16)
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing server for reset_timeout seconds after
+    failure_threshold failures in a row. After the timeout a single
+    trial call is let through and the breaker closes if it succeeds.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+
+            retry_at = self._opened_at + self.reset_timeout
+            if self._trial or self._clock() < retry_at:
+                raise CircuitOpenError(
+                    f'Too many failures, retrying after {self.reset_timeout}s')
+            self._trial = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._trial = False
+
+class Throttle:
+    """
+    Limits the rate of calls to a server and retries transient failures
+    with exponential backoff and full jitter.
+
+    Args:
+        rate: Average number of calls per second.
+        burst: Number of calls which can be made at once.
+        max_retries: Number of retries after the first attempt fails.
+        backoff: Maximum delay in seconds before the first retry. The
+            maximum doubles for each retry up to max_backoff.
+        max_backoff: Maximum delay in seconds before any retry.
+        failure_threshold: Failures in a row before calls are stopped.
+        reset_timeout: Seconds before calls are allowed again.
+    """
+
+    def __init__(self, rate=2.0, burst=4, max_retries=4, backoff=1.0,
+                 max_backoff=30.0, failure_threshold=10, reset_timeout=60.0,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.bucket = TokenBucket(rate, burst, clock=clock, sleep=sleep)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout,
+                                      clock=clock)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._sleep = sleep
+
+    def _retry_delay(self, attempt, error):
+        delay = random.uniform(0, min(self.max_backoff,
+                                      self.backoff * 2 ** attempt))
+        retry_after = getattr(error, 'retry_after', None)
+        if retry_after is not None:
+            delay = max(delay, min(self.max_backoff, retry_after))
+
+        return delay
+
+    def _after_failure(self, attempt, error):
+        """
+        Records a failed call and returns the delay before retrying it.
+        Raises the error if the call shouldn't be retried.
+        """
+        if not is_retryable(error):
+            # NOTE(steve): the server answered so it is healthy
+            self.breaker.record_success()
+            raise error
+
+        self.breaker.record_failure()
+        if is_throttled(error):
+            self.bucket.slow_down()
+        if attempt >= self.max_retries or self.breaker.is_open:
+            raise error
+
+        return self._retry_delay(attempt, error)
+
+    def _after_success(self):
+        self.breaker.record_success()
+        self.bucket.speed_up()
+
+    def call(self, func, *args, **kwargs):
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            self.bucket.acquire()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self._sleep(self._after_failure(attempt, e))
+                attempt += 1
+            else:
+                self._after_success()
+                return result
+
+    async def call_async(self, func, *args, **kwargs):
+        """Like call but awaits func and waits without blocking the loop."""
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            await self.bucket.acquire_async()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                await asyncio.sleep(self._after_failure(attempt, e))
+                attempt += 1
+            else:
+                self._after_success()
+                return result
+
+class ThrottledTransport:
+    """Transport which fetches pages with another transport via a Throttle."""
+
+    def __init__(self, transport, throttle):
+        self.transport = transport
+        self.throttle = throttle
+
+    def get(self, url):
+        return self.throttle.call(self.transport.get, url)
+
+class AsyncThrottledTransport:
+    """Async transport which fetches pages with another via a Throttle."""
+
+    def __init__(self, transport, throttle):
+        self.transport = transport
+        self.throttle = throttle
+
+    async def get(self, url):
+        return await self.throttle.call_async(self.transport.get, url)
+
+    async def close(self):
+        await self.transport.close()
+
+class CircuitOpenError(Exception):
+    pass
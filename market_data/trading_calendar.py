@@ -0,0 +1,176 @@
+import datetime
+
+# NOTE(steve): holidays are generated from each exchange's rules rather
+# than listed by hand so they are correct for any year. One off closures
+# e.g. national days of mourning aren't included.
+
+def easter_sunday(year):
+    """Returns the date of easter sunday (anonymous gregorian algorithm)."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return datetime.date(year, month, day + 1)
+
+def nth_weekday(year, month, weekday, n):
+    """
+    Returns the nth weekday (monday = 0) of the month. A negative n
+    counts back from the end of the month.
+    """
+    if n > 0:
+        dt = datetime.date(year, month, 1)
+        dt += datetime.timedelta(days=(weekday - dt.weekday()) % 7)
+        return dt + datetime.timedelta(weeks=n - 1)
+
+    if month == 12:
+        dt = datetime.date(year, 12, 31)
+    else:
+        dt = datetime.date(year, month + 1, 1) - datetime.timedelta(days=1)
+    dt -= datetime.timedelta(days=(dt.weekday() - weekday) % 7)
+    return dt + datetime.timedelta(weeks=n + 1)
+
+def _us_observed(dt):
+    """Saturday holidays are observed on friday and sunday on monday."""
+    if dt.weekday() == 5:
+        return dt - datetime.timedelta(days=1)
+    if dt.weekday() == 6:
+        return dt + datetime.timedelta(days=1)
+    return dt
+
+def _next_monday(dt):
+    """Weekend holidays are observed on the following monday."""
+    if dt.weekday() >= 5:
+        return dt + datetime.timedelta(days=7 - dt.weekday())
+    return dt
+
+def nyse_holidays(year):
+    easter = easter_sunday(year)
+    holidays = [
+        datetime.date(year, 1, 1),                  # new year's day
+        nth_weekday(year, 2, 0, 3),                 # washington's birthday
+        easter - datetime.timedelta(days=2),        # good friday
+        nth_weekday(year, 5, 0, -1),                # memorial day
+        _us_observed(datetime.date(year, 7, 4)),    # independence day
+        nth_weekday(year, 9, 0, 1),                 # labor day
+        nth_weekday(year, 11, 3, 4),                # thanksgiving
+        _us_observed(datetime.date(year, 12, 25)),  # christmas
+    ]
+    # NOTE(steve): when new year's day is a saturday the nyse stays open
+    # on the friday before as it is the end of the year
+    if datetime.date(year, 1, 1).weekday() == 6:
+        holidays.append(datetime.date(year, 1, 2))
+    if year >= 1998:
+        holidays.append(nth_weekday(year, 1, 0, 3)) # martin luther king
+    if year >= 2022:
+        holidays.append(_us_observed(datetime.date(year, 6, 19)))
+
+    return holidays
+
+def asx_holidays(year):
+    easter = easter_sunday(year)
+    holidays = [
+        _next_monday(datetime.date(year, 1, 1)),    # new year's day
+        _next_monday(datetime.date(year, 1, 26)),   # australia day
+        easter - datetime.timedelta(days=2),        # good friday
+        easter + datetime.timedelta(days=1),        # easter monday
+        nth_weekday(year, 6, 0, 2),                 # queen's/king's birthday
+    ]
+
+    # NOTE(steve): anzac day isn't moved when it falls on a weekend
+    anzac_day = datetime.date(year, 4, 25)
+    if anzac_day.weekday() < 5:
+        holidays.append(anzac_day)
+
+    # NOTE(steve): christmas and boxing day both move to the next free
+    # weekday when they fall on a weekend
+    christmas = datetime.date(year, 12, 25)
+    boxing_day = datetime.date(year, 12, 26)
+    if christmas.weekday() == 5:
+        holidays += [christmas + datetime.timedelta(days=2),
+                     boxing_day + datetime.timedelta(days=2)]
+    elif christmas.weekday() == 6:
+        holidays += [christmas + datetime.timedelta(days=2), boxing_day]
+    elif christmas.weekday() == 4:
+        holidays += [christmas, boxing_day + datetime.timedelta(days=2)]
+    else:
+        holidays += [christmas, boxing_day]
+
+    return holidays
+
+class TradingCalendar:
+    """
+    Trading days of an exchange. Weekends are never trading days and
+    holidays are generated for each year from get_holidays(year) the
+    first time the year is used.
+    """
+
+    def __init__(self, name, get_holidays):
+        self.name = name
+        self._get_holidays = get_holidays
+        self._holidays = {}
+
+    def holidays(self, year):
+        """Returns the set of holiday dates for the year."""
+        holidays = self._holidays.get(year)
+        if holidays is None:
+            holidays = frozenset(dt for dt in self._get_holidays(year)
+                                 if dt.year == year and dt.weekday() < 5)
+            self._holidays[year] = holidays
+
+        return holidays
+
+    def is_trading_day(self, dt):
+        date = datetime.date(dt.year, dt.month, dt.day)
+        return date.weekday() < 5 and date not in self.holidays(dt.year)
+
+    def trading_days(self, start, end):
+        """
+        Returns the trading days from start to end (inclusive). The days
+        are the same type as start e.g. datetimes for a datetime start.
+        """
+        date_list = []
+        dt = start
+        while dt <= end:
+            if self.is_trading_day(dt):
+                date_list.append(dt)
+            dt += datetime.timedelta(days=1)
+
+        return date_list
+
+CALENDARS = {
+    'NYSE': TradingCalendar('NYSE', nyse_holidays),
+    'ASX': TradingCalendar('ASX', asx_holidays),
+}
+
+# NOTE(steve): yahoo tickers have a suffix for the exchange except for
+# US listings which have none. Tickers with a suffix we don't know about
+# fall back to a weekday only calendar.
+WEEKDAYS = TradingCalendar('WEEKDAYS', lambda year: [])
+_suffixes = {
+    '': 'NYSE',
+    'AX': 'ASX',
+}
+
+def register_calendar(calendar, suffixes=()):
+    """Adds a calendar and the ticker suffixes which trade on it."""
+    CALENDARS[calendar.name] = calendar
+    for suffix in suffixes:
+        _suffixes[suffix.upper()] = calendar.name
+
+def get_calendar(ticker):
+    """Returns the trading calendar for the exchange the ticker is on."""
+    _, dot, suffix = ticker.rpartition('.')
+    if not dot:
+        suffix = ''
+
+    name = _suffixes.get(suffix.upper())
+    if name is None:
+        return WEEKDAYS
+
+    return CALENDARS[name]
@@ -0,0 +1,486 @@
+import asyncio
+import email.parser
+import gzip
+import hashlib
+import http.client
+import os
+import ssl
+import tempfile
+import threading
+import zlib
+from urllib.parse import urlsplit, urljoin
+
+class HttpTransport:
+    """
+    Fetches web pages over a pool of keep-alive connections.
+
+    Idle connections are kept per (scheme, host, port) and reused by the
+    next request to the same host, which saves the DNS, TCP and TLS setup
+    for every page after the first. Responses are requested gzip encoded
+    and decompressed as they are read. Safe to share between threads.
+    """
+
+    user_agent = 'Mozilla/5.0 (compatible; market_data)'
+    chunk_size = 64 * 1024
+    max_redirects = 5
+
+    def __init__(self, timeout=30, max_idle_per_host=8):
+        self.timeout = timeout
+        self.max_idle_per_host = max_idle_per_host
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _connect(self, key):
+        scheme, host, port = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port,
+                                               timeout=self.timeout)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def _acquire(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+
+        return self._connect(key), False
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _read_body(self, response):
+        encoding = response.getheader('Content-Encoding')
+        decompressor = _get_decompressor(encoding)
+
+        chunks = []
+        while True:
+            chunk = response.read(self.chunk_size)
+            if not chunk:
+                break
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            chunks.append(chunk)
+
+        if decompressor is not None:
+            chunks.append(decompressor.flush())
+
+        return b''.join(chunks)
+
+    def _request(self, url):
+        parts = urlsplit(url)
+        scheme = parts.scheme or 'http'
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        headers = {
+            'Host': parts.netloc,
+            'User-Agent': self.user_agent,
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+        }
+
+        # NOTE(steve): an idle connection may have been closed by the
+        # server since it was last used. That only shows up once we try
+        # to use it so the request is retried once on a new connection.
+        conn, reused = self._acquire(key)
+        while True:
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                body = self._read_body(response)
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError,
+                    BrokenPipeError, http.client.CannotSendRequest):
+                conn.close()
+                if not reused:
+                    raise
+                conn, reused = self._connect(key), False
+            except Exception:
+                conn.close()
+                raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+
+        return response, body
+
+    def get(self, url):
+        """Returns the decoded body of the page at url."""
+        for _ in range(self.max_redirects + 1):
+            response, body = self._request(url)
+            location = response.getheader('Location')
+            if response.status in (301, 302, 303, 307, 308) and location:
+                url = urljoin(url, location)
+                continue
+
+            if response.status != 200:
+                raise HttpError(url, response.status, response.reason,
+                                _parse_retry_after(response))
+
+            charset = response.headers.get_content_charset() or 'utf-8'
+            return body.decode(charset)
+
+        raise HttpError(url, response.status, 'Too many redirects')
+
+class _AsyncResponse:
+
+    def __init__(self, status, reason, headers, body, will_close):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.will_close = will_close
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+class AsyncHttpTransport:
+    """
+    Asyncio version of HttpTransport which fetches pages without
+    blocking the event loop. Keeps a pool of keep-alive connections per
+    (scheme, host, port) and must only be used from one event loop.
+    """
+
+    user_agent = HttpTransport.user_agent
+    chunk_size = HttpTransport.chunk_size
+    max_redirects = HttpTransport.max_redirects
+
+    def __init__(self, timeout=30, max_idle_per_host=8):
+        self.timeout = timeout
+        self.max_idle_per_host = max_idle_per_host
+        self._idle = {}
+
+    async def _connect(self, key):
+        scheme, host, port = key
+        ssl_context = None
+        if scheme == 'https':
+            ssl_context = ssl.create_default_context()
+
+        return await asyncio.wait_for(
+                asyncio.open_connection(host, port, ssl=ssl_context),
+                self.timeout)
+
+    def _release(self, key, conn):
+        idle = self._idle.setdefault(key, [])
+        if len(idle) < self.max_idle_per_host:
+            idle.append(conn)
+        else:
+            conn[1].close()
+
+    async def close(self):
+        idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for _, writer in conns:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except (ConnectionError, ssl.SSLError):
+                    pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def _read_headers(self, reader):
+        lines = []
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            lines.append(line)
+
+        parser = email.parser.BytesParser(_class=http.client.HTTPMessage)
+        return parser.parsebytes(b''.join(lines))
+
+    async def _read_body(self, reader, headers):
+        decompressor = _get_decompressor(headers.get('Content-Encoding'))
+        chunks = []
+
+        def add(chunk):
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            chunks.append(chunk)
+
+        will_close = False
+        length = headers.get('Content-Length')
+        if 'chunked' in (headers.get('Transfer-Encoding') or '').lower():
+            while True:
+                size_line = await reader.readline()
+                size = int(size_line.split(b';')[0].strip(), 16)
+                if size == 0:
+                    # NOTE(steve): skip any trailers
+                    await self._read_headers(reader)
+                    break
+                add(await reader.readexactly(size))
+                await reader.readexactly(2)
+        elif length is not None:
+            remaining = int(length)
+            while remaining > 0:
+                chunk = await reader.readexactly(min(self.chunk_size,
+                                                     remaining))
+                add(chunk)
+                remaining -= len(chunk)
+        else:
+            # NOTE(steve): without a length the body ends when the server
+            # closes the connection
+            will_close = True
+            while True:
+                chunk = await reader.read(self.chunk_size)
+                if not chunk:
+                    break
+                add(chunk)
+
+        if decompressor is not None:
+            chunks.append(decompressor.flush())
+
+        return b''.join(chunks), will_close
+
+    async def _exchange(self, conn, request):
+        reader, writer = conn
+        writer.write(request)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('Connection closed by server')
+        version, status, *reason = status_line.decode(
+                'iso-8859-1').rstrip('\r\n').split(' ', 2)
+        status = int(status)
+        reason = reason[0] if reason else ''
+
+        headers = await self._read_headers(reader)
+        if 100 <= status < 200 or status in (204, 304):
+            body, will_close = b'', False
+        else:
+            body, will_close = await self._read_body(reader, headers)
+
+        connection = (headers.get('Connection') or '').lower()
+        will_close = (will_close or connection == 'close' or
+                      version == 'HTTP/1.0')
+        return _AsyncResponse(status, reason, headers, body, will_close)
+
+    async def _request(self, url):
+        parts = urlsplit(url)
+        scheme = parts.scheme or 'http'
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        request = (f'GET {path} HTTP/1.1\r\n'
+                   f'Host: {parts.netloc}\r\n'
+                   f'User-Agent: {self.user_agent}\r\n'
+                   f'Accept-Encoding: gzip, deflate\r\n'
+                   f'Connection: keep-alive\r\n\r\n').encode('ascii')
+
+        # NOTE(steve): like HttpTransport a reused connection may have been
+        # closed by the server so the request is retried once on a new one
+        idle = self._idle.get(key)
+        conn, reused = (idle.pop(), True) if idle else (None, False)
+        while True:
+            if conn is None:
+                conn = await self._connect(key)
+            try:
+                response = await asyncio.wait_for(
+                        self._exchange(conn, request), self.timeout)
+                break
+            except (ConnectionError, asyncio.IncompleteReadError):
+                conn[1].close()
+                if not reused:
+                    raise
+                conn, reused = None, False
+            except BaseException:
+                conn[1].close()
+                raise
+
+        if response.will_close:
+            conn[1].close()
+        else:
+            self._release(key, conn)
+
+        return response
+
+    async def get(self, url):
+        """Returns the decoded body of the page at url."""
+        for _ in range(self.max_redirects + 1):
+            response = await self._request(url)
+            location = response.getheader('Location')
+            if response.status in (301, 302, 303, 307, 308) and location:
+                url = urljoin(url, location)
+                continue
+
+            if response.status != 200:
+                raise HttpError(url, response.status, response.reason,
+                                _parse_retry_after(response))
+
+            charset = response.headers.get_content_charset() or 'utf-8'
+            return response.body.decode(charset)
+
+        raise HttpError(url, response.status, 'Too many redirects')
+
+class PageStore:
+    """
+    Content addressed store of fetched web pages on disk.
+
+    Each page is saved gzipped under the sha256 of its content so the
+    same page fetched from several urls or on several days is only kept
+    once. Urls point to the latest content recorded for them.
+
+    Layout:
+        <directory>/pages/<sha256>.html.gz
+        <directory>/urls/<sha256 of url>
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._pages_dir = os.path.join(directory, 'pages')
+        self._urls_dir = os.path.join(directory, 'urls')
+        os.makedirs(self._pages_dir, exist_ok=True)
+        os.makedirs(self._urls_dir, exist_ok=True)
+
+    def _url_path(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self._urls_dir, key)
+
+    def _page_path(self, digest):
+        return os.path.join(self._pages_dir, digest + '.html.gz')
+
+    # NOTE(steve): files are written to a temp file and then moved into
+    # place so a crash part way through a write never leaves a partial
+    # page behind to be replayed
+    @staticmethod
+    def _write_file(path, data):
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def put(self, url, page):
+        """Saves page for url and returns the page's content digest."""
+        data = page.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        page_path = self._page_path(digest)
+        if not os.path.exists(page_path):
+            PageStore._write_file(page_path, gzip.compress(data))
+        PageStore._write_file(self._url_path(url), digest.encode('ascii'))
+
+        return digest
+
+    def get_digest(self, url):
+        """Returns the content digest recorded for url or None."""
+        try:
+            with open(self._url_path(url), 'rb') as f:
+                return f.read().decode('ascii')
+        except FileNotFoundError:
+            return None
+
+    def get(self, url):
+        """Returns the page recorded for url or None."""
+        digest = self.get_digest(url)
+        if digest is None:
+            return None
+
+        with open(self._page_path(digest), 'rb') as f:
+            return gzip.decompress(f.read()).decode('utf-8')
+
+    def __contains__(self, url):
+        return os.path.exists(self._url_path(url))
+
+class RecordTransport:
+    """Fetches pages with another transport and records them in a store."""
+
+    def __init__(self, store, transport=None):
+        if transport is None:
+            transport = HttpTransport()
+        self.store = store
+        self.transport = transport
+
+    def get(self, url):
+        page = self.transport.get(url)
+        self.store.put(url, page)
+        return page
+
+class ReplayTransport:
+    """
+    Returns pages recorded in a store without going to the network.
+
+    If a transport is given pages missing from the store are fetched and
+    recorded, otherwise PageNotRecordedError is raised. This lets an
+    interrupted update be rerun without fetching the pages it already got.
+    """
+
+    def __init__(self, store, transport=None):
+        self.store = store
+        self.transport = transport
+
+    def get(self, url):
+        page = self.store.get(url)
+        if page is not None:
+            return page
+
+        if self.transport is None:
+            raise PageNotRecordedError(url)
+
+        page = self.transport.get(url)
+        self.store.put(url, page)
+        return page
+
+def _get_decompressor(encoding):
+    encoding = (encoding or '').lower()
+    if encoding in ('gzip', 'x-gzip'):
+        # NOTE(steve): 16 + MAX_WBITS tells zlib to expect a gzip header
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        return zlib.decompressobj()
+    return None
+
+# NOTE(steve): Retry-After can also be a http date but we only handle
+# the number of seconds which is what servers send when throttling
+def _parse_retry_after(response):
+    try:
+        return float(response.getheader('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+class HttpError(Exception):
+
+    def __init__(self, url, status, reason, retry_after=None):
+        super().__init__(f'{status} {reason}: {url}')
+        self.url = url
+        self.status = status
+        self.retry_after = retry_after
+
+class PageNotRecordedError(Exception):
+    pass
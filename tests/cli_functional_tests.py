@@ -21,7 +21,8 @@ import market_data.tests.utils as test_utils
 
 @parameterized_class(('data_adapter_source', ),[
     [data_adapter.DataAdapterSource.JSON, ],
-    [data_adapter.DataAdapterSource.SQLITE3, ]
+    [data_adapter.DataAdapterSource.SQLITE3, ],
+    [data_adapter.DataAdapterSource.COLUMNAR, ]
 ])
 class CommandLineInterfaceTests(unittest.TestCase):
 
@@ -10,10 +10,15 @@ import unittest
 from unittest import skip
 from unittest.mock import patch, Mock
 import datetime
+import shutil
+import tempfile
 
 from parameterized import parameterized_class
+from freezegun import freeze_time
 
 from market_data.market_data import MarketData
+from market_data.scraper import Scraper
+from market_data.transport import PageStore, ReplayTransport
 from market_data.data import EquityData
 from market_data.data import InvalidTickerError, InvalidDateError
 import market_data.data_adapter as data_adapter
@@ -21,7 +26,8 @@ import market_data.tests.utils as test_utils
 
 @parameterized_class(('data_adapter_source', ),[
     [data_adapter.DataAdapterSource.JSON, ],
-    [data_adapter.DataAdapterSource.SQLITE3, ]
+    [data_adapter.DataAdapterSource.SQLITE3, ],
+    [data_adapter.DataAdapterSource.COLUMNAR, ]
 ])
 class FunctionalTests(unittest.TestCase):
 
@@ -182,5 +188,69 @@ class FunctionalTests(unittest.TestCase):
         # confirm that the security price is indeed correct.
         self.assertEqual(data, expected_data)
 
+@parameterized_class(('data_adapter_source', ),[
+    [data_adapter.DataAdapterSource.JSON, ],
+    [data_adapter.DataAdapterSource.SQLITE3, ],
+    [data_adapter.DataAdapterSource.COLUMNAR, ]
+])
+class ReplayFunctionalTests(unittest.TestCase):
+
+    def setUp(self):
+        self.test_data = test_utils.load_test_data()
+        self.da = data_adapter.get_adapter(self.data_adapter_source)
+        self.database = MarketData.Database(self.da.test_database,
+                                            self.data_adapter_source)
+        self.da.create_test_database()
+
+        # NOTE(steve): the recorded AMZN history page is put in a page
+        # store so the whole update runs without the network
+        self.store_dir = tempfile.mkdtemp()
+        store = PageStore(self.store_dir)
+        with open('market_data/tests/amzn_scrape_test_data.html', 'r') as f:
+            store.put(Scraper('yahoo')._get_url('AMZN'), f.read())
+        self.transport = ReplayTransport(store)
+
+    def tearDown(self):
+        shutil.rmtree(self.store_dir, ignore_errors=True)
+        try:
+            self.da.delete_test_database()
+        except:
+            pass
+
+    @freeze_time('2019-08-27')
+    def test_update_from_recorded_pages(self):
+        # Carol is on a plane without internet but has the pages
+        # she fetched before she left. She adds AMZN and GOOG to the
+        # app and updates all her securities from the recorded pages.
+        app = MarketData()
+        app.run(database=self.database, transport=self.transport)
+        for ticker in ('AMZN', 'GOOG'):
+            app.add_security(ticker)
+
+        results = app.update_all()
+
+        # AMZN was recorded so it updates but GOOG wasn't
+        dt = datetime.datetime(2019, 8, 27)
+        self.assertEqual(results['AMZN'].dates, [dt.date()])
+        self.assertEqual(results['AMZN'].errors, [])
+        self.assertEqual(results['GOOG'].dates, [])
+        self.assertEqual(len(results['GOOG'].errors), 1)
+
+        # She then backfills the rest of the week for AMZN
+        dates = [datetime.datetime(2019, 8, 23),
+                 datetime.datetime(2019, 8, 26)]
+        errors = app.bulk_update_market_data('AMZN', dates)
+        self.assertEqual(errors, [])
+        app.close()
+
+        # Josh checks the prices against his trusty source
+        app = MarketData()
+        app.run(database=self.database, transport=self.transport)
+        for dt in dates + [dt]:
+            expected_data = test_utils.get_test_data(self.test_data, 'AMZN',
+                                                     dt)
+            self.assertEqual(app.get_equity_data('AMZN', dt), expected_data)
+        app.close()
+
 if __name__ == '__main__':
     unittest.main()
@@ -57,7 +57,8 @@ def common_teardown(obj):
 
 @parameterized_class(('data_adapter_source', ),[
     [data_adapter.DataAdapterSource.JSON, ],
-    [data_adapter.DataAdapterSource.SQLITE3, ]
+    [data_adapter.DataAdapterSource.SQLITE3, ],
+    [data_adapter.DataAdapterSource.COLUMNAR, ]
 ])
 class AppMainMenuTests(unittest.TestCase):
 
@@ -139,7 +140,8 @@ class AppMainMenuTests(unittest.TestCase):
 
 @parameterized_class(('data_adapter_source', ),[
     [data_adapter.DataAdapterSource.JSON, ],
-    [data_adapter.DataAdapterSource.SQLITE3, ]
+    [data_adapter.DataAdapterSource.SQLITE3, ],
+    [data_adapter.DataAdapterSource.COLUMNAR, ]
 ])
 class AppUpdateMarketDataTests(unittest.TestCase):
     def setUp(self):
@@ -370,7 +372,8 @@ class AppUpdateMarketDataTests(unittest.TestCase):
 
 @parameterized_class(('data_adapter_source', ),[
     [data_adapter.DataAdapterSource.JSON, ],
-    [data_adapter.DataAdapterSource.SQLITE3, ]
+    [data_adapter.DataAdapterSource.SQLITE3, ],
+    [data_adapter.DataAdapterSource.COLUMNAR, ]
 ])
 class AppViewSecuritiesTests(unittest.TestCase):
     def setUp(self):
@@ -476,7 +479,8 @@ class AppViewSecuritiesTests(unittest.TestCase):
 
 @parameterized_class(('data_adapter_source', ),[
     [data_adapter.DataAdapterSource.JSON, ],
-    [data_adapter.DataAdapterSource.SQLITE3, ]
+    [data_adapter.DataAdapterSource.SQLITE3, ],
+    [data_adapter.DataAdapterSource.COLUMNAR, ]
 ])
 class AppDatabaseTests(unittest.TestCase):
 